@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for Trakt Agent.
+
+Synthetic datasets, micro-benchmarks of the hot paths and full pipeline
+runs against local stand-ins, so scaling can be measured without Trakt,
+Simkl or a running LLM.
+"""
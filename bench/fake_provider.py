@@ -0,0 +1,466 @@
+"""
+Fake Provider Server
+
+A local stand-in for the Trakt and Simkl APIs, serving generated data from
+bench.synthetic so the fetch, sync and mark paths can be load- and
+latency-tested with no network. Trakt lives under /trakt and Simkl under
+/simkl on the same port; point the agent at it with the base URL overrides:
+
+    python -m bench.fake_provider --latency 0.05 --error-5xx 0.02
+    TRAKT_BASE_URL=http://127.0.0.1:8775/trakt python cli.py fetch
+
+Which provider a command fetches from is SERVICE_PROVIDER in config.py, or
+per user the "provider" of a users.json entry, e.g. for Simkl:
+
+    echo '[{"name": "bench", "provider": "simkl"}]' > users.json
+    SIMKL_BASE_URL=http://127.0.0.1:8775/simkl python cli.py batch users.json --stages fetch
+
+The default port (DEFAULT_PORT) differs from config.SERVICE_PORT, so the
+stand-in can run next to 'cli.py serve'.
+
+Served endpoints (same shapes as the real APIs, trimmed to the fields the
+agent reads):
+
+    Trakt  GET  /sync/history[/movies|/shows]  (paginated, start_at/end_at)
+           POST /sync/history
+           GET  /sync/last_activities
+           GET  /{movies|shows}/{trending|popular}  (paginated)
+           GET  /search/{movie|show}?query=
+           GET  /{movies|shows}/{id}
+    Simkl  GET  /sync/all-items[/{type}[/{status}]]
+           GET  /sync/activities
+           POST /sync/history
+           GET  /{movies|tv}/trending[/{interval}]
+           GET  /search/{movie|tv}?q=
+           GET  /{movies|tv}/{id}
+
+Faults are injected in this order: rate limit (token bucket, 429 with
+Retry-After), random 429s, random 5xx. Every response, faulty or not, is
+delayed by ``latency`` plus up to ``jitter`` seconds. GET /_stats returns
+request counts and is never delayed or faulted.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import configure_logging, logger
+from bench.synthetic import make_catalog, make_history
+
+DEFAULT_PORT = 8775  # Not config.SERVICE_PORT, so both can run at once
+
+# (status, JSON body, extra headers)
+Response = Tuple[int, Any, Dict[str, str]]
+
+
+class FakeProviderConfig(NamedTuple):
+    history_size: int = 1000
+    catalog_size: int = 500
+    seed: int = 0
+    latency: float = 0.0  # Seconds added to every response
+    jitter: float = 0.0  # Extra uniform random delay, 0..jitter seconds
+    rate_limit: float = 0.0  # Sustained requests per second (0 = unlimited)
+    burst: int = 10  # Requests allowed back to back before the rate limit applies
+    error_429: float = 0.0  # Probability of a spurious 429
+    error_5xx: float = 0.0  # Probability of a 500/502/503
+    max_limit: int = 1000  # Largest page size honoured (?limit=)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``take`` returns the seconds to wait, 0 if allowed."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+def _iso(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(ts))
+
+
+def _int_arg(query: Dict[str, List[str]], name: str, default: int) -> int:
+    try:
+        return int(query.get(name, [default])[0])
+    except ValueError:
+        return default
+
+
+class FakeProvider:
+    """Generated Trakt/Simkl state plus the route table; shared by all handler threads."""
+
+    def __init__(self, config: FakeProviderConfig = FakeProviderConfig()) -> None:
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._bucket = TokenBucket(config.rate_limit, config.burst) if config.rate_limit > 0 else None
+        self.requests: Counter = Counter()
+        self.statuses: Counter = Counter()
+
+        self.catalog = make_catalog(config.catalog_size, seed=config.seed)
+        self.history = make_history(config.history_size, seed=config.seed, catalog_size=config.catalog_size)
+        # Every known title by (kind, trakt id); the Simkl side reuses the Trakt id as its own
+        self.media: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        for item in self.catalog + self.history:
+            for kind in ("movie", "show"):
+                if kind in item:
+                    self.media.setdefault((kind, item[kind]["ids"]["trakt"]), item[kind])
+        self.activity = time.time()
+        self._next_event = len(self.history) + 1
+
+        # (method, name for /_stats, path pattern, handler)
+        self.routes: List[Tuple[str, str, "re.Pattern[str]", Callable[..., Response]]] = [
+            ("GET", "trakt history", re.compile(r"/trakt/sync/history(?:/(movies|shows))?"), self._trakt_history),
+            ("POST", "trakt add history", re.compile(r"/trakt/sync/history"), self._trakt_add_history),
+            ("GET", "trakt last activities", re.compile(r"/trakt/sync/last_activities"), self._trakt_last_activities),
+            ("GET", "trakt lists", re.compile(r"/trakt/(movies|shows)/(trending|popular)"), self._trakt_list),
+            ("GET", "trakt search", re.compile(r"/trakt/search/(movie|show)"), self._trakt_search),
+            ("GET", "trakt details", re.compile(r"/trakt/(movies|shows)/(\d+)"), self._trakt_details),
+            ("GET", "simkl all items", re.compile(r"/simkl/sync/all-items(?:/(movies|shows|anime))?(?:/(\w+))?"),
+             self._simkl_all_items),
+            ("GET", "simkl activities", re.compile(r"/simkl/sync/activities"), self._simkl_activities),
+            ("POST", "simkl add history", re.compile(r"/simkl/sync/history"), self._simkl_add_history),
+            ("GET", "simkl trending", re.compile(r"/simkl/(movies|tv)/trending(?:/\w+)?"), self._simkl_trending),
+            ("GET", "simkl search", re.compile(r"/simkl/search/(movie|tv)"), self._simkl_search),
+            ("GET", "simkl details", re.compile(r"/simkl/(movies|tv)/(\d+)"), self._simkl_details),
+        ]
+
+    # --------------------------------------------------------------------------
+    # Request handling
+    # --------------------------------------------------------------------------
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Response:
+        """Routes one request through fault injection; the caller applies the delay."""
+        for route_method, name, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                break
+        else:
+            name, handler, match = "unknown", None, None
+        with self._lock:
+            self.requests[f"{method} {name}"] += 1
+
+        response = self._fault() or (
+            handler(match, query, body) if handler else (404, {"error": f"Unknown endpoint {path}"}, {})
+        )
+        with self._lock:
+            self.statuses[response[0]] += 1
+        return response
+
+    def _fault(self) -> Optional[Response]:
+        if self._bucket is not None:
+            wait = self._bucket.take()
+            if wait > 0:
+                retry = max(1, math.ceil(wait))
+                limit = json.dumps({"name": "API_LIMIT", "period": 1, "limit": self.config.rate_limit,
+                                    "remaining": 0, "until": _iso(time.time() + retry)})
+                return 429, {"error": "rate limit exceeded"}, {"Retry-After": str(retry), "X-Ratelimit": limit}
+        with self._lock:
+            roll = self._rng.random()
+            status = self._rng.choice((500, 502, 503))
+        if roll < self.config.error_429:
+            return 429, {"error": "injected rate limit"}, {"Retry-After": "1"}
+        if roll < self.config.error_429 + self.config.error_5xx:
+            return status, {"error": "injected server error"}, {}
+        return None
+
+    def delay(self) -> float:
+        """Seconds to hold the next response."""
+        if not self.config.jitter:
+            return self.config.latency
+        with self._lock:
+            return self.config.latency + self._rng.uniform(0, self.config.jitter)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "statuses": {str(k): v for k, v in self.statuses.items()},
+                "total": sum(self.requests.values()),
+                "history_items": len(self.history),
+            }
+
+    def _paginate(self, items: List[Any], query: Dict[str, List[str]], default_limit: int) -> Response:
+        limit = max(1, min(_int_arg(query, "limit", default_limit), self.config.max_limit))
+        page = max(1, _int_arg(query, "page", 1))
+        pages = max(1, math.ceil(len(items) / limit))
+        headers = {
+            "X-Pagination-Page": str(page),
+            "X-Pagination-Limit": str(limit),
+            "X-Pagination-Page-Count": str(pages),
+            "X-Pagination-Item-Count": str(len(items)),
+        }
+        return 200, items[(page - 1) * limit:page * limit], headers
+
+    def _record_watches(self, body: Any) -> Tuple[int, int, List[Any]]:
+        """Prepends watch events for the posted items; returns (movies, shows, not found)."""
+        movies = shows = 0
+        missing: List[Any] = []
+        now = time.time()
+        with self._lock:
+            for key, kind in (("movies", "movie"), ("shows", "show")):
+                for entry in (body or {}).get(key, []):
+                    ids = entry.get("ids") or {}
+                    media = self.media.get((kind, ids.get("trakt") or ids.get("simkl")))
+                    if media is None:
+                        missing.append(entry)
+                        continue
+                    event: Dict[str, Any] = {"id": self._next_event, "watched_at": _iso(now),
+                                             "action": "watch", "type": kind if kind == "movie" else "episode",
+                                             kind: media}
+                    if kind == "show":
+                        event["episode"] = {"season": 1, "number": 1, "title": "Episode 1",
+                                            "runtime": media.get("runtime")}
+                        shows += 1
+                    else:
+                        movies += 1
+                    self._next_event += 1
+                    self.history.insert(0, event)
+            if movies or shows:
+                self.activity = now
+        return movies, shows, missing
+
+    def _search(self, kind: str, text: str) -> List[Dict[str, Any]]:
+        needle = text.lower().strip()
+        if not needle:
+            return []
+        return [media for (k, _), media in self.media.items() if k == kind and needle in media["title"].lower()]
+
+    # --------------------------------------------------------------------------
+    # Trakt
+    # --------------------------------------------------------------------------
+
+    def _trakt_history(self, match, query, body) -> Response:
+        with self._lock:
+            events = list(self.history)
+        if match.group(1):
+            kind = "movie" if match.group(1) == "movies" else "episode"
+            events = [e for e in events if e["type"] == kind]
+        start_at, end_at = query.get("start_at", [""])[0], query.get("end_at", [""])[0]
+        if start_at:
+            events = [e for e in events if e["watched_at"] >= start_at]
+        if end_at:
+            events = [e for e in events if e["watched_at"] <= end_at]
+        return self._paginate(events, query, 10)
+
+    def _trakt_add_history(self, match, query, body) -> Response:
+        movies, shows, missing = self._record_watches(body)
+        return 201, {"added": {"movies": movies, "episodes": shows},
+                     "not_found": {"movies": missing, "shows": []}}, {}
+
+    def _trakt_last_activities(self, match, query, body) -> Response:
+        with self._lock:
+            stamp = _iso(self.activity)
+        return 200, {"all": stamp, "movies": {"watched_at": stamp}, "episodes": {"watched_at": stamp},
+                     "shows": {"watched_at": stamp}}, {}
+
+    def _trakt_list(self, match, query, body) -> Response:
+        kind = "movie" if match.group(1) == "movies" else "show"
+        items = [item for item in self.catalog if kind in item]
+        if match.group(2) == "trending":
+            items = sorted(items, key=lambda item: -item["watchers"])
+        else:
+            # /popular returns bare media objects, not {"watchers", "movie"} wrappers
+            items = [item[kind] for item in sorted(items, key=lambda item: item[kind]["ids"]["trakt"])]
+        return self._paginate(items, query, 10)
+
+    def _trakt_search(self, match, query, body) -> Response:
+        kind = match.group(1)
+        found = self._search(kind, query.get("query", [""])[0])
+        results = [{"type": kind, "score": 100.0, kind: media} for media in found]
+        return self._paginate(results, query, 10)
+
+    def _trakt_details(self, match, query, body) -> Response:
+        kind = "movie" if match.group(1) == "movies" else "show"
+        media = self.media.get((kind, int(match.group(2))))
+        if media is None:
+            return 404, {"error": "not found"}, {}
+        return 200, media, {}
+
+    # --------------------------------------------------------------------------
+    # Simkl
+    # --------------------------------------------------------------------------
+
+    @staticmethod
+    def _simkl_media(media: Dict[str, Any]) -> Dict[str, Any]:
+        ids = media["ids"]
+        return {"title": media["title"], "year": media.get("year"),
+                "ids": {"simkl": ids["trakt"], "imdb": ids.get("imdb"), "tmdb": ids.get("tmdb")}}
+
+    def _simkl_all_items(self, match, query, body) -> Response:
+        wanted = match.group(1)
+        with self._lock:
+            events = list(self.history)
+        movies: Dict[int, Dict[str, Any]] = {}
+        shows: Dict[int, Dict[str, Any]] = {}
+        for event in events:
+            kind = "movie" if "movie" in event else "show"
+            bucket = movies if kind == "movie" else shows
+            media = event[kind]
+            entry = bucket.get(media["ids"]["trakt"])
+            if entry is None:
+                entry = bucket[media["ids"]["trakt"]] = {
+                    "last_watched_at": event["watched_at"], "status": "completed",
+                    kind: self._simkl_media(media),
+                }
+                if kind == "show":
+                    entry["watched_episodes_count"] = 0
+            if kind == "show":
+                entry["watched_episodes_count"] += 1
+        data: Dict[str, Any] = {}
+        if wanted in (None, "movies"):
+            data["movies"] = list(movies.values())
+        if wanted in (None, "shows"):
+            data["shows"] = list(shows.values())
+        return 200, data, {}
+
+    def _simkl_activities(self, match, query, body) -> Response:
+        with self._lock:
+            stamp = _iso(self.activity)
+        return 200, {"all": stamp, "movies": {"all": stamp, "completed": stamp},
+                     "tv_shows": {"all": stamp, "completed": stamp}}, {}
+
+    def _simkl_add_history(self, match, query, body) -> Response:
+        movies, shows, missing = self._record_watches(body)
+        return 201, {"added": {"movies": movies, "shows": shows, "episodes": 0},
+                     "not_found": {"movies": missing, "shows": []}}, {}
+
+    def _simkl_trending(self, match, query, body) -> Response:
+        kind = "movie" if match.group(1) == "movies" else "show"
+        items = sorted((item for item in self.catalog if kind in item), key=lambda item: -item["watchers"])
+        limit = max(1, min(_int_arg(query, "limit", 50), self.config.max_limit))
+        trending = [{"title": item[kind]["title"], "ids": {"simkl_id": item[kind]["ids"]["trakt"]}}
+                    for item in items[:limit]]
+        return 200, trending, {}
+
+    def _simkl_search(self, match, query, body) -> Response:
+        kind = "movie" if match.group(1) == "movie" else "show"
+        found = [self._simkl_media(m) for m in self._search(kind, query.get("q", [""])[0])]
+        return 200, found[:max(1, _int_arg(query, "limit", 10))], {}
+
+    def _simkl_details(self, match, query, body) -> Response:
+        kind = "movie" if match.group(1) == "movies" else "show"
+        media = self.media.get((kind, int(match.group(2))))
+        if media is None:
+            return 404, {"error": "not found"}, {}
+        return 200, self._simkl_media(media), {}
+
+
+def make_handler(provider: FakeProvider):
+    """Builds the request handler class bound to ``provider``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections as with the real APIs
+
+        def _send(self, status: int, body: Any, headers: Dict[str, str]) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _handle(self) -> None:
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if url.path == "/_stats":
+                self._send(200, provider.stats(), {})
+                return
+            try:
+                body = json.loads(raw) if raw else None
+            except ValueError:
+                self._send(400, {"error": "invalid JSON body"}, {})
+                return
+            delay = provider.delay()
+            if delay > 0:
+                time.sleep(delay)
+            self._send(*provider.handle(self.command, url.path.rstrip("/") or "/", parse_qs(url.query), body))
+
+        do_GET = _handle
+        do_POST = _handle
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(f"{self.address_string()} - {format % args}")
+
+    return Handler
+
+
+def start(config: FakeProviderConfig = FakeProviderConfig(), host: str = "127.0.0.1",
+          port: int = 0) -> Tuple[ThreadingHTTPServer, FakeProvider, str]:
+    """
+    Serves a fake provider on a background thread.
+
+    Returns:
+        (server, provider, base URL). Trakt is at ``<url>/trakt``, Simkl at
+        ``<url>/simkl``; stop with ``server.shutdown()``.
+    """
+    provider = FakeProvider(config)
+    server = ThreadingHTTPServer((host, port), make_handler(provider))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-provider", daemon=True).start()
+    return server, provider, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    defaults = FakeProviderConfig()
+    parser = argparse.ArgumentParser(description="Local Trakt/Simkl API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--history", type=int, default=defaults.history_size, help="Generated watch events")
+    parser.add_argument("--catalog", type=int, default=defaults.catalog_size, help="Generated trending/popular titles")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay, 0..N seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests per second (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=defaults.burst, help="Requests allowed back to back")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Probability of a spurious 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Probability of a 5xx response")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    configure_logging(level=10 if args.verbose else 20)
+    config = FakeProviderConfig(
+        history_size=args.history, catalog_size=args.catalog, seed=args.seed,
+        latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, burst=args.burst,
+        error_429=args.error_429, error_5xx=args.error_5xx,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeProvider(config)))
+    base = f"http://{args.host}:{server.server_address[1]}"
+    logger.info(f"Fake provider on {base} (TRAKT_BASE_URL={base}/trakt, SIMKL_BASE_URL={base}/simkl)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+LLM Benchmark
+
+Sends the agent's real recommend and profile prompts to an OpenAI-compatible
+server (API_BASE_URL / MODEL_NAME by default) at increasing concurrency and
+measures prompt processing speed, time to first token, decode tokens/s and
+latency percentiles. From those it suggests LLM_PARALLEL_SLOTS,
+CANDIDATE_LIMIT and which models fit the latency budget.
+
+The prompts come from the same code the agent runs
+(``profile_taste.analyze_taste`` and ``recommend.generate_recommendations``)
+on synthetic data, captured through a recording gateway, so the numbers
+follow prompt changes. Three workloads are measured:
+
+    summary     one map-reduce chunk prompt of a long history
+    profile     the full taste analysis prompt
+    recommend   the recommendation prompt at CANDIDATE_LIMIT candidates
+
+Every request starts with a unique tag so the server's prefix cache cannot
+skip prompt processing.
+
+Usage:
+    python -m bench.llm_bench                                   # configured server and model
+    python -m bench.llm_bench --models qwen/qwen3-4b-2507,Qwen/Qwen2.5-14B-Instruct-GGUF
+    python -m bench.llm_bench --concurrency 1,2,4,8 --requests 8
+    python -m bench.llm_bench --candidate-limits 25,50,100 --context 4096
+    python -m bench.llm_bench --mock                            # dry run against bench.mock_llm
+"""
+import argparse
+import json
+import math
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import API_BASE_URL, CANDIDATE_LIMIT, LLM_TIMEOUT, MODEL_NAME, TEMPERATURE, configure_logging
+from bench.suite import RESULTS_DIR, StubGateway
+from bench.synthetic import make_catalog, make_history
+
+DEFAULT_CONCURRENCY = (1, 2, 4, 8)
+DEFAULT_CANDIDATE_LIMITS = (25, 50, 100)
+DEFAULT_CONTEXT = 4096  # Context window the model is loaded with
+DEFAULT_LATENCY_BUDGET = 120.0  # Seconds a single recommend/profile call may take at p95
+WORKLOADS = ("summary", "profile", "recommend")
+SLOT_EFFICIENCY = 0.9  # Fewer slots are enough once they reach this share of the best throughput
+
+
+class Sample(NamedTuple):
+    """One timed request."""
+    ttft: Optional[float]  # seconds to the first content token
+    latency: float
+    prompt_tokens: int
+    completion_tokens: int
+    error: Optional[str] = None
+
+    @property
+    def decode_tps(self) -> Optional[float]:
+        decode = self.latency - (self.ttft or 0.0)
+        if self.ttft is None or decode <= 0 or self.completion_tokens < 2:
+            return None
+        return (self.completion_tokens - 1) / decode
+
+
+class LevelResult(NamedTuple):
+    """Aggregates of one workload at one concurrency level."""
+    model: str
+    workload: str
+    concurrency: int
+    requests: int
+    errors: int
+    wall: float
+    prompt_tokens: int  # median
+    completion_tokens: int  # median
+    ttft_p50: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    prompt_tps: float  # median prompt tokens / time to first token
+    decode_tps: float  # median per-request decode speed
+    throughput: float  # completion tokens per second across all requests
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+
+class RecordingGateway(StubGateway):
+    """StubGateway that keeps every prompt it is sent."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.prompts: List[str] = []
+
+    def complete(self, prompt: str, **kwargs: Any) -> str:
+        self.prompts.append(prompt)
+        return super().complete(prompt, **kwargs)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100); 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def build_prompts(history_size: int = 2000, candidate_limits: Sequence[int] = (CANDIDATE_LIMIT,),
+                  seed: int = 0) -> Dict[str, str]:
+    """
+    The agent's prompts for a synthetic account.
+
+    Returns:
+        {"summary": ..., "profile": ..., "recommend[<limit>]": ... per limit}.
+        "summary" is missing when the history fits the profile prompt as is.
+    """
+    from core import profile_taste, recommend
+    from core.llm_gateway import set_gateway
+    from core.workspace import Workspace
+
+    prompts: Dict[str, str] = {}
+    recorder = RecordingGateway()
+    previous = set_gateway(recorder)
+    original_limit = recommend.CANDIDATE_LIMIT
+    try:
+        with tempfile.TemporaryDirectory(prefix="trakt-llm-bench-") as tmp:
+            ws = Workspace.for_user("bench", Path(tmp))
+            ws.ensure_dirs()
+            with open(ws.history_file, "w") as f:
+                json.dump(make_history(history_size, seed=seed), f)
+            profile_taste.analyze_taste(ws, full=True)
+            if len(recorder.prompts) > 1:
+                prompts["summary"] = recorder.prompts[0]
+            prompts["profile"] = recorder.prompts[-1]
+
+            profile = recommend.load_profile(ws, {})
+            catalog = make_catalog(max(candidate_limits), seed=seed)
+            candidates = [recommend.get_title_year(item) for item in catalog]
+            for limit in candidate_limits:
+                recommend.CANDIDATE_LIMIT = limit
+                recorder.prompts = []
+                recommend.generate_recommendations(profile, candidates, profile.get("genre_exclusions", []))
+                prompts[f"recommend[{limit}]"] = recorder.prompts[-1]
+    finally:
+        recommend.CANDIDATE_LIMIT = original_limit
+        set_gateway(previous)
+    return prompts
+
+
+def run_request(client: Any, model: str, prompt: str, max_tokens: Optional[int] = None,
+                timeout: float = LLM_TIMEOUT) -> Sample:
+    """Streams one completion of ``prompt`` (made unique first) and times it."""
+    tagged = f"[request {uuid.uuid4().hex[:12]}]\n{prompt}"
+    extra: Dict[str, Any] = {"max_tokens": max_tokens} if max_tokens else {}
+    start = time.perf_counter()
+    first: Optional[float] = None
+    chunks = 0
+    usage = None
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": tagged}],
+            temperature=TEMPERATURE,
+            timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True},
+            **extra
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first is None:
+                    first = time.perf_counter() - start
+                chunks += 1
+            usage = getattr(chunk, "usage", None) or usage
+    except Exception as e:
+        return Sample(first, time.perf_counter() - start, 0, chunks, f"{e.__class__.__name__}: {e}")
+    latency = time.perf_counter() - start
+    if usage is not None:
+        return Sample(first, latency, usage.prompt_tokens, usage.completion_tokens)
+    # Server without stream usage: ~4 characters per prompt token, one token per chunk
+    return Sample(first, latency, len(tagged) // 4, chunks)
+
+
+def run_level(client: Any, model: str, workload: str, prompt: str, concurrency: int,
+              requests: int, max_tokens: Optional[int] = None) -> LevelResult:
+    """Sends ``requests`` copies of ``prompt`` with ``concurrency`` in flight."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm-bench") as pool:
+        samples = list(pool.map(lambda _: run_request(client, model, prompt, max_tokens), range(requests)))
+    wall = time.perf_counter() - start
+
+    ok = [s for s in samples if s.error is None]
+    if len(ok) < len(samples):
+        print(f"    {len(samples) - len(ok)} failed, e.g. {next(s.error for s in samples if s.error)}", flush=True)
+    latencies = [s.latency for s in ok]
+    median = lambda values: statistics.median(values) if values else 0.0  # noqa: E731
+    return LevelResult(
+        model=model, workload=workload, concurrency=concurrency, requests=len(samples),
+        errors=len(samples) - len(ok), wall=wall,
+        prompt_tokens=int(median([s.prompt_tokens for s in ok])),
+        completion_tokens=int(median([s.completion_tokens for s in ok])),
+        ttft_p50=median([s.ttft for s in ok if s.ttft is not None]),
+        latency_p50=median(latencies),
+        latency_p95=percentile(latencies, 95),
+        latency_p99=percentile(latencies, 99),
+        prompt_tps=median([s.prompt_tokens / s.ttft for s in ok if s.ttft]),
+        decode_tps=median([s.decode_tps for s in ok if s.decode_tps is not None]),
+        throughput=sum(s.completion_tokens for s in ok) / wall if wall > 0 else 0.0,
+    )
+
+
+def format_row(r: LevelResult) -> str:
+    return (f"  {r.workload:<16} {r.concurrency:>3} {r.prompt_tokens:>7} {r.completion_tokens:>6} "
+            f"{r.prompt_tps:>8.0f} {r.ttft_p50:>7.2f}s {r.decode_tps:>7.1f} {r.throughput:>8.1f} "
+            f"{r.latency_p50:>7.2f}s {r.latency_p95:>7.2f}s {r.latency_p99:>7.2f}s {r.errors:>4}")
+
+
+TABLE_HEADER = (f"  {'Workload':<16} {'Conc':>3} {'Prompt':>7} {'Output':>6} {'PP t/s':>8} {'TTFT':>8} "
+                f"{'Dec t/s':>7} {'Agg t/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'Err':>4}")
+
+
+def suggest(results: Sequence[LevelResult], context: int = DEFAULT_CONTEXT,
+            latency_budget: float = DEFAULT_LATENCY_BUDGET) -> List[str]:
+    """
+    Settings suggested by the measurements, one line each.
+
+    - LLM_PARALLEL_SLOTS: the fewest concurrent requests reaching
+      SLOT_EFFICIENCY of the best aggregate throughput within the budget.
+    - CANDIDATE_LIMIT: the largest tested limit whose prompt plus output
+      fits ``context`` and whose p95 latency is within the budget.
+    - Model: the models whose recommend and profile calls stay within
+      the budget at one request in flight. Output quality is not measured.
+    """
+    lines: List[str] = []
+    models = list(dict.fromkeys(r.model for r in results))
+    fitting_models = []
+    for model in models:
+        rows = [r for r in results if r.model == model and r.errors < r.requests]
+        sweep = [r for r in rows if r.workload in WORKLOADS]
+        levels = sorted({r.concurrency for r in sweep})
+        # Aggregate throughput per level, summed over the workloads
+        throughput = {c: sum(r.throughput for r in sweep if r.concurrency == c) for c in levels}
+        within = [c for c in levels
+                  if all(r.latency_p95 <= latency_budget for r in sweep if r.concurrency == c)]
+        if throughput and within:
+            best = max(throughput[c] for c in within)
+            slots = min(c for c in within if throughput[c] >= SLOT_EFFICIENCY * best)
+            gain = throughput[slots] / throughput[levels[0]] if throughput[levels[0]] else 1.0
+            lines.append(f"{model}: LLM_PARALLEL_SLOTS = {slots} "
+                         f"({throughput[slots]:.1f} tok/s aggregate, {gain:.1f}x one request)")
+        elif throughput:
+            lines.append(f"{model}: no concurrency level kept p95 latency under {latency_budget:.0f}s; "
+                         f"use LLM_PARALLEL_SLOTS = 1 or a smaller model")
+
+        limit_rows = sorted((r for r in rows if r.workload.startswith("recommend[")),
+                            key=lambda r: int(r.workload[len("recommend["):-1]))
+        fits = [r for r in limit_rows
+                if r.prompt_tokens + r.completion_tokens <= context and r.latency_p95 <= latency_budget]
+        if fits:
+            best_limit = fits[-1]
+            lines.append(f"{model}: CANDIDATE_LIMIT = {best_limit.workload[len('recommend['):-1]} "
+                         f"({best_limit.prompt_tokens + best_limit.completion_tokens} of {context} context tokens, "
+                         f"p95 {best_limit.latency_p95:.1f}s)")
+        elif limit_rows:
+            lines.append(f"{model}: no tested CANDIDATE_LIMIT fits {context} context tokens within "
+                         f"{latency_budget:.0f}s; try a smaller limit or a larger context")
+
+        single = [r for r in sweep if r.concurrency == 1 and r.workload in ("profile", "recommend")]
+        if single and all(r.latency_p95 <= latency_budget for r in single):
+            fitting_models.append((max(r.latency_p95 for r in single), model))
+
+    if len(models) > 1:
+        if fitting_models:
+            fitting_models.sort()
+            names = ", ".join(f"{m} (p95 {t:.1f}s)" for t, m in fitting_models)
+            lines.append(f"Within the {latency_budget:.0f}s budget: {names}. Prefer the largest of these "
+                         f"whose recommendations read best; quality is not measured here.")
+        else:
+            lines.append(f"No model kept recommend and profile under {latency_budget:.0f}s at p95")
+    return lines
+
+
+def benchmark_model(base_url: str, model: str, prompts: Dict[str, str], concurrency: Sequence[int],
+                    requests: int, workloads: Sequence[str], max_tokens: Optional[int] = None) -> List[LevelResult]:
+    """Candidate-limit sweep at one request in flight, then every workload at every concurrency level."""
+    from core.llm_gateway import LLMGateway
+
+    gateway = LLMGateway(base_url=base_url, model=model, max_retries=0)
+    results: List[LevelResult] = []
+    try:
+        gateway.warm_up(background=False)  # keep model load time out of the first TTFT
+        print(f"\n{model} @ {base_url}")
+        print(TABLE_HEADER)
+        for name in sorted((k for k in prompts if k.startswith("recommend[")),
+                           key=lambda k: int(k[len("recommend["):-1])):
+            result = run_level(gateway.client, model, name, prompts[name], 1, max(2, min(requests, 3)), max_tokens)
+            print(format_row(result), flush=True)
+            results.append(result)
+        for workload in workloads:
+            prompt = prompts.get(f"recommend[{CANDIDATE_LIMIT}]") if workload == "recommend" else prompts.get(workload)
+            if prompt is None:
+                continue  # no summary prompt when the history fits the profile prompt
+            for level in concurrency:
+                result = run_level(gateway.client, model, workload, prompt, level, max(requests, level), max_tokens)
+                print(format_row(result), flush=True)
+                results.append(result)
+    finally:
+        gateway.close()
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="LLM throughput and concurrency benchmark")
+    parser.add_argument("--base-url", default=API_BASE_URL, help="OpenAI-compatible server URL")
+    parser.add_argument("--models", default=MODEL_NAME, help="Comma-separated model ids to compare")
+    parser.add_argument("--concurrency", default=",".join(str(c) for c in DEFAULT_CONCURRENCY),
+                        help="Comma-separated requests in flight per level")
+    parser.add_argument("--requests", type=int, default=8, help="Requests per level (at least the concurrency)")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"Comma-separated ({', '.join(WORKLOADS)})")
+    parser.add_argument("--candidate-limits", default=",".join(str(c) for c in DEFAULT_CANDIDATE_LIMITS),
+                        help="CANDIDATE_LIMIT values to try for the recommend prompt")
+    parser.add_argument("--history", type=int, default=2000, help="Synthetic history size for the profile prompts")
+    parser.add_argument("--max-tokens", type=int, help="Cap output tokens per request (default: uncapped, as the agent)")
+    parser.add_argument("--context", type=int, default=DEFAULT_CONTEXT, help="Model context window in tokens")
+    parser.add_argument("--latency-budget", type=float, default=DEFAULT_LATENCY_BUDGET,
+                        help="Acceptable p95 seconds per recommend/profile call")
+    parser.add_argument("--mock", action="store_true", help="Benchmark an in-process bench.mock_llm server instead")
+    parser.add_argument("--output", type=Path, help="Results file (default: output/benchmarks/llm-<time>.json)")
+    args = parser.parse_args(argv)
+
+    configure_logging(level=30)
+    concurrency = sorted({int(c) for c in args.concurrency.split(",") if c})
+    workloads = [w for w in args.workloads.split(",") if w]
+    unknown = [w for w in workloads if w not in WORKLOADS]
+    if unknown:
+        parser.error(f"Unknown workload(s): {', '.join(unknown)}")
+    limits = sorted({int(c) for c in args.candidate_limits.split(",") if c} | {CANDIDATE_LIMIT})
+    models = [m for m in args.models.split(",") if m]
+
+    print(f"Building prompts from a {args.history}-item synthetic history...")
+    prompts = build_prompts(args.history, limits)
+
+    server = None
+    base_url = args.base_url
+    if args.mock:
+        from bench.mock_llm import MockLLMConfig, start
+        server, _, base_url = start(MockLLMConfig(prompt_tps=2000, gen_tps=200, parallel_slots=2))
+
+    results: List[LevelResult] = []
+    try:
+        for model in models:
+            results += benchmark_model(base_url, model, prompts, concurrency, args.requests, workloads, args.max_tokens)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    advice = suggest(results, args.context, args.latency_budget)
+    print("\nSuggested settings:")
+    for line in advice:
+        print(f"  {line}")
+
+    output = args.output or RESULTS_DIR / f"llm-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "meta": {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "base_url": base_url,
+                 "context": args.context, "latency_budget": args.latency_budget, "max_tokens": args.max_tokens},
+        "results": [r.to_dict() for r in results],
+        "suggestions": advice,
+    }, indent=2))
+    print(f"\nResults saved to {output}")
+    return 1 if results and all(r.errors == r.requests for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
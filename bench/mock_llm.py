@@ -0,0 +1,385 @@
+"""
+Mock LLM Server
+
+A lightweight OpenAI-compatible stand-in for LM Studio/Ollama/llama.cpp, so
+recommend and profile performance can be measured without a model. It
+serves /v1/chat/completions (streaming and non-streaming), /v1/embeddings
+and /v1/models, and replays recorded or templated responses with
+llama.cpp-like timing:
+
+- prompt processing at ``prompt_tps`` tokens/s, minus the prefix shared
+  with a recent prompt (the server's KV-cache reuse),
+- generation at ``gen_tps`` tokens/s per request,
+- at most ``parallel_slots`` requests decoding at once; the rest queue.
+
+Tokens are ~4-character pieces of the text, so timings are deterministic.
+
+    python -m bench.mock_llm --port 1235 --prompt-tps 800 --gen-tps 40 --slots 2
+    LOCAL_LLM_BASE_URL=http://127.0.0.1:1235/v1 python cli.py recommend
+
+Replay file (``--responses``): a JSON list tried in order against the last
+user message. ``prompt`` matches a recorded prompt exactly, ``match`` is a
+regex; ``response`` may use ``{model}`` and the regex's named groups::
+
+    [{"prompt": "ping", "response": "pong"},
+     {"match": "Summarize this part .* \\\\((?P<count>\\\\d+) titles\\\\)", "response": "- {count} titles"}]
+
+Without a match the built-in templates answer recommendation, profile and
+summary prompts in the format the agent parses. GET /_stats returns
+request, token and concurrency counters.
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import MODEL_NAME, NUM_RECOMMENDATIONS, configure_logging, logger
+
+_TOKEN_RE = re.compile(r"\s*\S{1,4}|\s+$")
+
+
+class MockLLMConfig(NamedTuple):
+    model: str = MODEL_NAME
+    prompt_tps: float = 0.0  # Prompt tokens processed per second (0 = instant)
+    gen_tps: float = 0.0  # Generated tokens per second per request (0 = instant)
+    parallel_slots: int = 1  # Requests decoded at once; the rest queue
+    prefix_cache: bool = True  # Skip prompt processing for a prefix shared with a recent prompt
+    embedding_dim: int = 64
+    responses: Tuple[Dict[str, Any], ...] = ()  # Replay entries, tried before the built-in templates
+
+
+def tokenize(text: str) -> List[str]:
+    """~4-character pieces that concatenate back to ``text``."""
+    return _TOKEN_RE.findall(text)
+
+
+def load_responses(path: Path) -> Tuple[Dict[str, Any], ...]:
+    """
+    Replay entries from a JSON list.
+
+    Raises:
+        ValueError: If an entry has neither ``prompt`` nor ``match``, or no ``response``.
+    """
+    entries = json.loads(Path(path).read_text())
+    for i, entry in enumerate(entries):
+        if "response" not in entry or not ("prompt" in entry or "match" in entry):
+            raise ValueError(f"Replay entry {i} needs 'response' and 'prompt' or 'match'")
+    return tuple(entries)
+
+
+# ------------------------------------------------------------------------------
+# Built-in templates: (pattern, reply builder) in the formats the agent parses
+# ------------------------------------------------------------------------------
+
+def _recommendations(prompt: str, match: "re.Match[str]") -> str:
+    listing = prompt[match.end():].split("\n\n", 1)[0]
+    titles = [line[2:].strip() for line in listing.splitlines() if line.startswith("- ")]
+    count = int(match.group("count") or NUM_RECOMMENDATIONS)
+    return "\n".join(f"{i}. **{title}** - A strong match for this profile."
+                     for i, title in enumerate(titles[:count], 1))
+
+
+def _profile(prompt: str, match: "re.Match[str]") -> str:
+    return ("## Core Preferences\n- Character-driven drama with a dark edge\n\n"
+            "## Themes & Psychology\n- Moral ambiguity\n- Identity and memory\n\n"
+            "## Viewing Style\n- Binges prestige series, samples films widely\n\n"
+            "## Taste Summary\nCerebral Drama Devotee")
+
+
+def _summary(prompt: str, match: "re.Match[str]") -> str:
+    return "- Mostly drama and science fiction\n- Favors long-running series\n- Taste stable over the period"
+
+
+TEMPLATES: Sequence[Tuple["re.Pattern[str]", Callable[[str, "re.Match[str]"], str]]] = (
+    (re.compile(r"Select (?P<count>\d+) items .*?CANDIDATE LIST \(\d+ items\):\n", re.S), _recommendations),
+    (re.compile(r"^(Summarize|Merge) ", re.M), _summary),
+    (re.compile(r"Taste Summary|taste profile", re.I), _profile),
+)
+
+
+class MockLLM:
+    """Response selection, simulated timing and counters; shared by all handler threads."""
+
+    def __init__(self, config: MockLLMConfig = MockLLMConfig()) -> None:
+        self.config = config
+        self._slots = threading.BoundedSemaphore(max(1, config.parallel_slots))
+        self._lock = threading.Lock()
+        self._recent: "deque[List[str]]" = deque(maxlen=max(1, config.parallel_slots))
+        self.counters: Counter = Counter()
+        self.active = 0
+        self.peak_active = 0
+
+    def respond(self, prompt: str) -> str:
+        """Replay entry, built-in template or a short generic answer for ``prompt``."""
+        for entry in self.config.responses:
+            if "prompt" in entry:
+                if entry["prompt"] == prompt:
+                    return entry["response"].format(model=self.config.model)
+                continue
+            match = re.search(entry["match"], prompt, re.S)
+            if match:
+                return entry["response"].format(model=self.config.model, **match.groupdict())
+        for pattern, build in TEMPLATES:
+            match = pattern.search(prompt)
+            if match:
+                return build(prompt, match)
+        return "OK"
+
+    def _cached_tokens(self, tokens: List[str]) -> int:
+        """Length of the longest token prefix shared with a recent prompt (and remember this one)."""
+        if not self.config.prefix_cache:
+            return 0
+        best = 0
+        with self._lock:
+            for previous in self._recent:
+                shared = 0
+                for a, b in zip(previous, tokens):
+                    if a != b:
+                        break
+                    shared += 1
+                best = max(best, shared)
+            self._recent.append(tokens)
+        return best
+
+    def generate(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yields ``(piece, info)`` per generated token, paced like a real server.
+
+        Blocks for a free slot and for prompt processing before the first
+        piece. The last ``info`` has the usage and finish reason.
+        """
+        prompt_text = "".join(str(m.get("content") or "") for m in messages)
+        user = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "")
+        prompt_tokens = tokenize(prompt_text)
+        pieces = tokenize(self.respond(user))
+        finish = "stop"
+        if max_tokens is not None and len(pieces) > max_tokens:
+            pieces, finish = pieces[:max_tokens], "length"
+
+        queued = time.monotonic()
+        with self._slots:
+            with self._lock:
+                self.active += 1
+                self.peak_active = max(self.peak_active, self.active)
+                self.counters["queue_ms"] += int((time.monotonic() - queued) * 1000)
+            try:
+                cached = self._cached_tokens(prompt_tokens)
+                if self.config.prompt_tps > 0:
+                    time.sleep((len(prompt_tokens) - cached) / self.config.prompt_tps)
+                step = 1 / self.config.gen_tps if self.config.gen_tps > 0 else 0.0
+                info: Dict[str, Any] = {}
+                for i, piece in enumerate(pieces):
+                    if step:
+                        time.sleep(step)
+                    if i == len(pieces) - 1:
+                        break
+                    yield piece, info
+                with self._lock:
+                    self.counters["chat_requests"] += 1
+                    self.counters["prompt_tokens"] += len(prompt_tokens)
+                    self.counters["cached_tokens"] += cached
+                    self.counters["completion_tokens"] += len(pieces)
+                info = {
+                    "finish_reason": finish,
+                    "usage": {
+                        "prompt_tokens": len(prompt_tokens),
+                        "completion_tokens": len(pieces),
+                        "total_tokens": len(prompt_tokens) + len(pieces),
+                        "prompt_tokens_details": {"cached_tokens": cached},
+                    },
+                }
+                yield (pieces[-1] if pieces else ""), info
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+    def embed(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Deterministic unit vectors per text (hash-seeded) and the prompt token count."""
+        tokens = sum(len(tokenize(t)) for t in texts)
+        with self._slots:
+            if self.config.prompt_tps > 0:
+                time.sleep(tokens / self.config.prompt_tps)
+        vectors = []
+        for text in texts:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            raw = [(digest[i % len(digest)] ^ (i * 31 & 0xFF)) - 127.5 for i in range(self.config.embedding_dim)]
+            norm = math.sqrt(sum(v * v for v in raw)) or 1.0
+            vectors.append([round(v / norm, 6) for v in raw])
+        with self._lock:
+            self.counters["embedding_requests"] += 1
+            self.counters["embedding_tokens"] += tokens
+        return vectors, tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, active=self.active, peak_active=self.peak_active,
+                        parallel_slots=self.config.parallel_slots)
+
+
+def make_handler(mock: MockLLM):
+    """Builds the request handler class bound to ``mock``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive and chunked streaming, like the real servers
+
+        def _send(self, status: int, body: Any) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _chat(self, body: Dict[str, Any]) -> None:
+            messages = body.get("messages") or []
+            if not messages:
+                self._send(400, {"error": {"message": "messages is required", "type": "invalid_request_error"}})
+                return
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            created = int(time.time())
+            model = body.get("model") or mock.config.model
+            stream = mock.generate(messages, body.get("max_tokens"))
+
+            if not body.get("stream"):
+                text, info = [], {}
+                for piece, info in stream:
+                    text.append(piece)
+                self._send(200, {
+                    "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(text)},
+                                 "finish_reason": info["finish_reason"]}],
+                    "usage": info["usage"],
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def event(delta: Dict[str, Any], finish: Optional[str] = None, usage: Optional[Dict] = None) -> None:
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                if usage is not None:
+                    chunk["usage"] = usage
+                self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+            first = True
+            for piece, info in stream:
+                delta = {"content": piece}
+                if first:
+                    delta["role"], first = "assistant", False
+                if piece:
+                    event(delta)
+                if info:
+                    include_usage = (body.get("stream_options") or {}).get("include_usage")
+                    event({}, info["finish_reason"], info["usage"] if include_usage else None)
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+
+        def _embeddings(self, body: Dict[str, Any]) -> None:
+            texts = body.get("input")
+            texts = [texts] if isinstance(texts, str) else list(texts or [])
+            vectors, tokens = mock.embed([str(t) for t in texts])
+            self._send(200, {
+                "object": "list", "model": body.get("model") or mock.config.model,
+                "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def do_GET(self) -> None:
+            path = urlparse(self.path).path.rstrip("/")
+            if path == "/v1/models":
+                self._send(200, {"object": "list", "data": [{"id": mock.config.model, "object": "model",
+                                                             "owned_by": "mock"}]})
+            elif path == "/_stats":
+                self._send(200, mock.stats())
+            else:
+                self._send(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+        def do_POST(self) -> None:
+            path = urlparse(self.path).path.rstrip("/")
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length)) if length else {}
+            except ValueError:
+                self._send(400, {"error": {"message": "invalid JSON body"}})
+                return
+            if path == "/v1/chat/completions":
+                self._chat(body)
+            elif path == "/v1/embeddings":
+                self._embeddings(body)
+            else:
+                self._send(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(f"{self.address_string()} - {format % args}")
+
+    return Handler
+
+
+def start(config: MockLLMConfig = MockLLMConfig(), host: str = "127.0.0.1",
+          port: int = 0) -> Tuple[ThreadingHTTPServer, MockLLM, str]:
+    """
+    Serves a mock LLM on a background thread.
+
+    Returns:
+        (server, mock, base URL ending in /v1); stop with ``server.shutdown()``.
+    """
+    mock = MockLLM(config)
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, mock, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1235)
+    parser.add_argument("--model", default=MODEL_NAME, help="Model id to report")
+    parser.add_argument("--prompt-tps", type=float, default=0.0, help="Prompt processing tokens/s (0 = instant)")
+    parser.add_argument("--gen-tps", type=float, default=0.0, help="Generation tokens/s per request (0 = instant)")
+    parser.add_argument("--slots", type=int, default=1, help="Parallel decoding slots")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="Process every prompt in full")
+    parser.add_argument("--responses", type=Path, help="JSON replay file (see module docstring)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    configure_logging(level=10 if args.verbose else 20)
+    config = MockLLMConfig(
+        model=args.model, prompt_tps=args.prompt_tps, gen_tps=args.gen_tps, parallel_slots=args.slots,
+        prefix_cache=not args.no_prefix_cache,
+        responses=load_responses(args.responses) if args.responses else (),
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(MockLLM(config)))
+    base = f"http://{args.host}:{server.server_address[1]}/v1"
+    logger.info(f"Mock LLM on {base} (LOCAL_LLM_BASE_URL={base})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
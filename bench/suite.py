@@ -0,0 +1,372 @@
+"""
+Benchmark Suite
+
+Micro-benchmarks of the hot paths and full pipeline runs on synthetic data,
+at several dataset sizes. Results are written as JSON and can be compared
+with a saved baseline; a benchmark that got slower than the baseline by
+more than the threshold is a regression.
+
+Usage:
+    python -m bench.suite                              # 1k, 10k, 100k
+    python -m bench.suite --sizes 1000,1000000 --repeat 1
+    python -m bench.suite --only filter_candidates,calculate_statistics
+    python -m bench.suite --save-baseline bench/baseline.json
+    python -m bench.suite --baseline bench/baseline.json --threshold 0.25
+"""
+import argparse
+import itertools
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import OUTPUT_DIR, PROFILE_ANALYSIS_LIMIT, configure_logging
+from bench.synthetic import make_catalog, make_history
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_THRESHOLD = 0.25  # Allowed slowdown vs. the baseline before a result counts as a regression
+RESULTS_DIR = OUTPUT_DIR / "benchmarks"
+
+
+class BenchResult(NamedTuple):
+    name: str
+    size: int
+    seconds: float  # best of ``runs``
+    runs: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.size}]"
+
+    @property
+    def per_item_us(self) -> float:
+        return self.seconds / max(self.size, 1) * 1e6
+
+
+class StubGateway:
+    """In-process LLM stand-in: canned answers after an optional fixed delay."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.calls = 0
+
+    def complete(self, prompt: str, **kwargs: Any) -> str:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if "Select" in prompt and "CANDIDATE LIST" in prompt:
+            return "\n".join(f"{i}. **Stub Title {i} (2020)** - Benchmark placeholder." for i in range(1, 11))
+        return ("## Themes & Psychology\n- Benchmark theme\n\n"
+                "## Taste Summary\nSynthetic Benchmark Viewer")
+
+    def embed(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        return [[0.0] * 8 for _ in texts]
+
+    def warm_up(self, background: bool = True) -> None:
+        return None
+
+
+def best_time(fn: Callable[[], Any], repeat: int) -> float:
+    """Best wall time of ``repeat`` calls (the minimum is the least noisy estimate)."""
+    best = math.inf
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# ------------------------------------------------------------------------------
+# Benchmarks: each takes the prepared data and returns a zero-argument callable
+# ------------------------------------------------------------------------------
+
+def _bench_filter_candidates(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.recommend import build_watched_ids, filter_candidates
+    watched = build_watched_ids(data["history"])
+    catalog = data["catalog"]
+    return lambda: filter_candidates(catalog, watched, ["horror"], ["Dark City 1"], 1990)
+
+
+def _bench_load_history(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.media import load_history
+    history = data["history"]
+    return lambda: load_history(history)
+
+
+def _bench_calculate_statistics(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.media import load_history
+    from core.profile_taste import calculate_statistics
+    events = load_history(data["history"])  # built once at load time, as in analyze_taste
+    return lambda: calculate_statistics(events)
+
+
+def _bench_get_item_id(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.recommend import get_item_id
+    catalog = data["catalog"]
+    return lambda: [get_item_id(item) for item in catalog]
+
+
+def _bench_json_save(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.serialization import write_json
+    path = data["dir"] / "history_save.json"
+    history = data["history"]
+    return lambda: write_json(path, history)
+
+
+def _bench_json_load(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.serialization import read_items, write_json
+    path = data["dir"] / "history_load.json"
+    write_json(path, data["history"])
+    return lambda: read_items(path)
+
+
+def _catalog_workspace(data: Dict[str, Any]) -> Any:
+    from core.serialization import write_json
+    from core.workspace import Workspace
+    ws = Workspace.for_user("catalog", data["dir"] / "catalog")
+    ws.ensure_dirs()
+    write_json(ws.history_file, data["history"])
+    write_json(ws.candidates_file, data["catalog"])
+    return ws
+
+
+def _bench_catalog_json(data: Dict[str, Any]) -> Callable[[], Any]:
+    """What recommend/service loading cost before snapshots: parse, crosswalk, table."""
+    from core.candidate_table import CandidateTable
+    from core.crosswalk import load_crosswalk
+    from core.recommend import build_watched_ids, load_json
+    ws = _catalog_workspace(data)
+
+    def run() -> Any:
+        history = load_json(ws.history_file)
+        candidates = load_json(ws.candidates_file)
+        crosswalk = load_crosswalk(ws, history, candidates)
+        return build_watched_ids(history, crosswalk), CandidateTable.from_items(candidates, crosswalk)
+    return run
+
+
+def _bench_catalog_snapshot(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.recommend import load_catalog
+    from core.snapshot import write_snapshot
+    ws = _catalog_workspace(data)
+    write_snapshot(ws)
+    return lambda: load_catalog(ws)
+
+
+def _bench_profile_prompt(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core.media import load_history
+    from core.prompt_encoder import encode_history
+    events = load_history(data["history"])
+    return lambda: "\n".join(encode_history(events, PROFILE_ANALYSIS_LIMIT))
+
+
+def _bench_recommend_prompt(data: Dict[str, Any]) -> Callable[[], Any]:
+    from core import recommend
+    from core.llm_gateway import set_gateway
+    candidates = [f"Candidate {i} (2020)" for i in range(len(data["catalog"]))]
+    profile = {"preferred_genres": ["drama"], "themes": ["x"], "genre_exclusions": []}
+
+    def run() -> Any:
+        previous = set_gateway(StubGateway())
+        try:
+            return recommend.generate_recommendations(profile, candidates, ["horror"], ["drama"], ["Seed"])
+        finally:
+            set_gateway(previous)
+    return run
+
+
+def _bench_pipeline(data: Dict[str, Any]) -> Callable[[], Any]:
+    """
+    profile + recommend on a synthetic workspace with the in-process LLM stand-in.
+
+    Every run gets a fresh workspace that shares only the history and
+    candidate files, so each one is a cold run: no profile coverage, stage
+    cache, crosswalk or catalog snapshot carries over, and the profile is
+    rebuilt in full.
+    """
+    from core import pipeline
+    from core.llm_gateway import set_gateway
+    from core.serialization import write_json
+    from core.workspace import Workspace
+
+    root = data["dir"] / "pipeline"
+    inputs = {"history_file": root / "watch_history.json", "candidates_file": root / "candidates.json"}
+    root.mkdir(parents=True, exist_ok=True)
+    write_json(inputs["history_file"], data["history"])
+    write_json(inputs["candidates_file"], data["catalog"])
+    runs = itertools.count()
+
+    def run() -> Any:
+        ws = Workspace.for_user("bench", root / f"run-{next(runs)}", **inputs)
+        previous = set_gateway(StubGateway())
+        try:
+            results = pipeline.run_pipeline(ws, fetch=False, force=True)
+        finally:
+            set_gateway(previous)
+        failed = [r for r in results if r.status == "failed"]
+        if failed:
+            raise RuntimeError(f"pipeline stage {failed[0].stage} failed: {failed[0].reason}")
+        return results
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[Dict[str, Any]], Callable[[], Any]]] = {
+    "filter_candidates": _bench_filter_candidates,
+    "load_history": _bench_load_history,
+    "calculate_statistics": _bench_calculate_statistics,
+    "get_item_id": _bench_get_item_id,
+    "json_save": _bench_json_save,
+    "json_load": _bench_json_load,
+    "catalog_json": _bench_catalog_json,
+    "catalog_snapshot": _bench_catalog_snapshot,
+    "profile_prompt": _bench_profile_prompt,
+    "recommend_prompt": _bench_recommend_prompt,
+    "pipeline": _bench_pipeline,
+}
+
+
+def run_suite(sizes: Sequence[int] = DEFAULT_SIZES, only: Optional[Iterable[str]] = None,
+              repeat: int = 3, seed: int = 0) -> List[BenchResult]:
+    """
+    Runs the selected benchmarks at every size.
+
+    History and catalog both have ``size`` items. Datasets of a million
+    items or more are timed once regardless of ``repeat``.
+    """
+    names = list(only) if only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="trakt-bench-") as tmp:
+            data = {
+                "history": make_history(size, seed=seed, catalog_size=size),
+                "catalog": make_catalog(size, seed=seed),
+                "dir": Path(tmp),
+            }
+            for name in names:
+                fn = BENCHMARKS[name](data)
+                runs = 1 if size >= 1_000_000 else repeat
+                result = BenchResult(name, size, best_time(fn, runs), runs)
+                print(f"  {result.key:<32} {result.seconds * 1000:>10.2f}ms  {result.per_item_us:>8.2f}us/item",
+                      flush=True)
+                results.append(result)
+    return results
+
+
+def scaling_report(results: Sequence[BenchResult]) -> List[str]:
+    """
+    Growth exponent between consecutive sizes per benchmark.
+
+    ~1.0 is linear; noticeably above 1 marks where a path stops scaling.
+    """
+    lines = []
+    by_name: Dict[str, List[BenchResult]] = {}
+    for r in results:
+        by_name.setdefault(r.name, []).append(r)
+    for name, rows in by_name.items():
+        rows.sort(key=lambda r: r.size)
+        steps = []
+        for a, b in zip(rows, rows[1:]):
+            if a.seconds > 0 and b.size > a.size:
+                exponent = math.log(b.seconds / a.seconds) / math.log(b.size / a.size)
+                flag = " !" if exponent > 1.3 else ""
+                steps.append(f"{a.size}->{b.size}: n^{exponent:.2f}{flag}")
+        if steps:
+            lines.append(f"{name:<22} {', '.join(steps)}")
+    return lines
+
+
+def serialization_backend() -> str:
+    from core.serialization import backend
+    return backend()
+
+
+def to_json(results: Sequence[BenchResult]) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": serialization_backend(),
+        },
+        "results": {
+            r.key: {"name": r.name, "size": r.size, "seconds": r.seconds, "runs": r.runs,
+                    "per_item_us": r.per_item_us}
+            for r in results
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Keys of benchmarks slower than the baseline by more than ``threshold`` (0.25 = 25%)."""
+    regressions = []
+    for key, entry in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if base and base["seconds"] > 0 and entry["seconds"] > base["seconds"] * (1 + threshold):
+            regressions.append(key)
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic data")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated dataset sizes (e.g. 1000,10000,1000000)")
+    parser.add_argument("--only", help=f"Comma-separated benchmarks ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic data seed")
+    parser.add_argument("--output", type=Path, help="Results file (default: output/benchmarks/bench-<time>.json)")
+    parser.add_argument("--baseline", type=Path, help="Compare against this results file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown vs. the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", type=Path, help="Also write the results to this baseline file")
+    args = parser.parse_args(argv)
+
+    configure_logging(level=30)  # warnings only; stage logs would drown the table
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = [s for s in args.only.split(",") if s] if args.only else None
+
+    print(f"Benchmarking sizes {', '.join(str(s) for s in sizes)}...")
+    results = run_suite(sizes, only, args.repeat, args.seed)
+    report = to_json(results)
+
+    output = args.output or RESULTS_DIR / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults saved to {output}")
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline saved to {args.save_baseline}")
+
+    scaling = scaling_report(results)
+    if scaling:
+        print("\nScaling (time growth vs. size, ! = superlinear):")
+        for line in scaling:
+            print(f"  {line}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions over {args.threshold:.0%} vs {args.baseline}:")
+            for key in regressions:
+                before = baseline["results"][key]["seconds"]
+                after = report["results"][key]["seconds"]
+                print(f"  {key:<32} {before * 1000:.2f}ms -> {after * 1000:.2f}ms ({after / before - 1:+.0%})")
+            return 1
+        print(f"\nNo regressions over {args.threshold:.0%} vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
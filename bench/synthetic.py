@@ -0,0 +1,105 @@
+"""
+Synthetic Data
+
+Deterministic Trakt-shaped histories and candidate catalogs of any size.
+The same seed always produces the same data, so benchmark runs are
+comparable across machines and commits.
+"""
+import random
+import time
+from typing import Any, Dict, List
+
+GENRES = (
+    "action", "adventure", "animation", "comedy", "crime", "documentary", "drama",
+    "family", "fantasy", "history", "horror", "music", "mystery", "romance",
+    "science-fiction", "thriller", "war", "western",
+)
+WORDS = (
+    "dark", "city", "last", "night", "star", "river", "empire", "signal", "ghost", "north",
+    "silent", "blue", "iron", "glass", "storm", "house", "winter", "code", "red", "garden",
+)
+# Start of the synthetic timeline (2024-01-01T00:00:00Z); history runs backwards from here
+_EPOCH = 1704067200
+
+
+def _title(rng: random.Random, index: int) -> str:
+    return f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {index}"
+
+
+def make_catalog(size: int, seed: int = 0, movie_share: float = 0.5) -> List[Dict[str, Any]]:
+    """
+    ``size`` candidate items shaped like Trakt trending/popular entries.
+
+    Movies get trakt ids 1..size and shows size+1..2*size, matching the ids
+    make_history draws from, so a history overlaps the catalog.
+    """
+    rng = random.Random(seed)
+    items = []
+    for i in range(size):
+        kind = "movie" if rng.random() < movie_share else "show"
+        trakt_id = i + 1 if kind == "movie" else size + i + 1
+        items.append({
+            "watchers": rng.randint(1, 5000),
+            kind: {
+                "title": _title(rng, trakt_id),
+                "year": rng.randint(1960, 2025),
+                "ids": {"trakt": trakt_id, "imdb": f"tt{trakt_id:07d}", "tmdb": trakt_id},
+                "genres": rng.sample(GENRES, rng.randint(1, 3)),
+                "runtime": rng.choice((22, 45, 60)) if kind == "show" else rng.randint(80, 180),
+            },
+        })
+    return items
+
+
+def make_history(size: int, seed: int = 0, catalog_size: int = 0, movie_share: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    ``size`` watch events shaped like Trakt /sync/history?extended=full, newest first.
+
+    Shows are watched in binges of consecutive episodes; ids are drawn from
+    ``catalog_size`` (default: size // 4) titles per kind.
+    """
+    rng = random.Random(seed + 1)
+    titles = max(1, catalog_size or size // 4)
+    meta: Dict[int, Dict[str, Any]] = {}
+
+    def media(trakt_id: int) -> Dict[str, Any]:
+        if trakt_id not in meta:
+            local = random.Random(trakt_id)
+            meta[trakt_id] = {
+                "title": _title(local, trakt_id),
+                "year": local.randint(1960, 2025),
+                "ids": {"trakt": trakt_id, "imdb": f"tt{trakt_id:07d}", "tmdb": trakt_id},
+                "genres": local.sample(GENRES, local.randint(1, 3)),
+                "runtime": local.choice((22, 45, 60)) if trakt_id > titles else local.randint(80, 180),
+            }
+        return meta[trakt_id]
+
+    events: List[Dict[str, Any]] = []
+    when = _EPOCH
+    while len(events) < size:
+        when -= rng.randint(3600, 3 * 86400)
+        if rng.random() < movie_share:
+            events.append({
+                "id": len(events) + 1,
+                "watched_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(when)),
+                "action": "watch",
+                "type": "movie",
+                "movie": media(rng.randint(1, titles)),
+            })
+            continue
+        show = media(titles + rng.randint(1, titles))
+        season = rng.randint(1, 6)
+        for episode in range(rng.randint(1, 8), 0, -1):
+            if len(events) >= size:
+                break
+            events.append({
+                "id": len(events) + 1,
+                "watched_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(when)),
+                "action": "watch",
+                "type": "episode",
+                "episode": {"season": season, "number": episode, "title": f"Episode {episode}",
+                            "runtime": show["runtime"]},
+                "show": show,
+            })
+            when -= show["runtime"] * 60 + rng.randint(60, 900)
+    return events
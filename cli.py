@@ -1,31 +1,45 @@
 #!/usr/bin/env -S venv/bin/python
 import argparse
+import importlib
 import sys
 import logging
-from typing import List
+from typing import Dict, List, Tuple
 from pathlib import Path
 from config import (
-    DATA_DIR, PROFILE_FILE, RECOMMENDATIONS_FILE,
-    HISTORY_FILE, CANDIDATES_FILE, SERVICE_PROVIDER
+    SERVICE_PROVIDER, LLM_WARMUP,
+    BATCH_WORKERS, SERVICE_HOST, SERVICE_PORT, SERVICE_REFRESH_INTERVAL, METRICS_TEXTFILE,
+    configure_logging
 )
 
-# Import from core package
-from core import fetch_data
-from core import fetch_data_simkl
-from core import recommend
-from core import profile_taste
-from core import mark_watched
-from core import mark_watched_simkl
-from scripts import auth_simkl
+# Core modules are imported per subcommand, never at top level, so that
+# 'cli.py --help' and cheap commands skip requests/openai/webbrowser.
+# scripts/startup_check.py measures the cost of each entry.
+_FETCH_MODULES = {"trakt": "core.fetch_data", "simkl": "core.fetch_data_simkl", "both": "core.fetch_merged"}
+_MARK_MODULES = {"trakt": ("core.mark_watched",), "simkl": ("core.mark_watched_simkl",),
+                 "both": ("core.mark_sync",)}
+COMMAND_IMPORTS: Dict[str, Tuple[str, ...]] = {
+    "fetch": (_FETCH_MODULES.get(SERVICE_PROVIDER, "core.fetch_data"),),
+    "profile": ("core.profile_taste",),
+    "recommend": ("core.recommend",),
+    "mark": _MARK_MODULES.get(SERVICE_PROVIDER, ("core.mark_watched",)),
+    "batch": ("core.batch", "core.workspace"),
+    "serve": ("core.service",),
+    "run": ("core.pipeline", "core.batch"),
+    "auth-simkl": ("scripts.auth_simkl",),
+}
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
 def setup_logging(verbose: bool):
-    if verbose:
-        logger.setLevel(logging.DEBUG)
-    else:
-        logger.setLevel(logging.INFO)
+    level = logging.DEBUG if verbose else logging.INFO
+    configure_logging(level)
+    logger.setLevel(level)
+
+def import_command(command: str) -> None:
+    """Imports the modules a subcommand needs."""
+    for module in COMMAND_IMPORTS.get(command, ()):
+        importlib.import_module(module)
 
 def load_items_from_file(file_path: str) -> List[str]:
     """Load items from a text file, one per line."""
@@ -43,22 +57,37 @@ def load_items_from_file(file_path: str) -> List[str]:
         logger.error(f"Error reading file {file_path}: {e}")
         return []
 
+def warm_up_llm():
+    """Start loading the model in the background while local data is read."""
+    if LLM_WARMUP:
+        from core import llm_gateway
+        llm_gateway.get_gateway().warm_up()
+
 def handle_fetch(args):
     """Fetch watch history and candidates."""
     logger.info(f"Starting data fetch (Provider: {SERVICE_PROVIDER})...")
     if SERVICE_PROVIDER == "simkl":
+        from core import fetch_data_simkl
         fetch_data_simkl.main()
+    elif SERVICE_PROVIDER == "both":
+        from core import fetch_merged
+        fetch_merged.main()
     else:
+        from core import fetch_data
         fetch_data.main()
 
 def handle_profile(args):
     """Generate taste profile."""
+    from core import profile_taste
     logger.info("Generating taste profile...")
-    profile_taste.main()
+    warm_up_llm()
+    profile_taste.main(full=args.full)
 
 def handle_recommend(args):
     """Generate recommendations."""
+    from core import recommend
     logger.info("Generating recommendations...")
+    warm_up_llm()
     
     seed_items = []
     
@@ -92,14 +121,165 @@ def handle_mark(args):
     # Convert back to list for processing
     items_list = list(unique_items)
     
-    if SERVICE_PROVIDER == "simkl":
+    if args.providers or SERVICE_PROVIDER == "both":
+        mark_on_providers(items_list, args.providers.split(",") if args.providers else ["trakt", "simkl"])
+    elif SERVICE_PROVIDER == "simkl":
+        from core import mark_watched_simkl
         mark_watched_simkl.process_titles(items_list)
     else:
+        from core import mark_watched
         mark_watched.process_titles(items_list)
 
+def mark_on_providers(titles: List[str], providers: List[str]) -> None:
+    """Marks titles on several providers in parallel and prints a report per provider."""
+    from core import mark_sync
+    
+    unknown = [p for p in providers if p not in mark_sync.MARK_PROVIDERS]
+    if unknown or not providers:
+        logger.error(f"Unknown provider(s): {', '.join(unknown)}. Choose from {', '.join(mark_sync.MARK_PROVIDERS)}.")
+        sys.exit(1)
+    reports, missing = mark_sync.mark_titles(titles, providers)
+    
+    print(f"\n{'Provider':<10} {'Status':<8} {'Marked':>7} {'Not found':>10} {'Attempts':>9}  Note")
+    for r in reports:
+        note = r.error or ", ".join(mark_sync.label(item) for item in r.not_found)
+        print(f"{r.provider:<10} {'ok' if r.ok else 'failed':<8} {len(r.marked):>7} {len(r.not_found):>10} {r.attempts:>9}  {note}")
+    if missing:
+        print(f"\nNo match for: {', '.join(missing)}")
+    
+    if not all(r.ok for r in reports):
+        sys.exit(1)
+
+def handle_batch(args):
+    """Run the pipeline for every user in a users.json file."""
+    from core import batch
+    from core.workspace import load_users
+    
+    try:
+        workspaces = load_users(Path(args.users_file))
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load users from {args.users_file}: {e}")
+        sys.exit(1)
+    
+    stages = args.stages.split(",") if args.stages else list(batch.STAGES)
+    unknown = [s for s in stages if s not in batch.STAGES]
+    if unknown:
+        logger.error(f"Unknown stage(s): {', '.join(unknown)}. Choose from {', '.join(batch.STAGES)}.")
+        sys.exit(1)
+    if "profile" in stages or "recommend" in stages:
+        warm_up_llm()
+    results = batch.run_batch(workspaces, stages, max_workers=args.workers)
+    
+    print(f"\n{'User':<20} {'Status':<18} " + " ".join(f"{s:>10}" for s in stages))
+    for r in results:
+        status = "ok" if r.ok else f"failed ({r.failed_stage})"
+        timings = " ".join(f"{r.durations[s]:>9.1f}s" if s in r.durations else f"{'-':>10}" for s in stages)
+        print(f"{r.name:<20} {status:<18} {timings}")
+    
+    if not all(r.ok for r in results):
+        sys.exit(1)
+
+def handle_serve(args):
+    """Run the long-lived HTTP service."""
+    from core import service
+    service.serve(args.host, args.port, refresh_interval=args.refresh_interval)
+
+def handle_run(args):
+    """Run the stage graph concurrently, skipping stages whose inputs are unchanged."""
+    from core import pipeline
+    
+    seed_items = list(args.items or [])
+    if args.file:
+        seed_items.extend(load_items_from_file(args.file))
+    
+    results = pipeline.run_pipeline(seed_items=seed_items, fetch=not args.no_fetch, force=args.force)
+    
+    print(f"\n{'Stage':<17} {'Status':<9} {'Start':>7} {'Time':>8}  Note")
+    for r in results:
+        print(f"{r.stage:<17} {r.status:<9} {r.started:>6.1f}s {r.seconds:>7.1f}s  {r.reason}")
+    
+    path, path_seconds = pipeline.critical_path(results)
+    wall = max((r.started + r.seconds for r in results), default=0.0)
+    serial = sum(r.seconds for r in results)
+    print(f"\nCritical path: {' → '.join(path)} ({path_seconds:.1f}s)")
+    print(f"Wall time {wall:.1f}s vs {serial:.1f}s run back to back")
+    
+    if any(r.status == "failed" for r in results):
+        sys.exit(1)
+
+def handle_auth_simkl(args):
+    """Authenticate with Simkl."""
+    from scripts import auth_simkl
+    auth_simkl.authenticate()
+
+def run_instrumented(command: str, args) -> None:
+    """
+    Runs a subcommand with tracing, metrics and/or profilers on. Afterwards
+    writes the Chrome trace (and prints its summary), the Prometheus
+    textfile and the profiler outputs.
+    """
+    import time
+    from contextlib import nullcontext
+    from core import metrics, tracing
+    
+    profiler = None
+    if args.profile_cpu or args.profile_mem or args.profile_collapsed:
+        from core.profiler import Profiler
+        profiler = Profiler(command, cpu=args.profile_cpu, memory=args.profile_mem,
+                            collapsed=args.profile_collapsed, top=args.profile_top)
+    if args.trace:
+        tracing.enable()
+    if args.metrics_file:
+        metrics.enable()
+    start = time.perf_counter()
+    ok = False
+    try:
+        with profiler or nullcontext():
+            with tracing.span(f"cli {command}", "cli"):
+                with tracing.span("import modules", "cli"):
+                    import_command(command)
+                HANDLERS[command](args)
+        ok = True
+    except SystemExit as e:
+        ok = not e.code
+        raise
+    finally:
+        if args.trace:
+            count = tracing.write_trace(args.trace)
+            print(f"\nTrace: {count} spans written to {args.trace} (open in ui.perfetto.dev or chrome://tracing)")
+            for line in tracing.format_summary(tracing.summarize()):
+                print(line)
+        if args.metrics_file:
+            metrics.REGISTRY.record_run(command, ok, time.perf_counter() - start)
+            metrics.write_textfile(args.metrics_file)
+        if profiler is not None:
+            print()
+            for line in profiler.summary:
+                print(line)
+            for path in profiler.outputs:
+                print(f"Profile: {path}")
+
+HANDLERS = {
+    "fetch": handle_fetch,
+    "profile": handle_profile,
+    "recommend": handle_recommend,
+    "mark": handle_mark,
+    "batch": handle_batch,
+    "serve": handle_serve,
+    "run": handle_run,
+    "auth-simkl": handle_auth_simkl,
+}
+
 def main():
     parser = argparse.ArgumentParser(description="Trakt Agent CLI")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging")
+    parser.add_argument("--trace", metavar="OUT.json", help="Record spans and write a Chrome/Perfetto trace")
+    parser.add_argument("--metrics-file", metavar="PATH", default=METRICS_TEXTFILE or None,
+                        help="Write Prometheus metrics for this run to PATH (textfile collector format)")
+    parser.add_argument("--profile-cpu", action="store_true", help="Save cProfile stats of the command under output/profiles/")
+    parser.add_argument("--profile-mem", action="store_true", help="Save a tracemalloc top allocations report under output/profiles/")
+    parser.add_argument("--profile-collapsed", action="store_true", help="Save sampled collapsed stacks for a flame graph")
+    parser.add_argument("--profile-top", type=int, default=25, metavar="N", help="Rows in the profiler reports (default: 25)")
     
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
     
@@ -108,6 +288,8 @@ def main():
     
     # Profile Command
     profile_parser = subparsers.add_parser("profile", help="Generate taste profile analysis")
+    profile_parser.add_argument("--full", action="store_true",
+                                help="Rebuild the whole profile instead of merging new history")
     
     # Recommend Command
     recommend_parser = subparsers.add_parser("recommend", help="Generate content recommendations")
@@ -118,6 +300,27 @@ def main():
     mark_parser = subparsers.add_parser("mark", help="Mark items as watched (by title)")
     mark_parser.add_argument("items", nargs="*", help="List of titles to mark as watched")
     mark_parser.add_argument("-f", "--file", help="Path to file containing titles to mark (one per line)")
+    mark_parser.add_argument("--providers",
+                             help="Comma-separated providers to mark on in parallel, e.g. trakt,simkl")
+
+    # Run Command
+    run_parser = subparsers.add_parser("run", help="Run fetch, profile and recommend concurrently, skipping unchanged stages")
+    run_parser.add_argument("items", nargs="*", help="Optional list of seed titles for recommendations")
+    run_parser.add_argument("-f", "--file", help="Path to file containing seed titles (one per line)")
+    run_parser.add_argument("--no-fetch", action="store_true", help="Use the data already on disk")
+    run_parser.add_argument("--force", action="store_true", help="Ignore the stage cache and run every stage")
+
+    # Batch Command
+    batch_parser = subparsers.add_parser("batch", help="Run fetch/profile/recommend for many users concurrently")
+    batch_parser.add_argument("users_file", help="Path to users.json describing each user's workspace")
+    batch_parser.add_argument("-w", "--workers", type=int, default=BATCH_WORKERS, help=f"Users processed in parallel (default: {BATCH_WORKERS})")
+    batch_parser.add_argument("--stages", help="Comma-separated subset of fetch,profile,recommend")
+
+    # Serve Command
+    serve_parser = subparsers.add_parser("serve", help="Run a local HTTP service with state kept in memory")
+    serve_parser.add_argument("--host", default=SERVICE_HOST, help=f"Bind address (default: {SERVICE_HOST})")
+    serve_parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"Port (default: {SERVICE_PORT})")
+    serve_parser.add_argument("--refresh-interval", type=float, default=SERVICE_REFRESH_INTERVAL, help="Seconds between background re-fetches (0 disables)")
 
     # Auth Simkl Command
     auth_simkl_parser = subparsers.add_parser("auth-simkl", help="Authenticate with Simkl")
@@ -126,19 +329,17 @@ def main():
     
     setup_logging(args.verbose)
     
-    if args.command == "fetch":
-        handle_fetch(args)
-    elif args.command == "profile":
-        handle_profile(args)
-    elif args.command == "recommend":
-        handle_recommend(args)
-    elif args.command == "mark":
-        handle_mark(args)
-    elif args.command == "auth-simkl":
-        auth_simkl.authenticate()
-    else:
+    handler = HANDLERS.get(args.command)
+    if handler is None:
         parser.print_help()
         sys.exit(1)
+    
+    profiling = args.profile_cpu or args.profile_mem or args.profile_collapsed
+    if args.trace or profiling or (args.metrics_file and args.command != "serve"):
+        run_instrumented(args.command, args)
+        return
+    import_command(args.command)
+    handler(args)
 
 if __name__ == "__main__":
     main()
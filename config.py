@@ -10,34 +10,47 @@ from typing import Final, Dict, List, Union
 # ==============================================================================
 # LOGGING CONFIGURATION
 # ==============================================================================
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Importing config has no side effects; entry points call configure_logging()
+# and ensure_dirs() themselves.
 logger = logging.getLogger("trakt_agent")
 
+def configure_logging(level: int = logging.INFO) -> None:
+    """Sends log output to stdout at the given level."""
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+    logger.setLevel(level)
+
 import os
 
 # ==============================================================================
 # LOCAL LLM CONFIGURATION
 # ==============================================================================
-API_BASE_URL: Final[str] = "http://127.0.0.1:1234/v1"  # Your local LLM server endpoint
+API_BASE_URL: Final[str] = os.getenv("LOCAL_LLM_BASE_URL", "http://127.0.0.1:1234/v1")  # Your local LLM server endpoint
 MODEL_NAME: Final[str] = "qwen/qwen3-4b-2507"  # Model identifier
 API_KEY: Final[str] = os.getenv("LOCAL_LLM_API_KEY", "not-needed")  # Local servers typically don't require authentication
 TEMPERATURE: Final[float] = 0.7  # Creativity level (0.1=focused, 0.9=creative)
+LLM_TIMEOUT: Final[float] = 300.0  # Deadline per LLM call in seconds (includes queueing and retries)
+LLM_MAX_RETRIES: Final[int] = 2  # Retries on connection errors, 429 and 5xx
+LLM_RETRY_BACKOFF: Final[float] = 1.0  # Initial backoff in seconds, doubled per retry
+LLM_PARALLEL_SLOTS: Final[int] = 1  # Concurrent requests the server can decode (LM Studio/llama.cpp parallel slots)
+LLM_WARMUP: Final[bool] = True  # Preload MODEL_NAME in the background before the LLM stage
+LLM_KEEP_ALIVE_INTERVAL: Final[float] = 0  # Seconds between keep-alive pings (0 = disabled)
+EMBEDDING_MODEL: Final[str] = ""  # Embedding model for profile seed vectors ("" = skip embeddings)
 
 # ==============================================================================
 # TRAKT API CONFIGURATION
 # ==============================================================================
-TRAKT_BASE_URL: Final[str] = "https://api.trakt.tv"
+TRAKT_BASE_URL: Final[str] = os.getenv("TRAKT_BASE_URL", "https://api.trakt.tv")  # Override to point at bench/fake_provider.py
 
 # ==============================================================================
 # SERVICE CONFIGURATION
 # ==============================================================================
-# Options: "trakt", "simkl"
+# Options: "trakt", "simkl", "both" (fetch both and merge them, see core/fetch_merged.py)
 SERVICE_PROVIDER: Final[str] = "trakt"
 
 # ==============================================================================
@@ -50,43 +63,64 @@ DATA_DIR: Final[Path] = BASE_DIR / "data"
 if SERVICE_PROVIDER == "simkl":
     HISTORY_FILE: Final[Path] = DATA_DIR / "watch_history_simkl.json"
     CANDIDATES_FILE: Final[Path] = DATA_DIR / "candidates_simkl.json"
+elif SERVICE_PROVIDER == "both":
+    HISTORY_FILE: Final[Path] = DATA_DIR / "watch_history_merged.json"
+    CANDIDATES_FILE: Final[Path] = DATA_DIR / "candidates_merged.json"
 else:
     HISTORY_FILE: Final[Path] = DATA_DIR / "watch_history.json"
     CANDIDATES_FILE: Final[Path] = DATA_DIR / "candidates.json"
 
 OUTPUT_DIR: Final[Path] = BASE_DIR / "output"
-PROFILE_FILE: Final[Path] = OUTPUT_DIR / "Trakt Taste Profile.json"
+PROFILE_FILE: Final[Path] = OUTPUT_DIR / "Trakt Taste Profile.json"  # Machine-readable profile artifact
+PROFILE_MARKDOWN_FILE: Final[Path] = OUTPUT_DIR / "Trakt Taste Profile.md"  # Rendered from the artifact
 RECOMMENDATIONS_FILE: Final[Path] = OUTPUT_DIR / "Trakt Recommendations.md"
 
 PREFERENCES_FILE: Final[Path] = BASE_DIR / "preferences.json"
 TOKEN_FILE: Final[Path] = BASE_DIR / "token.json"
 SECRETS_FILE: Final[Path] = BASE_DIR / "secrets.json"
 
-# Ensure data and output directories exist
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+def ensure_dirs() -> None:
+    """Creates the data and output directories."""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # ==============================================================================
 # PROCESSING LIMITS
 # ==============================================================================
 HISTORY_LIMIT: Final[int] = 2000  # Number of watch history items to fetch (increased to reduce duplicates)
 PROFILE_ANALYSIS_LIMIT: Final[int] = 75  # Reduced from 100 for 4k context overlap optimization
+PROFILE_CHUNK_SIZE: Final[int] = 150  # Average history events per summarized chunk when profiling the full history
+PROFILE_REDUCE_FANIN: Final[int] = 16  # Partial summaries merged per reduce prompt
+PROFILE_DELTA_LIMIT: Final[int] = 40  # New history events listed in an incremental profile update
+PROFILE_PROMPT_UPDATES: Final[int] = 3  # Latest incremental profile updates included in the recommendation prompt
+PROFILE_REBUILD_DRIFT: Final[float] = 0.25  # Full profile rebuild once merged deltas exceed this share of the last rebuild
+BINGE_GAP_HOURS: Final[float] = 4.0  # Max gap between episodes of one show within a binge run
+BINGE_MIN_EPISODES: Final[int] = 3  # Consecutive episodes that count as a binge run
+PROFILE_SEED_COUNT: Final[int] = 10  # Most-watched titles embedded as profile seeds
 CANDIDATE_LIMIT: Final[int] = 50  # Reduced from 60 for 4k context safety
 NUM_RECOMMENDATIONS: Final[int] = 10  # Number of recommendations to generate
+BATCH_WORKERS: Final[int] = 4  # Users processed concurrently by 'cli.py batch'
+PIPELINE_WORKERS: Final[int] = 4  # Independent stages run concurrently by 'cli.py run'
+STARTUP_BUDGET_MS: Final[float] = 50  # Import budget per subcommand, checked by scripts/startup_check.py
+
+# ==============================================================================
+# SERVICE MODE ('cli.py serve')
+# ==============================================================================
+SERVICE_HOST: Final[str] = "127.0.0.1"  # Bind address for the local HTTP API
+SERVICE_PORT: Final[int] = 8765
+SERVICE_REFRESH_INTERVAL: Final[float] = 3600  # Seconds between background re-fetches (0 = only on demand)
+SERVICE_CACHE_SIZE: Final[int] = 64  # Recommend responses cached per state, least recently used evicted first
+METRICS_TEXTFILE: Final[str] = os.getenv("TRAKT_AGENT_METRICS_FILE", "")  # Prometheus textfile written after each CLI run ("" = off)
 
 # ==============================================================================
 # RATE LIMITING
 # ==============================================================================
 TRAKT_API_DELAY: Final[float] = 0.1  # Seconds between API calls
+MARK_RETRIES: Final[int] = 3  # Attempts per provider when a mark sync hits 429 or can't connect (5xx/timeouts aren't retried)
+MARK_RETRY_BACKOFF: Final[float] = 1.0  # Initial backoff in seconds, doubled per retry (Retry-After wins)
 
 # ==============================================================================
 # SIMKL API CONFIGURATION
 # ==============================================================================
-SIMKL_BASE_URL: Final[str] = "https://api.simkl.com"
+SIMKL_BASE_URL: Final[str] = os.getenv("SIMKL_BASE_URL", "https://api.simkl.com")
 SIMKL_TOKEN_FILE: Final[Path] = BASE_DIR / "simkl_token.json"
-
-# ==============================================================================
-# SERVICE CONFIGURATION
-# ==============================================================================
-# Options: "trakt", "simkl"
-SERVICE_PROVIDER: Final[str] = "trakt"
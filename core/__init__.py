@@ -7,8 +7,13 @@ _parent = Path(__file__).resolve().parent.parent
 if str(_parent) not in sys.path:
     sys.path.insert(0, str(_parent))
 
-from . import fetch_data
-from . import profile_taste
-from . import recommend
-from . import mark_watched
-from . import search_and_mark
+import importlib
+
+# Submodules load on first access (`core.recommend`, `from core import recommend`)
+# so importing the package stays cheap.
+_SUBMODULES = {"fetch_data", "profile_taste", "recommend", "mark_watched", "search_and_mark"}
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,120 @@
+"""
+Batch Module
+
+Runs the fetch → profile → recommend pipeline for many users concurrently.
+Each user gets an isolated Workspace; users run on a thread pool, so
+network-bound fetches overlap and total runtime approaches the slowest user
+instead of the sum. LLM calls from every worker share the process-wide
+gateway, whose semaphore enforces LLM_PARALLEL_SLOTS across all users.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from config import BATCH_WORKERS, logger
+from core import tracing
+from core.workspace import Workspace
+
+STAGES = ("fetch", "profile", "recommend")
+
+
+@dataclass
+class UserResult:
+    """Outcome of one user's run."""
+
+    name: str
+    ok: bool = True
+    error: Optional[str] = None
+    failed_stage: Optional[str] = None
+    durations: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def total(self) -> float:
+        return sum(self.durations.values())
+
+
+def _fetch_module(workspace: Workspace):
+    if workspace.provider == "simkl":
+        from core import fetch_data_simkl
+        return fetch_data_simkl
+    if workspace.provider == "both":
+        from core import fetch_merged
+        return fetch_merged
+    from core import fetch_data
+    return fetch_data
+
+
+def run_stage(stage: str, workspace: Workspace) -> None:
+    """
+    Runs a single pipeline stage for one workspace.
+
+    ``fetch`` downloads history and candidates; ``fetch-history`` and
+    ``fetch-candidates`` run one half each (used by the pipeline scheduler).
+    """
+    if stage == "fetch":
+        _fetch_module(workspace).main(workspace)
+    elif stage == "fetch-history":
+        _fetch_module(workspace).save_history(workspace)
+    elif stage == "fetch-candidates":
+        _fetch_module(workspace).save_candidates(workspace)
+    elif stage == "profile":
+        from core import profile_taste
+        profile_taste.analyze_taste(workspace)
+    elif stage == "recommend":
+        from core import recommend
+        recommend.main(workspace=workspace)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_user(workspace: Workspace, stages: Sequence[str] = STAGES) -> UserResult:
+    """Runs ``stages`` in order for one user; stops at the first failure."""
+    result = UserResult(name=workspace.name)
+    workspace.ensure_dirs()
+    for stage in stages:
+        start = time.perf_counter()
+        try:
+            with tracing.span(stage, "stage", user=workspace.name):
+                run_stage(stage, workspace)
+        except Exception as e:
+            result.ok = False
+            result.error = str(e)
+            result.failed_stage = stage
+            logger.error(f"[{workspace.name}] {stage} failed: {e}")
+            break
+        finally:
+            result.durations[stage] = time.perf_counter() - start
+    return result
+
+
+def run_batch(workspaces: Sequence[Workspace], stages: Sequence[str] = STAGES,
+              max_workers: int = BATCH_WORKERS) -> List[UserResult]:
+    """
+    Runs the pipeline for every workspace on a worker pool.
+
+    A failure for one user never affects the others. Results come back in
+    input order.
+    """
+    if not workspaces:
+        return []
+
+    workers = max(1, min(max_workers, len(workspaces)))
+    logger.info(f"Running {', '.join(stages)} for {len(workspaces)} users on {workers} workers...")
+    start = time.perf_counter()
+
+    results: Dict[str, UserResult] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        futures = {pool.submit(run_user, ws, stages): ws for ws in workspaces}
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.name] = result
+            status = "done" if result.ok else f"FAILED at {result.failed_stage}"
+            logger.info(f"[{result.name}] {status} in {result.total:.1f}s")
+
+    elapsed = time.perf_counter() - start
+    ordered = [results[ws.name] for ws in workspaces]
+    serial = sum(r.total for r in ordered)
+    logger.info(f"Batch finished in {elapsed:.1f}s (serial estimate {serial:.1f}s), "
+                f"{sum(1 for r in ordered if not r.ok)} failed")
+    return ordered
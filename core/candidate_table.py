@@ -0,0 +1,285 @@
+"""
+Candidate Table Module
+
+Columnar view of a candidate pool. The pool is parsed once into parallel
+columns (ids, years, interned genre bitmasks, normalized title keys) plus
+row bitsets per genre and year (plus sparse row postings for the
+high-cardinality title and id columns), so every filter in
+recommend.filter_candidates is a handful of integer mask operations instead
+of a walk over nested provider dicts.
+
+Rows are indexed by their typed media key (``movie:trakt:1``, see
+core/media.py), never by a bare provider id: a movie and a show can share
+a Trakt id.
+Built with an id crosswalk (core/crosswalk.py), rows are also indexed by
+their canonical key, and rows naming a title already seen earlier in the
+pool (e.g. the same film from Trakt and Simkl) are marked in ``duplicates``.
+Tables loaded from a binary snapshot (core/snapshot.py) are
+MappedCandidateTables: their columns stay in the memory-mapped file and they
+arrive with the watched rows already marked in ``watched``.
+
+Row sets are plain Python ints used as bit vectors: bit ``i`` set means
+row ``i`` is selected.
+"""
+from array import array
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from core.media import MediaItem, media_key, pick_id, unwrap
+
+if TYPE_CHECKING:
+    from core.crosswalk import Crosswalk
+
+
+def popcount(mask: int) -> int:
+    """Number of rows selected by a mask."""
+    return bin(mask).count("1")
+
+
+def _rows_to_mask(rows: List[int], size: int) -> int:
+    """Packs row indices into a bitset in linear time."""
+    buf = bytearray((size + 7) // 8)
+    for row in rows:
+        buf[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bytes(buf), "little")
+
+
+class CandidateTable:
+    """Array-backed candidate pool with precomputed filter masks."""
+
+    __slots__ = (
+        "size", "ids", "years", "genre_masks", "title_keys", "labels",
+        "genre_vocab", "all_rows", "with_id", "duplicates", "watched",
+        "_genre_rows", "_year_rows", "_title_rows", "_id_rows",
+    )
+
+    def __init__(self) -> None:
+        self.size = 0
+        self.ids: List[Optional[str]] = []
+        self.years = array("i")
+        self.genre_masks: Union[array, List[int]] = []
+        self.title_keys: List[str] = []
+        self.labels: List[str] = []
+        self.genre_vocab: Dict[str, int] = {}
+        self.all_rows = 0
+        self.with_id = 0
+        self.duplicates = 0  # rows repeating an earlier row's title
+        self.watched = 0  # rows known to be watched when the table was built (snapshots)
+        self._genre_rows: List[int] = []
+        self._year_rows: Dict[int, int] = {}
+        self._title_rows: Dict[str, List[int]] = {}
+        self._id_rows: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_items(cls, items: Iterable[Union[Dict[str, Any], MediaItem]],
+                   crosswalk: Optional["Crosswalk"] = None) -> "CandidateTable":
+        """
+        Builds the table from MediaItems or raw Trakt/Simkl candidate dicts in a single pass.
+
+        With a ``crosswalk``, rows are matched and deduplicated by canonical
+        key, so one title listed under different providers' ids is one title.
+        """
+        table = cls()
+        masks: List[int] = []
+        vocab = table.genre_vocab
+        # Posting lists first; packing them into bitsets at the end keeps the
+        # build linear (OR-ing one bit at a time into a growing int is not).
+        genre_postings: List[List[int]] = []
+        year_postings: Dict[int, List[int]] = {}
+        title_postings = table._title_rows
+        id_postings = table._id_rows
+        with_id: List[int] = []
+        duplicates: List[int] = []
+        seen_keys = set()
+
+        for row, item in enumerate(items):
+            if isinstance(item, MediaItem):
+                picked = pick_id(item.ids)
+                tid, key = (picked[1], item.key) if picked else (None, None)
+                title, year, genres = item.title, item.year, item.genres
+                canonical = crosswalk.canonical(item.kind, item.ids) if crosswalk and tid else key
+            else:
+                # Raw dicts are parsed straight into the columns; no MediaItem needed
+                kind, obj = unwrap(item)
+                if obj is None:
+                    tid, key, canonical, title, year, genres = None, None, None, "Unknown", 0, ()
+                else:
+                    picked = pick_id(obj.get("ids") or {})
+                    tid, key = (picked[1], media_key(kind, *picked)) if picked else (None, None)
+                    canonical = crosswalk.canonical(kind, obj["ids"]) if crosswalk and tid else key
+                    title = obj.get("title") or "Unknown"
+                    try:
+                        year = int(obj.get("year") or 0)
+                    except (ValueError, TypeError):
+                        year = 0
+                    genres = obj.get("genres") or ()
+
+            genre_mask = 0
+            for genre in genres:
+                name = genre.lower()
+                index = vocab.get(name)
+                if index is None:
+                    index = vocab[name] = len(vocab)
+                    genre_postings.append([])
+                genre_mask |= 1 << index
+                genre_postings[index].append(row)
+
+            title_key = title.strip().lower()
+            table.ids.append(tid)
+            table.years.append(year)
+            masks.append(genre_mask)
+            table.title_keys.append(title_key)
+            table.labels.append(f"{title} ({year})" if year else title)
+
+            year_postings.setdefault(year, []).append(row)
+            title_postings.setdefault(title_key, []).append(row)
+            if tid:
+                id_postings.setdefault(key, []).append(row)
+                canonical = canonical or key
+                if canonical != key:
+                    id_postings.setdefault(canonical, []).append(row)
+                if canonical in seen_keys:
+                    duplicates.append(row)
+                else:
+                    seen_keys.add(canonical)
+                with_id.append(row)
+
+        size = table.size = len(table.ids)
+        table.all_rows = (1 << size) - 1
+        table.with_id = _rows_to_mask(with_id, size)
+        table.duplicates = _rows_to_mask(duplicates, size)
+        table._genre_rows = [_rows_to_mask(rows, size) for rows in genre_postings]
+        table._year_rows = {k: _rows_to_mask(v, size) for k, v in year_postings.items()}
+        # Fixed-width column whenever the vocabulary fits in 64 bits (it always
+        # does for the Trakt/Simkl genre lists); otherwise keep Python ints.
+        table.genre_masks = array("Q", masks) if len(vocab) <= 64 else masks
+        return table
+
+    def __len__(self) -> int:
+        return self.size
+
+    def row_sets(self) -> Tuple[List[int], Dict[int, int]]:
+        """The per-genre (by vocabulary index) and per-year row bitsets."""
+        return self._genre_rows, self._year_rows
+
+    def key_rows(self) -> Dict[str, List[int]]:
+        """Rows per typed and canonical key (tables built by ``from_items``)."""
+        return self._id_rows
+
+    def mask_ids(self, ids: Iterable[Any]) -> int:
+        """Rows whose typed (or canonical) key is in ``ids``."""
+        id_rows = self._id_rows
+        hits: List[int] = []
+        for key in ids:
+            rows = id_rows.get(str(key))
+            if rows:
+                hits.extend(rows)
+        return _rows_to_mask(hits, self.size)
+
+    def mask_genres(self, genres: Iterable[str]) -> int:
+        """Rows carrying any of ``genres`` (case-insensitive)."""
+        mask = 0
+        for genre in genres:
+            index = self.genre_vocab.get(genre.lower())
+            if index is not None:
+                mask |= self._genre_rows[index]
+        return mask
+
+    def mask_titles(self, titles: Iterable[str]) -> int:
+        """Rows whose normalized title matches one of ``titles``."""
+        hits: List[int] = []
+        for title in titles:
+            hits.extend(self._title_rows.get(title.strip().lower(), ()))
+        return _rows_to_mask(hits, self.size)
+
+    def mask_older_than(self, min_year: int) -> int:
+        """Rows with a known year strictly before ``min_year``."""
+        mask = 0
+        for year, rows in self._year_rows.items():
+            if 0 < year < min_year:
+                mask |= rows
+        return mask
+
+    def rows(self, mask: int) -> List[int]:
+        """Row indices selected by ``mask``, in table order."""
+        if mask <= 0:
+            return []
+        rows = []
+        data = mask.to_bytes((self.size + 7) // 8, "little")
+        for byte_index, byte in enumerate(data):
+            if not byte:
+                continue
+            base = byte_index * 8
+            for bit in range(8):
+                if byte >> bit & 1:
+                    rows.append(base + bit)
+        return rows
+
+    def scores(self, rows: Iterable[int], genre_weights: Dict[str, float],
+               era_weights: Dict[int, float]) -> List[float]:
+        """Profile affinity per row: summed genre weights plus the weight of the row's decade."""
+        weight_by_bit = [genre_weights.get(genre, 0.0) for genre in sorted(self.genre_vocab, key=self.genre_vocab.get)]
+        masks, years = self.genre_masks, self.years
+        result = []
+        for row in rows:
+            mask, score, bit = masks[row], 0.0, 0
+            while mask:
+                if mask & 1:
+                    score += weight_by_bit[bit]
+                mask >>= 1
+                bit += 1
+            year = years[row]
+            if year:
+                score += era_weights.get((year // 10) * 10, 0.0)
+            result.append(score)
+        return result
+
+    def select_labels(self, mask: int) -> List[str]:
+        """'Title (Year)' labels for the selected rows."""
+        labels = self.labels
+        return [labels[row] for row in self.rows(mask)]
+
+
+class MappedCandidateTable(CandidateTable):
+    """
+    A candidate table whose columns live in a memory-mapped catalog snapshot
+    (core/snapshot.py). Years, genre masks, labels and ids are views of the
+    mapping, read as rows are touched; ids and titles are looked up through
+    the snapshot's sorted hash indexes (``key_rows``/``title_rows``) instead
+    of in-memory postings. Only the row bitsets are held as Python ints.
+    """
+
+    __slots__ = ("_key_lookup", "_title_lookup")
+
+    def __init__(self, ids: Sequence[Optional[str]], labels: Sequence[str], title_keys: Sequence[str],
+                 years: Sequence[int], genre_masks: Sequence[int], genre_names: Sequence[str],
+                 genre_rows: List[int], year_rows: Dict[int, int], with_id: int, duplicates: int,
+                 watched: int, key_rows: Callable[[str], List[int]],
+                 title_rows: Callable[[str], List[int]]) -> None:
+        super().__init__()
+        self.size = len(ids)
+        self.ids = ids  # type: ignore[assignment]
+        self.labels = labels  # type: ignore[assignment]
+        self.title_keys = title_keys  # type: ignore[assignment]
+        self.years = years  # type: ignore[assignment]
+        self.genre_masks = genre_masks  # type: ignore[assignment]
+        self.genre_vocab = {name: index for index, name in enumerate(genre_names)}
+        self.all_rows = (1 << self.size) - 1
+        self.with_id = with_id
+        self.duplicates = duplicates
+        self.watched = watched
+        self._genre_rows = genre_rows
+        self._year_rows = year_rows
+        self._key_lookup = key_rows
+        self._title_lookup = title_rows
+
+    def mask_ids(self, ids: Iterable[Any]) -> int:
+        hits: List[int] = []
+        for key in ids:
+            hits.extend(self._key_lookup(str(key)))
+        return _rows_to_mask(hits, self.size)
+
+    def mask_titles(self, titles: Iterable[str]) -> int:
+        hits: List[int] = []
+        for title in titles:
+            hits.extend(self._title_lookup(title.strip().lower()))
+        return _rows_to_mask(hits, self.size)
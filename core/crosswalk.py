@@ -0,0 +1,168 @@
+"""
+ID Crosswalk Module
+
+Trakt and Simkl identify a title by different ids, and a single item may
+carry any of trakt/simkl/imdb/tmdb/tvdb. Keyed by whichever id came first,
+the same title can get one key in the history and another in the
+candidates, and the watched check misses it.
+
+The crosswalk records which typed ids (``movie:imdb:tt0816692``,
+``movie:trakt:102156``, ...) name the same title, as a union-find over
+every id seen together in one item, and maps each to one canonical key.
+The preferred canonical source is Trakt, then Simkl, IMDb, TMDb and TVDB. It is
+filled from every provider response the agent already receives (history,
+candidates, search results), persisted in the workspace data dir
+(CROSSWALK_FILE_NAME), and makes "is this watched?" a single set lookup
+whichever provider or id type either side came from.
+"""
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import logger
+from core.media import media_key, unwrap
+from core.serialization import read_json, write_json
+from core.workspace import Workspace
+
+CROSSWALK_FILE_NAME = "id_crosswalk.json"
+ID_SOURCES = ("trakt", "simkl", "imdb", "tmdb", "tvdb")  # Canonical preference, best first
+_RANK = {source: rank for rank, source in enumerate(ID_SOURCES)}
+
+_file_lock = threading.Lock()  # fetch stages update the same file from parallel threads
+
+
+def _rank(key: str) -> tuple:
+    source = key.split(":", 2)[1]
+    return (_RANK.get(source, len(_RANK)), key)
+
+
+class Crosswalk:
+    """Typed ids → canonical key, merged from every item that carried them together."""
+
+    def __init__(self, links: Optional[Dict[str, str]] = None) -> None:
+        self._parent: Dict[str, str] = dict(links or {})
+        for root in set(self._parent.values()):
+            self._parent.setdefault(root, root)  # persisted without their self-links
+        self.changed = False
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    @staticmethod
+    def aliases(kind: str, ids: Dict[str, Any]) -> List[str]:
+        """Typed keys of every known id source present in ``ids``, best first."""
+        return [media_key(kind, source, ids[source]) for source in ID_SOURCES if ids.get(source)]
+
+    def _find(self, key: str) -> str:
+        parent = self._parent
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while key != root:  # path compression
+            next_key = parent[key]
+            parent[key] = root
+            key = next_key
+        return root
+
+    def add(self, kind: str, ids: Dict[str, Any]) -> Optional[str]:
+        """Links all of ``ids`` to one title; returns its canonical key (None without ids)."""
+        aliases = self.aliases(kind, ids)
+        if not aliases:
+            return None
+        roots = {self._find(alias) for alias in aliases}
+        root = min(roots | {aliases[0]}, key=_rank)
+        parent = self._parent
+        for key in (*aliases, *roots):
+            if parent.get(key) != root:
+                parent[key] = root
+                self.changed = True
+        return root
+
+    def canonical(self, kind: str, ids: Dict[str, Any]) -> Optional[str]:
+        """Canonical key for ``ids`` without recording anything new."""
+        aliases = self.aliases(kind, ids)
+        for alias in aliases:
+            if alias in self._parent:
+                return self._find(alias)
+        return aliases[0] if aliases else None
+
+    def canonical_item(self, item: Dict[str, Any]) -> Optional[str]:
+        """Canonical key of a raw provider item."""
+        kind, obj = unwrap(item)
+        return self.canonical(kind, obj.get("ids") or {}) if obj is not None else None
+
+    def observe(self, items: Iterable[Dict[str, Any]]) -> int:
+        """Records the ids of raw provider items; returns how many items had ids."""
+        seen = 0
+        done = set()  # histories repeat the same ids once per episode watched
+        for item in items:
+            kind, obj = unwrap(item)
+            if obj is None:
+                continue
+            ids = obj.get("ids") or {}
+            signature = (kind, *ids.items())
+            if signature in done:
+                seen += 1
+            elif self.add(kind, ids) is not None:
+                done.add(signature)
+                seen += 1
+        return seen
+
+    def to_dict(self) -> Dict[str, Any]:
+        links = {key: self._find(key) for key in list(self._parent)}
+        # Roots map to themselves implicitly
+        return {"version": 1, "links": {k: v for k, v in sorted(links.items()) if k != v}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Crosswalk":
+        return cls(data.get("links") or {})
+
+
+def crosswalk_path(workspace: Workspace) -> Path:
+    return workspace.data_dir / CROSSWALK_FILE_NAME
+
+
+def load_crosswalk(workspace: Optional[Workspace] = None,
+                   *observed: Iterable[Dict[str, Any]]) -> Crosswalk:
+    """
+    The workspace's persisted crosswalk, plus the ids of ``observed`` item
+    lists in memory (so links present in the data being matched always count).
+    """
+    ws = workspace or Workspace.default()
+    path = crosswalk_path(ws)
+    crosswalk = Crosswalk()
+    if path.exists():
+        try:
+            crosswalk = Crosswalk.from_dict(read_json(path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {path.name}: {e}")
+    for items in observed:
+        crosswalk.observe(items)
+    return crosswalk
+
+
+def save_crosswalk(crosswalk: Crosswalk, workspace: Optional[Workspace] = None) -> None:
+    """Writes the crosswalk atomically (temp file + rename)."""
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    write_json(crosswalk_path(ws), crosswalk.to_dict())
+    crosswalk.changed = False
+
+
+def update_crosswalk(items: Iterable[Dict[str, Any]], workspace: Optional[Workspace] = None) -> int:
+    """
+    Merges the ids of provider response ``items`` into the persisted crosswalk.
+
+    Returns the number of items that carried ids. Never raises: a failed
+    update only costs a missed link on the next run.
+    """
+    try:
+        with _file_lock:
+            crosswalk = load_crosswalk(workspace)
+            seen = crosswalk.observe(items)
+            if crosswalk.changed:
+                save_crosswalk(crosswalk, workspace)
+        return seen
+    except Exception as e:
+        logger.warning(f"Could not update the id crosswalk: {e}")
+        return 0
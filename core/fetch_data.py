@@ -4,39 +4,40 @@ Fetch Data Module
 Retrieves watch history and candidate data from Trakt API.
 """
 import requests
-import json
 import time
 from typing import Dict, List, Any, Optional
 
 from config import (
     TRAKT_BASE_URL,
     TRAKT_API_DELAY,
-    TOKEN_FILE,
-    SECRETS_FILE,
-    HISTORY_FILE,
-    CANDIDATES_FILE,
     HISTORY_LIMIT,
-    logger
+    logger,
+    configure_logging
 )
+from core import tracing
+from core.crosswalk import update_crosswalk
+from core.media import item_key
+from core.serialization import read_json, write_json
+from core.snapshot import write_snapshot
+from core.workspace import Workspace
 
-def get_headers() -> Dict[str, str]:
+def get_headers(workspace: Optional[Workspace] = None) -> Dict[str, str]:
     """
     Constructs Trakt API headers using stored credentials.
     Raises FileNotFoundError if sensitive files are missing.
     """
-    if not TOKEN_FILE.exists():
-        logger.error(f"Token file not found at {TOKEN_FILE}")
-        raise FileNotFoundError(f"Missing {TOKEN_FILE}. Run 'exchange_pin.py' first.")
+    ws = workspace or Workspace.default()
+    if not ws.token_file.exists():
+        logger.error(f"Token file not found at {ws.token_file}")
+        raise FileNotFoundError(f"Missing {ws.token_file}. Run 'exchange_pin.py' first.")
     
-    if not SECRETS_FILE.exists():
-        logger.error(f"Secrets file not found at {SECRETS_FILE}")
-        raise FileNotFoundError(f"Missing {SECRETS_FILE}.")
+    if not ws.secrets_file.exists():
+        logger.error(f"Secrets file not found at {ws.secrets_file}")
+        raise FileNotFoundError(f"Missing {ws.secrets_file}.")
 
-    with open(TOKEN_FILE, "r") as f:
-        token = json.load(f)
-        
-    with open(SECRETS_FILE, "r") as f:
-        secrets = json.load(f)
+    with tracing.span("read credentials", "io"):
+        token = read_json(ws.token_file)
+        secrets = read_json(ws.secrets_file)
         
     return {
         "Content-Type": "application/json",
@@ -45,12 +46,13 @@ def get_headers() -> Dict[str, str]:
         "trakt-api-key": secrets["client_id"]
     }
 
-def fetch_history(limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+def fetch_history(limit: int = HISTORY_LIMIT, workspace: Optional[Workspace] = None) -> List[Dict[str, Any]]:
     """
-    Fetches the user's watch history from Trakt.
+    Fetches the user's watch history from Trakt, including genres and runtimes.
     
     Args:
         limit: Maximum number of history items to fetch.
+        workspace: User workspace (defaults to the global config paths).
         
     Returns:
         List of history item dictionaries.
@@ -60,16 +62,17 @@ def fetch_history(limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
     all_items: List[Dict[str, Any]] = []
     page = 1
     per_page = 100 
-    headers = get_headers()
+    headers = get_headers(workspace)
     
     while len(all_items) < limit:
-        url = f"{TRAKT_BASE_URL}/sync/history?limit={per_page}&page={page}"
+        url = f"{TRAKT_BASE_URL}/sync/history?limit={per_page}&page={page}&extended=full"
         logger.debug(f"Fetching history page {page}...")
         
         try:
             response = requests.get(url, headers=headers)
             response.raise_for_status()
-            data = response.json()
+            with tracing.span("parse history page", "io", page=page):
+                data = response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"API Error on page {page}: {e}")
             break
@@ -84,7 +87,7 @@ def fetch_history(limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
     logger.info(f"Fetched {len(all_items)} total items.")
     return all_items[:limit]
 
-def fetch_category(category: str, category_type: str, limit: int = 100) -> List[Dict[str, Any]]:
+def fetch_category(category: str, category_type: str, limit: int = 100, workspace: Optional[Workspace] = None) -> List[Dict[str, Any]]:
     """
     Generic fetcher for trending/popular lists.
     
@@ -92,49 +95,73 @@ def fetch_category(category: str, category_type: str, limit: int = 100) -> List[
         category: 'trending' or 'popular'
         category_type: 'movies' or 'shows'
         limit: items to fetch
+        workspace: User workspace (defaults to the global config paths).
     """
     url = f"{TRAKT_BASE_URL}/{category_type}/{category}?limit={limit}"
-    headers = get_headers()
+    headers = get_headers(workspace)
     try:
         response = requests.get(url, headers=headers)
         response.raise_for_status()
-        return response.json()
+        items = response.json()
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to fetch {category} {category_type}: {e}")
         return []
+    # Trending wraps each title ({"watchers": n, "movie": {...}}); popular returns bare titles
+    kind = category_type[:-1]
+    return [item if kind in item else {kind: item} for item in items]
+
+def fetch_candidates(workspace: Optional[Workspace] = None) -> List[Dict[str, Any]]:
+    """
+    Fetches the trending and popular pools and deduplicates them by typed key,
+    so a movie and a show sharing a Trakt ID are both kept.
+    """
+    logger.info("Fetching candidate pools...")
+    trending_mv = fetch_category("trending", "movies", 100, workspace)
+    trending_tv = fetch_category("trending", "shows", 100, workspace)
+    popular_mv = fetch_category("popular", "movies", 100, workspace)
+    popular_tv = fetch_category("popular", "shows", 100, workspace)
+    
+    # Merge and deduplicate
+    candidates: Dict[str, Dict[str, Any]] = {}
+    pool = trending_mv + trending_tv + popular_mv + popular_tv
+    
+    for item in pool:
+        key = item_key(item)
+        if key:
+            candidates[key] = item
+            
+    return list(candidates.values())
 
-def main() -> None:
+def save_history(workspace: Optional[Workspace] = None) -> int:
+    """Fetches the watch history and writes it to the workspace history file."""
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    history = fetch_history(limit=HISTORY_LIMIT, workspace=ws)
+    write_json(ws.history_file, history)
+    update_crosswalk(history, ws)
+    logger.info(f"Saved {len(history)} history items to {ws.history_file.name}")
+    return len(history)
+
+def save_candidates(workspace: Optional[Workspace] = None) -> int:
+    """Fetches the candidate pools and writes them to the workspace candidates file."""
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    final_candidates = fetch_candidates(ws)
+    write_json(ws.candidates_file, final_candidates)
+    update_crosswalk(final_candidates, ws)
+    logger.info(f"Saved {len(final_candidates)} unique candidates to {ws.candidates_file.name}")
+    return len(final_candidates)
+
+def main(workspace: Optional[Workspace] = None) -> None:
     try:
         # 1. Fetch Deep History
-        history = fetch_history(limit=HISTORY_LIMIT)
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=2)
-        logger.info(f"Saved {len(history)} history items to {HISTORY_FILE.name}")
+        save_history(workspace)
         
         # 2. Fetch Candidates
-        logger.info("Fetching candidate pools...")
-        trending_mv = fetch_category("trending", "movies", 100)
-        trending_tv = fetch_category("trending", "shows", 100)
-        popular_mv = fetch_category("popular", "movies", 100)
-        popular_tv = fetch_category("popular", "shows", 100)
-        
-        # Merge and deduplicate
-        candidates: Dict[int, Dict[str, Any]] = {}
-        pool = trending_mv + trending_tv + popular_mv + popular_tv
-        
-        for item in pool:
-            if "movie" in item:
-                tid = item["movie"]["ids"]["trakt"]
-                candidates[tid] = item
-            elif "show" in item:
-                tid = item["show"]["ids"]["trakt"]
-                candidates[tid] = item
-                
-        final_candidates = list(candidates.values())
-        
-        with open(CANDIDATES_FILE, "w") as f:
-            json.dump(final_candidates, f, indent=2)
-        logger.info(f"Saved {len(final_candidates)} unique candidates to {CANDIDATES_FILE.name}")
+        save_candidates(workspace)
+
+        # 3. Snapshot both, once they are on disk
+        write_snapshot(workspace)
 
     except Exception as e:
         logger.error(f"Detailed Error: {e}")
@@ -142,4 +169,5 @@ def main() -> None:
         raise e
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -4,30 +4,32 @@ Fetch Data Module (Simkl)
 Retrieves watch history and candidate data from Simkl API.
 """
 import requests
-import json
 import socket
 from typing import Dict, List, Any, Optional
 
 from config import (
     SIMKL_BASE_URL,
-    SIMKL_TOKEN_FILE,
-    SECRETS_FILE,
-    HISTORY_FILE,
-    CANDIDATES_FILE,
     HISTORY_LIMIT,
-    logger
+    logger,
+    configure_logging
 )
+from core import tracing
+from core.crosswalk import update_crosswalk
+from core.serialization import read_json, write_json
+from core.snapshot import write_snapshot
+from core.workspace import Workspace
 
-def get_headers() -> Dict[str, str]:
+def get_headers(workspace: Optional[Workspace] = None) -> Dict[str, str]:
     """
     Constructs Simkl API headers.
     """
-    if not SECRETS_FILE.exists():
-        logger.error(f"Secrets file not found at {SECRETS_FILE}")
-        raise FileNotFoundError(f"Missing {SECRETS_FILE}.")
+    ws = workspace or Workspace.default()
+    if not ws.secrets_file.exists():
+        logger.error(f"Secrets file not found at {ws.secrets_file}")
+        raise FileNotFoundError(f"Missing {ws.secrets_file}.")
 
-    with open(SECRETS_FILE, "r") as f:
-        secrets = json.load(f)
+    with tracing.span("read credentials", "io"):
+        secrets = read_json(ws.secrets_file)
         
     client_id = secrets.get("simkl_client_id")
     if not client_id:
@@ -39,15 +41,15 @@ def get_headers() -> Dict[str, str]:
     }
 
     # Add Authorization header if token exists
-    if SIMKL_TOKEN_FILE.exists():
-        with open(SIMKL_TOKEN_FILE, "r") as f:
-            token = json.load(f)
+    if ws.simkl_token_file.exists():
+        with tracing.span("read credentials", "io"):
+            token = read_json(ws.simkl_token_file)
             if "access_token" in token:
                  headers["Authorization"] = f"Bearer {token['access_token']}"
     
     return headers
 
-def fetch_simkl_details(simkl_id: int, item_type: str) -> Optional[Dict[str, Any]]:
+def fetch_simkl_details(simkl_id: int, item_type: str, workspace: Optional[Workspace] = None) -> Optional[Dict[str, Any]]:
     """
     Fetches detailed info (title, year) for a specific item by ID.
     item_type: 'movie' or 'show'
@@ -57,7 +59,7 @@ def fetch_simkl_details(simkl_id: int, item_type: str) -> Optional[Dict[str, Any
     url = f"{SIMKL_BASE_URL}/{segment}/{simkl_id}"
     
     try:
-        headers = get_headers()
+        headers = get_headers(workspace)
         response = requests.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
@@ -103,14 +105,14 @@ def normalize_simkl_item(item: Dict[str, Any], item_type: str = None) -> Dict[st
         
     return final_obj
 
-def fetch_history(limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+def fetch_history(limit: int = HISTORY_LIMIT, workspace: Optional[Workspace] = None) -> List[Dict[str, Any]]:
     """
     Fetches the user's watch history from Simkl.
     Note: Simkl 'sync/all-items/completed' returns all items.
     """
     logger.info("Fetching Simkl watch history...")
     
-    headers = get_headers()
+    headers = get_headers(workspace)
     if "Authorization" not in headers:
          logger.warning("No Simkl token found. History fetch might be limited or fail.")
          return []
@@ -142,6 +144,8 @@ def fetch_history(limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
              # Sometimes structure differs, let's debug if needed.
              # But /sync/all-items usually returns full objects
              pass
+         if movie.get("last_watched_at"):
+             norm["watched_at"] = movie["last_watched_at"]
          all_items.append(norm)
 
     for show in data.get("shows", []):
@@ -152,6 +156,8 @@ def fetch_history(limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
                  "ids": show.get("show", {}).get("ids", {})
              }
          }
+         if show.get("last_watched_at"):
+             norm["watched_at"] = show["last_watched_at"]
          all_items.append(norm)
          
     # Simkl returns everything. Slice to limit.
@@ -162,14 +168,14 @@ def fetch_history(limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
     logger.info(f"Fetched {len(all_items)} history items from Simkl.")
     return all_items[:limit]
 
-def fetch_candidates() -> List[Dict[str, Any]]:
+def fetch_candidates(workspace: Optional[Workspace] = None) -> List[Dict[str, Any]]:
     """
     Fetches movies and shows from Simkl.
     Prioritizes personalized recommendations if authenticated.
     Fallbacks to trending/popular if not.
     """
     logger.info("Fetching Simkl candidates...")
-    headers = get_headers()
+    headers = get_headers(workspace)
     candidates = []
     
     # Check if we are authenticated
@@ -197,7 +203,7 @@ def fetch_candidates() -> List[Dict[str, Any]]:
                     continue
 
                 # Fetch details to get title
-                details = fetch_simkl_details(simkl_id, "movie")
+                details = fetch_simkl_details(simkl_id, "movie", workspace)
                 if details:
                     candidates.append({
                         "movie": {
@@ -222,7 +228,7 @@ def fetch_candidates() -> List[Dict[str, Any]]:
                 if not simkl_id:
                     continue
 
-                details = fetch_simkl_details(simkl_id, "show")
+                details = fetch_simkl_details(simkl_id, "show", workspace)
                 if details:
                     candidates.append({
                         "show": {
@@ -239,23 +245,41 @@ def fetch_candidates() -> List[Dict[str, Any]]:
     logger.info(f"Fetched {len(candidates)} candidates from Simkl.")
     return candidates
 
-def main() -> None:
+def save_history(workspace: Optional[Workspace] = None) -> int:
+    """Fetches the Simkl history and writes it to the workspace history file."""
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    history = fetch_history(limit=HISTORY_LIMIT, workspace=ws)
+    write_json(ws.history_file, history)
+    update_crosswalk(history, ws)
+    logger.info(f"Saved {len(history)} history items to {ws.history_file.name}")
+    return len(history)
+
+def save_candidates(workspace: Optional[Workspace] = None) -> int:
+    """Fetches Simkl candidates and writes them to the workspace candidates file."""
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    candidates = fetch_candidates(ws)
+    write_json(ws.candidates_file, candidates)
+    update_crosswalk(candidates, ws)
+    logger.info(f"Saved {len(candidates)} candidates to {ws.candidates_file.name}")
+    return len(candidates)
+
+def main(workspace: Optional[Workspace] = None) -> None:
     try:
         # 1. Fetch History
-        history = fetch_history(limit=HISTORY_LIMIT)
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=2)
-        logger.info(f"Saved {len(history)} history items to {HISTORY_FILE.name}")
+        save_history(workspace)
         
         # 2. Fetch Candidates
-        candidates = fetch_candidates()
-        with open(CANDIDATES_FILE, "w") as f:
-            json.dump(candidates, f, indent=2)
-        logger.info(f"Saved {len(candidates)} candidates to {CANDIDATES_FILE.name}")
+        save_candidates(workspace)
+
+        # 3. Snapshot both, once they are on disk
+        write_snapshot(workspace)
 
     except Exception as e:
         logger.error(f"Detailed Error: {e}")
         raise e
 
 if __name__ == "__main__":
+    configure_logging()
     main()
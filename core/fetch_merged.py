@@ -0,0 +1,141 @@
+#!/usr/bin/env -S venv/bin/python
+"""
+Fetch Data Module (Trakt + Simkl)
+Retrieves watch history and candidates from both providers concurrently and
+merges them into one history/candidate store (SERVICE_PROVIDER = "both").
+
+Items are matched across providers through the id crosswalk
+(core/crosswalk.py): the merged history holds every watch event from both
+providers, newest first, minus Simkl records of watches Trakt already has,
+and the candidate pools are deduplicated by canonical key, keeping the
+union of both providers' ids. Both providers are
+fetched in parallel, so a merged fetch takes about as long as the slower one.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    HISTORY_LIMIT,
+    logger,
+    configure_logging
+)
+from core import fetch_data, fetch_data_simkl
+from core.crosswalk import Crosswalk, load_crosswalk, update_crosswalk
+from core.media import item_key, unwrap
+from core.serialization import write_json
+from core.snapshot import write_snapshot
+from core.workspace import Workspace
+
+Items = List[Dict[str, Any]]
+
+
+def fetch_both(trakt: Callable[[], Items], simkl: Callable[[], Items]) -> Tuple[Items, Items]:
+    """Runs one Trakt and one Simkl fetch concurrently; errors from either are raised."""
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="provider") as pool:
+        simkl_future = pool.submit(simkl)
+        trakt_items = trakt()
+        return trakt_items, simkl_future.result()
+
+
+def _key(item: Dict[str, Any], crosswalk: Crosswalk) -> Optional[str]:
+    return crosswalk.canonical_item(item) or item_key(item)
+
+
+def merge_history(trakt_history: Items, simkl_history: Items, crosswalk: Crosswalk) -> Items:
+    """
+    Every watch event of both histories, newest first by ``watched_at``
+    (events without one last), as binge detection and prompt sampling
+    expect. A Simkl record is dropped only when it is a watch Trakt already
+    has: the same title at the same minute, or no timestamp for a title
+    with Trakt events. Repeat watches of a title are all kept.
+    """
+    trakt_titles = set()
+    trakt_watches = set()
+    for item in trakt_history:
+        key = _key(item, crosswalk)
+        trakt_titles.add(key)
+        trakt_watches.add((key, (item.get("watched_at") or "")[:16]))
+    merged = list(trakt_history)
+    for item in simkl_history:
+        key = _key(item, crosswalk)
+        if key is not None:
+            minute = (item.get("watched_at") or "")[:16]
+            if (key, minute) in trakt_watches or (not minute and key in trakt_titles):
+                continue
+        merged.append(item)
+    # Stable, so events sharing a timestamp keep their provider order
+    merged.sort(key=lambda item: item.get("watched_at") or "", reverse=True)
+    return merged
+
+
+def merge_candidates(trakt_candidates: Items, simkl_candidates: Items, crosswalk: Crosswalk) -> Items:
+    """
+    Both candidate pools deduplicated by canonical key. The first listing of a
+    title wins (Trakt's carry genres); it gains the other provider's ids.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for item in trakt_candidates + simkl_candidates:
+        key = _key(item, crosswalk)
+        if key is None:
+            continue
+        kept = merged.get(key)
+        if kept is None:
+            merged[key] = item
+            continue
+        _, kept_obj = unwrap(kept)
+        _, obj = unwrap(item)
+        kept_obj["ids"] = {**(obj.get("ids") or {}), **(kept_obj.get("ids") or {})}
+    return list(merged.values())
+
+
+def save_history(workspace: Optional[Workspace] = None) -> int:
+    """Fetches both histories and writes the merged history to the workspace history file."""
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    trakt_history, simkl_history = fetch_both(
+        lambda: fetch_data.fetch_history(limit=HISTORY_LIMIT, workspace=ws),
+        lambda: fetch_data_simkl.fetch_history(limit=HISTORY_LIMIT, workspace=ws),
+    )
+    update_crosswalk(trakt_history + simkl_history, ws)
+    history = merge_history(trakt_history, simkl_history,
+                            load_crosswalk(ws, trakt_history, simkl_history))
+    write_json(ws.history_file, history)
+    logger.info(f"Saved {len(history)} merged history items to {ws.history_file.name} "
+                f"({len(trakt_history)} from Trakt, {len(history) - len(trakt_history)} only on Simkl)")
+    return len(history)
+
+
+def save_candidates(workspace: Optional[Workspace] = None) -> int:
+    """Fetches both candidate pools and writes the merged pool to the workspace candidates file."""
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    trakt_candidates, simkl_candidates = fetch_both(
+        lambda: fetch_data.fetch_candidates(ws),
+        lambda: fetch_data_simkl.fetch_candidates(ws),
+    )
+    update_crosswalk(trakt_candidates + simkl_candidates, ws)
+    candidates = merge_candidates(trakt_candidates, simkl_candidates,
+                                  load_crosswalk(ws, trakt_candidates, simkl_candidates))
+    write_json(ws.candidates_file, candidates)
+    logger.info(f"Saved {len(candidates)} unique candidates to {ws.candidates_file.name} "
+                f"({len(trakt_candidates)} from Trakt, {len(simkl_candidates)} from Simkl)")
+    return len(candidates)
+
+
+def main(workspace: Optional[Workspace] = None) -> None:
+    try:
+        # History and candidates are independent; fetch them side by side
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="fetch") as pool:
+            candidates = pool.submit(save_candidates, workspace)
+            save_history(workspace)
+            candidates.result()
+        write_snapshot(workspace)  # once both files are saved
+
+    except Exception as e:
+        logger.error(f"Detailed Error: {e}")
+        # Re-raise to let the caller (CLI) handle exit code
+        raise e
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
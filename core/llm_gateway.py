@@ -0,0 +1,276 @@
+"""
+LLM Gateway Module
+
+Single entry point for every call to the local OpenAI-compatible server.
+Owns one pooled client per process, per-call deadlines with retry/backoff,
+a semaphore sized to the server's parallel slots, and an optional
+warm-up/keep-alive ping that preloads the model before the LLM stage.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    API_BASE_URL, MODEL_NAME, API_KEY, TEMPERATURE,
+    LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF, LLM_PARALLEL_SLOTS,
+    EMBEDDING_MODEL, logger
+)
+from core import tracing
+
+
+class LLMGateway:
+    """Shared, rate-limited access to the local LLM server."""
+
+    def __init__(
+        self,
+        base_url: str = API_BASE_URL,
+        api_key: str = API_KEY,
+        model: str = MODEL_NAME,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff: float = LLM_RETRY_BACKOFF,
+        parallel_slots: int = LLM_PARALLEL_SLOTS,
+    ) -> None:
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.parallel_slots = max(1, parallel_slots)
+        self._slots = threading.BoundedSemaphore(self.parallel_slots)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._keep_alive: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def client(self):
+        """Lazily built OpenAI client; its HTTP connection pool is reused by every call."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    # Retries are handled here so they respect the per-call deadline
+                    self._client = OpenAI(
+                        base_url=self.base_url,
+                        api_key=self.api_key,
+                        timeout=self.timeout,
+                        max_retries=0,
+                    )
+        return self._client
+
+    def _retryable(self) -> tuple:
+        import openai
+        return (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+    def _with_retries(self, request: Callable[[float], Any], timeout: Optional[float]) -> Any:
+        """
+        Runs ``request(remaining_seconds)`` inside a parallel slot with retry/backoff.
+        Each attempt gets only the time left before the deadline.
+
+        Raises:
+            TimeoutError: If no parallel slot frees up before the deadline, or
+                the deadline has passed by the time the slot is acquired.
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        retryable = self._retryable()
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if not self._slots.acquire(timeout=max(remaining, 0)):
+                raise TimeoutError(f"No free LLM slot within {timeout or self.timeout:.0f}s")
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"LLM call exceeded its {timeout or self.timeout:.0f}s deadline")
+                result = request(remaining)
+                tracing.annotate(retries=attempt)
+                return result
+            except retryable as e:
+                attempt += 1
+                delay = self.backoff * (2 ** (attempt - 1))
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"LLM call failed ({e.__class__.__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            finally:
+                self._slots.release()
+            time.sleep(delay)
+
+    def chat(self, messages: List[Dict[str, Any]], model: Optional[str] = None,
+             temperature: float = TEMPERATURE, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """
+        Sends a chat completion request and returns the raw response.
+
+        Args:
+            messages: OpenAI-style message list.
+            model: Model override (defaults to the gateway model).
+            temperature: Sampling temperature.
+            timeout: Deadline in seconds for the whole call, including
+                waiting for a slot and any retries.
+            **kwargs: Passed through to ``chat.completions.create``.
+
+        Raises:
+            TimeoutError: If no parallel slot frees up before the deadline.
+        """
+        with tracing.span("llm chat", "llm", model=model or self.model) as span:
+            response = self._with_retries(
+                lambda remaining: self.client.chat.completions.create(
+                    model=model or self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=remaining,
+                    **kwargs
+                ),
+                timeout,
+            )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            return response
+
+    def _complete_streamed(self, messages: List[Dict[str, Any]], model: Optional[str] = None,
+                           temperature: float = TEMPERATURE, timeout: Optional[float] = None,
+                           **kwargs: Any) -> str:
+        """
+        ``complete`` over a streamed response, recording time to first token and
+        decode speed on the trace span. The slot is held until the stream ends.
+        Servers that don't report usage on streams are counted one token per chunk.
+        """
+        def request(remaining: float) -> Tuple[str, Optional[float], Any]:
+            stream = self.client.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                temperature=temperature,
+                timeout=remaining,
+                stream=True,
+                **kwargs
+            )
+            parts: List[str] = []
+            first_token: Optional[float] = None
+            usage = None
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(chunk.choices[0].delta.content)
+                usage = getattr(chunk, "usage", None) or usage
+            return "".join(parts), first_token, (usage, len(parts))
+
+        with tracing.span("llm complete", "llm", model=model or self.model, stream=True) as span:
+            start = time.perf_counter()
+            text, first_token, (usage, chunks) = self._with_retries(request, timeout)
+            end = time.perf_counter()
+            completion_tokens = usage.completion_tokens if usage is not None else chunks
+            if usage is not None:
+                span.set(prompt_tokens=usage.prompt_tokens)
+            span.set(completion_tokens=completion_tokens)
+            if first_token is not None:
+                decode = end - first_token
+                span.set(ttft_ms=round((first_token - start) * 1000, 1),
+                         tokens_per_s=round(completion_tokens / decode, 1) if decode > 0 else None)
+            return text
+
+    def embed(self, texts: List[str], model: Optional[str] = None,
+              timeout: Optional[float] = None) -> List[List[float]]:
+        """Embedding vectors for ``texts``, in input order (model defaults to EMBEDDING_MODEL)."""
+        with tracing.span("llm embed", "llm", model=model or EMBEDDING_MODEL or self.model, texts=len(texts)) as span:
+            response = self._with_retries(
+                lambda remaining: self.client.embeddings.create(
+                    model=model or EMBEDDING_MODEL or self.model,
+                    input=list(texts),
+                    timeout=remaining,
+                ),
+                timeout,
+            )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                span.set(prompt_tokens=usage.prompt_tokens)
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    def complete(self, prompt: str, stream: bool = False, **kwargs: Any) -> str:
+        """
+        Single user-prompt completion; returns the message text ('' if empty).
+
+        With ``stream`` the response is streamed and the trace span records
+        time to first token and tokens/s; the text is the same. Tracing never
+        changes the request that is sent.
+        """
+        if stream:
+            return self._complete_streamed([{"role": "user", "content": prompt}], **kwargs)
+        response = self.chat([{"role": "user", "content": prompt}], **kwargs)
+        return response.choices[0].message.content or ""
+
+    def list_models(self) -> List[str]:
+        """Model ids the server currently exposes."""
+        return [m.id for m in self.client.models.list().data]
+
+    def ping(self) -> bool:
+        """Minimal request that forces the server to load the model."""
+        try:
+            self.chat([{"role": "user", "content": "ping"}], temperature=0.0, max_tokens=1)
+            return True
+        except Exception as e:
+            logger.warning(f"LLM warm-up failed: {e}")
+            return False
+
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Preloads the model so the first real request does not pay load latency.
+
+        With ``background`` the ping runs on a daemon thread and the thread is
+        returned; otherwise it blocks until the ping completes.
+        """
+        logger.debug(f"Warming up {self.model} at {self.base_url}...")
+        if not background:
+            self.ping()
+            return None
+        thread = threading.Thread(target=self.ping, name="llm-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def start_keep_alive(self, interval: float) -> None:
+        """Pings the server every ``interval`` seconds so the model stays resident."""
+        if interval <= 0 or self._keep_alive is not None:
+            return
+        # A fresh event per loop: a ping still in flight from a loop stopped by
+        # close() can't keep running against the new one
+        stop = self._stop = threading.Event()
+
+        def _loop() -> None:
+            while not stop.wait(interval):
+                self.ping()
+
+        self._keep_alive = threading.Thread(target=_loop, name="llm-keep-alive", daemon=True)
+        self._keep_alive.start()
+
+    def close(self) -> None:
+        """Stops keep-alive pings and releases pooled connections. start_keep_alive can be called again."""
+        self._stop.set()
+        self._keep_alive = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Process-wide gateway shared by every LLM call site."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+def set_gateway(gateway: Optional[LLMGateway]) -> Optional[LLMGateway]:
+    """Installs ``gateway`` as the process-wide instance (e.g. a benchmark stand-in); returns the previous one."""
+    global _gateway
+    with _gateway_lock:
+        previous, _gateway = _gateway, gateway
+    return previous
@@ -0,0 +1,199 @@
+"""
+Mark Sync Module
+
+Marks titles watched on several providers at once (``cli.py mark
+--providers trakt,simkl``). Each title is resolved once: Trakt search
+results carry trakt/imdb/tmdb/tvdb ids, which Simkl's sync endpoint accepts
+too, and titles Trakt can't find fall back to Simkl search. Every provider
+then gets one batched /sync/history payload, all posted in parallel.
+
+Failures the server can't have acted on (429, and connections that failed
+before the request went out) are retried for the failing provider only,
+with backoff, so one provider's outage never re-sends to the other. A
+timeout or 5xx is not retried: history POSTs are additive, so if the server
+handled the request anyway a retry would record a second play. Each
+provider gets its own report: what was marked, what it didn't recognize,
+how many attempts it took.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from config import MARK_RETRIES, MARK_RETRY_BACKOFF, SIMKL_BASE_URL, TRAKT_BASE_URL, logger
+from core import tracing
+from core.workspace import Workspace
+
+MARK_PROVIDERS = ("trakt", "simkl")
+# Ids each provider's /sync/history matches on
+PROVIDER_IDS = {
+    "trakt": ("trakt", "slug", "imdb", "tmdb", "tvdb"),
+    "simkl": ("simkl", "imdb", "tmdb", "tvdb"),
+}
+
+
+class SyncError(RuntimeError):
+    """A provider sync that failed for good, after ``attempts`` tries."""
+
+    def __init__(self, message: str, attempts: int) -> None:
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class ProviderReport(NamedTuple):
+    """Outcome of one provider's sync."""
+    provider: str
+    ok: bool
+    marked: List[Dict[str, Any]]  # resolved items the provider accepted
+    not_found: List[Dict[str, Any]]  # items it reported unknown or had no usable id for
+    attempts: int
+    error: Optional[str] = None
+
+
+def label(item: Dict[str, Any]) -> str:
+    return f"{item['title']} ({item['year']})" if item.get("year") else item["title"]
+
+
+def resolve_titles(titles: Sequence[str], providers: Sequence[str],
+                   workspace: Optional[Workspace] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Searches each title once. Returns the matches ({"type", "title", "year",
+    "ids"}, one per distinct title) and the titles nothing matched.
+    """
+    from core import mark_watched, mark_watched_simkl
+
+    found: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    missing = []
+    for title in titles:
+        match = mark_watched.search_item(title, workspace=workspace) if "trakt" in providers else None
+        if match is None and "simkl" in providers:
+            match = mark_watched_simkl.search_item(title, workspace)
+        if match is None:
+            missing.append(title)
+            continue
+        ids = match["ids"]
+        key = next(((source, str(ids[source])) for source in ("trakt", "simkl", "imdb") if ids.get(source)),
+                   (match["type"], label(match)))
+        found.setdefault(key, match)
+    return list(found.values()), missing
+
+
+def build_payload(provider: str, items: Sequence[Dict[str, Any]]) -> Tuple[Dict[str, List[Dict[str, Any]]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """The provider's /sync/history payload, the items in it and the items without a usable id."""
+    accepted = PROVIDER_IDS[provider]
+    payload: Dict[str, List[Dict[str, Any]]] = {"movies": [], "shows": []}
+    sent, skipped = [], []
+    for item in items:
+        ids = {source: item["ids"][source] for source in accepted if item["ids"].get(source)}
+        if not ids:
+            skipped.append(item)
+            continue
+        payload[f"{item['type']}s"].append({"ids": ids})
+        sent.append(item)
+    return payload, sent, skipped
+
+
+def get_headers(provider: str, workspace: Optional[Workspace] = None) -> Dict[str, str]:
+    if provider == "trakt":
+        from core.mark_watched import get_headers as trakt_headers
+        return trakt_headers(workspace)
+    from core.fetch_data_simkl import get_headers as simkl_headers
+    headers = simkl_headers(workspace)
+    if "Authorization" not in headers:
+        raise PermissionError("No Simkl token found. Run 'cli.py auth-simkl' first.")
+    return headers
+
+
+def never_sent(error: requests.exceptions.RequestException) -> bool:
+    """Whether ``error`` happened before the request reached the server (connect failures only)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)  # unwrap urllib3's MaxRetryError
+
+
+def post_history(provider: str, payload: Dict[str, Any], workspace: Optional[Workspace] = None,
+                 retries: int = MARK_RETRIES, backoff: float = MARK_RETRY_BACKOFF) -> Tuple[Dict[str, Any], int]:
+    """
+    POSTs ``payload`` to the provider's /sync/history, retrying 429 and
+    connections that failed before the request was sent. Returns (response
+    JSON, attempts).
+
+    Raises:
+        SyncError: On a non-retryable error or once ``retries`` attempts
+            have failed.
+    """
+    url = f"{TRAKT_BASE_URL if provider == 'trakt' else SIMKL_BASE_URL}/sync/history"
+    headers = get_headers(provider, workspace)
+    for attempt in range(1, retries + 1):
+        delay = backoff * 2 ** (attempt - 1)
+        try:
+            response = requests.post(url, headers=headers, json=payload)
+            if response.status_code != 429:
+                response.raise_for_status()
+                return response.json(), attempt
+            error = f"HTTP {response.status_code}"
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.replace(".", "", 1).isdigit() else delay
+        except requests.exceptions.RequestException as e:
+            if not never_sent(e):
+                raise SyncError(str(e), attempt) from e
+            error = str(e)
+        except ValueError as e:
+            raise SyncError(str(e), attempt) from e
+        if attempt == retries:
+            raise SyncError(error, attempt)
+        logger.warning(f"{provider} sync failed ({error}), retrying in {delay:.1f}s ({attempt}/{retries})")
+        time.sleep(delay)
+    raise SyncError("no attempts made", 0)
+
+
+def _not_found(response: Dict[str, Any], items: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Items whose ids appear in the response's ``not_found`` section."""
+    unknown = set()
+    for kind in ("movies", "shows"):
+        for entry in (response.get("not_found") or {}).get(kind) or []:
+            unknown.update((source, str(value)) for source, value in (entry.get("ids") or {}).items())
+    return [item for item in items
+            if any((source, str(value)) in unknown for source, value in item["ids"].items())]
+
+
+def sync_provider(provider: str, items: Sequence[Dict[str, Any]],
+                  workspace: Optional[Workspace] = None) -> ProviderReport:
+    """Marks ``items`` on one provider. Never raises; failures land in the report."""
+    payload, sent, skipped = build_payload(provider, items)
+    if not sent:
+        return ProviderReport(provider, True, [], skipped, 0)
+    logger.info(f"Marking {len(payload['movies'])} movies and {len(payload['shows'])} shows as watched on {provider}...")
+    with tracing.span(f"mark {provider}", "mark", items=len(sent)) as span:
+        try:
+            response, attempts = post_history(provider, payload, workspace)
+        except Exception as e:
+            # Credentials errors fail before the first attempt
+            attempts = e.attempts if isinstance(e, SyncError) else 0
+            logger.error(f"Failed to mark watched on {provider}: {e}")
+            span.set(error=str(e), attempts=attempts)
+            return ProviderReport(provider, False, [], skipped, attempts, str(e))
+        not_found = _not_found(response, sent)
+        span.set(attempts=attempts, not_found=len(not_found))
+    marked = [item for item in sent if item not in not_found]
+    return ProviderReport(provider, True, marked, skipped + not_found, attempts)
+
+
+def mark_titles(titles: Sequence[str], providers: Sequence[str] = MARK_PROVIDERS,
+                workspace: Optional[Workspace] = None) -> Tuple[List[ProviderReport], List[str]]:
+    """
+    Resolves ``titles`` once and marks them on every provider in parallel.
+    Returns one report per provider (in ``providers`` order) and the titles
+    that could not be found.
+    """
+    items, missing = resolve_titles(titles, providers, workspace)
+    if not items:
+        return [ProviderReport(provider, True, [], [], 0) for provider in providers], missing
+    with ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="mark") as pool:
+        reports = list(pool.map(lambda provider: sync_provider(provider, items, workspace), providers))
+    return reports, missing
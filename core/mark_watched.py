@@ -1,26 +1,29 @@
 #!/usr/bin/env -S venv/bin/python
 import requests
-import json
 import time
 from typing import Dict, List, Optional, Tuple, Any
 
 from config import (
     TRAKT_BASE_URL,
-    TOKEN_FILE,
-    SECRETS_FILE,
-    logger
+    logger,
+    configure_logging
 )
+from core import tracing
+from core.crosswalk import update_crosswalk
+from core.media import media_key
+from core.serialization import read_json
+from core.workspace import Workspace
 
-def get_headers() -> Dict[str, str]:
+def get_headers(workspace: Optional[Workspace] = None) -> Dict[str, str]:
     """Constructs Trakt API headers."""
-    if not TOKEN_FILE.exists() or not SECRETS_FILE.exists():
+    ws = workspace or Workspace.default()
+    if not ws.token_file.exists() or not ws.secrets_file.exists():
         logger.error("Missing auth files.")
         raise FileNotFoundError("Run exchange_pin.py first.")
 
-    with open(TOKEN_FILE, "r") as f:
-        token = json.load(f)
-    with open(SECRETS_FILE, "r") as f:
-        secrets = json.load(f)
+    with tracing.span("read credentials", "io"):
+        token = read_json(ws.token_file)
+        secrets = read_json(ws.secrets_file)
         
     return {
         "Content-Type": "application/json",
@@ -29,13 +32,23 @@ def get_headers() -> Dict[str, str]:
         "trakt-api-key": secrets["client_id"]
     }
 
-def search_id(title_input: str, type_hint: Optional[str] = None) -> Tuple[Optional[int], Optional[str]]:
+def search_id(title_input: str, type_hint: Optional[str] = None, workspace: Optional[Workspace] = None) -> Tuple[Optional[int], Optional[str]]:
     """
     Search for a movie or show by title.
     Supports 'type:Title' syntax (e.g. 'show:Stranger Things').
     Supports 'Title (Year)' syntax to filter by year.
     Returns (trakt_id, type) or (None, None).
     """
+    match = search_item(title_input, type_hint, workspace)
+    if match:
+        return match["ids"]["trakt"], match["type"]
+    return None, None
+
+def search_item(title_input: str, type_hint: Optional[str] = None, workspace: Optional[Workspace] = None) -> Optional[Dict[str, Any]]:
+    """
+    Like search_id, but returns the whole match as
+    {"type", "title", "year", "ids"} (every id Trakt knows), or None.
+    """
     # Parse prefixes
     if title_input.lower().startswith("movie:"):
         type_hint = "movie"
@@ -57,7 +70,7 @@ def search_id(title_input: str, type_hint: Optional[str] = None) -> Tuple[Option
     logger.info(f"Searching for '{clean_title}'" + (f" (Year: {target_year})" if target_year else "") + (f" [Type: {type_hint}]" if type_hint else "") + "...")
     
     types = [type_hint] if type_hint else ["movie", "show"]
-    headers = get_headers()
+    headers = get_headers(workspace)
     
     for t in types:
         # Trakt search works best with just the title
@@ -66,6 +79,7 @@ def search_id(title_input: str, type_hint: Optional[str] = None) -> Tuple[Option
             resp = requests.get(url, headers=headers)
             if resp.status_code == 200:
                 results = resp.json()
+                update_crosswalk(results, workspace)  # search results carry every id of a title
                 if results:
                     # If year is specified, look for a match
                     match = None
@@ -88,17 +102,17 @@ def search_id(title_input: str, type_hint: Optional[str] = None) -> Tuple[Option
 
                     if match:
                         logger.info(f"Found: {match['title']} ({match.get('year')}) [ID: {match['ids']['trakt']}]")
-                        return match['ids']['trakt'], t
+                        return {"type": t, "title": match["title"], "year": match.get("year"), "ids": match["ids"]}
         except requests.exceptions.RequestException as e:
             logger.error(f"Search failed for {title_input}: {e}")
             
     logger.warning(f"'{title_input}' not found.")
-    return None, None
+    return None
 
-def mark_watched_ids(movies: List[int], shows: List[int]) -> None:
-    """Marks the given lists of Trakt IDs as watched."""
+def mark_watched_ids(movies: List[int], shows: List[int], workspace: Optional[Workspace] = None) -> bool:
+    """Marks the given lists of Trakt IDs as watched. Returns True if the sync succeeded."""
     if not movies and not shows:
-        return
+        return False
         
     url = f"{TRAKT_BASE_URL}/sync/history"
     payload = {
@@ -109,7 +123,7 @@ def mark_watched_ids(movies: List[int], shows: List[int]) -> None:
     logger.info(f"Marking {len(movies)} movies and {len(shows)} shows as watched...")
     
     try:
-        response = requests.post(url, headers=get_headers(), json=payload)
+        response = requests.post(url, headers=get_headers(workspace), json=payload)
         response.raise_for_status()
         
         data = response.json()
@@ -119,28 +133,35 @@ def mark_watched_ids(movies: List[int], shows: List[int]) -> None:
         # Wait for sync
         logger.info("Waiting 2s for Trakt sync...")
         time.sleep(2)
+        return True
         
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to mark watched: {e}")
+        return False
 
-def process_titles(titles: List[str]) -> None:
+def process_titles(titles: List[str], workspace: Optional[Workspace] = None) -> List[str]:
     """
     Main logic: Resolve titles to IDs and mark them.
+    Returns the typed keys (e.g. 'movie:trakt:1') of the marked items.
     """
     movies_to_mark = []
     shows_to_mark = []
     
     for title in titles:
-        tid, type_found = search_id(title)
+        tid, type_found = search_id(title, workspace=workspace)
         if tid:
             if type_found == "movie":
                 movies_to_mark.append(tid)
             else:
                 shows_to_mark.append(tid)
                 
-    mark_watched_ids(movies_to_mark, shows_to_mark)
+    if not mark_watched_ids(movies_to_mark, shows_to_mark, workspace):
+        return []
+    return ([media_key("movie", "trakt", tid) for tid in movies_to_mark]
+            + [media_key("show", "trakt", tid) for tid in shows_to_mark])
 
 if __name__ == "__main__":
+    configure_logging()
     import sys
     if len(sys.argv) < 2:
         print("Usage: python mark_watched.py 'Title 1' 'Title 2'")
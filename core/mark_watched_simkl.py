@@ -10,16 +10,20 @@ from typing import List, Dict, Any, Optional
 
 from config import (
     SIMKL_BASE_URL,
-    logger
+    logger,
+    configure_logging
 )
+from core.crosswalk import update_crosswalk
 from core.fetch_data_simkl import get_headers
+from core.media import item_key
+from core.workspace import Workspace
 
-def search_item(title: str) -> Optional[Dict[str, Any]]:
+def search_item(title: str, workspace: Optional[Workspace] = None) -> Optional[Dict[str, Any]]:
     """
     Search for a movie or show by title on Simkl.
     Returns the best match (first result) with an ID.
     """
-    headers = get_headers()
+    headers = get_headers(workspace)
     encoded_title = urllib.parse.quote(title)
     
     # Try Movie Search
@@ -28,6 +32,7 @@ def search_item(title: str) -> Optional[Dict[str, Any]]:
         resp = requests.get(url_movie, headers=headers)
         if resp.status_code == 200 and resp.json():
             item = resp.json()[0]
+            update_crosswalk([{"movie": item}], workspace)
             return {"type": "movie", "title": item["title"], "year": item["year"], "ids": item["ids"]}
     except Exception as e:
         logger.warning(f"Search error (movie): {e}")
@@ -38,17 +43,18 @@ def search_item(title: str) -> Optional[Dict[str, Any]]:
         resp = requests.get(url_tv, headers=headers)
         if resp.status_code == 200 and resp.json():
             item = resp.json()[0]
+            update_crosswalk([{"show": item}], workspace)
             return {"type": "show", "title": item["title"], "year": item["year"], "ids": item["ids"]}
     except Exception as e:
         logger.warning(f"Search error (tv): {e}")
         
     return None
 
-def mark_as_watched(item: Dict[str, Any]) -> bool:
+def mark_as_watched(item: Dict[str, Any], workspace: Optional[Workspace] = None) -> bool:
     """
     Marks the given item as watched on Simkl.
     """
-    headers = get_headers()
+    headers = get_headers(workspace)
     if "Authorization" not in headers:
         logger.error("Authentication required to mark items as watched.")
         return False
@@ -80,29 +86,37 @@ def mark_as_watched(item: Dict[str, Any]) -> bool:
         logger.error(f"Failed to mark as watched: {e}")
         return False
 
-def process_titles(titles: List[str]) -> None:
+def process_titles(titles: List[str], workspace: Optional[Workspace] = None) -> List[str]:
     """
     Process a list of titles: search and mark as watched.
+    Returns the typed keys (e.g. 'movie:simkl:1') of the items that were marked.
     """
     logger.info(f"Processing {len(titles)} items for Simkl...")
+    marked = []
     
     for title in titles:
         # Check if it has a year
         # Basic logic, can be improved
         logger.info(f"Searching for: {title}")
-        match = search_item(title)
+        match = search_item(title, workspace)
         
         if match:
             logger.info(f"Found: {match['title']} ({match['year']}) [{match['type']}]")
-            success = mark_as_watched(match)
+            success = mark_as_watched(match, workspace)
             if success:
                 logger.info(f"Successfully marked '{match['title']}' as watched.")
+                key = item_key({match["type"]: {"ids": match["ids"]}})
+                if key:
+                    marked.append(key)
             else:
                 logger.warning(f"Could not mark '{match['title']}' as watched (might be already watched).")
         else:
             logger.error(f"Could not find match for: {title}")
+    
+    return marked
 
 if __name__ == "__main__":
+    configure_logging()
     import sys
     if len(sys.argv) > 1:
         process_titles(sys.argv[1:])
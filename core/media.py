@@ -0,0 +1,192 @@
+"""
+Media Model
+
+One normalized representation of provider items, built once at load time
+instead of every consumer walking ``{"movie": {...}}`` / ``{"show": {...}}``
+dicts again:
+
+- MediaItem: a movie or show with a typed key, its provider ids, title,
+  year, genres and runtime.
+- HistoryEvent: one watch of a MediaItem (watch time, episode, runtime).
+
+Both are NamedTuples (no per-instance ``__dict__``). A MediaPool shares one MediaItem between all events
+of the same title and interns titles and genre tuples, so a 100k-event
+history holds one small object per distinct title plus one per event.
+
+Keys are typed: ``"movie:trakt:1"`` and ``"show:trakt:1"`` are different
+titles, so movie and show ids from the same provider cannot collide.
+"""
+import sys
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+ID_PRIORITY = ("trakt", "simkl", "imdb")  # Provider id a key is built from, first present wins
+
+
+def unwrap(item: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """(kind, inner movie/show object) of a provider item, or (None, None)."""
+    if "movie" in item:
+        return "movie", item["movie"]
+    if "show" in item:
+        return "show", item["show"]
+    return None, None
+
+
+def pick_id(ids: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """(source, id) by ID_PRIORITY, falling back to the first id present."""
+    for source in ID_PRIORITY:
+        if source in ids:
+            return source, str(ids[source])
+    for source, value in ids.items():
+        return source, str(value)
+    return None
+
+
+def media_key(kind: str, source: str, value: Any) -> str:
+    """Typed key of a title, e.g. 'movie:trakt:1'."""
+    return f"{kind}:{source}:{value}"
+
+
+def is_media_key(value: Any) -> bool:
+    """Whether ``value`` is a typed key ('movie:trakt:1') rather than a bare provider id."""
+    if not isinstance(value, str):
+        return False
+    parts = value.split(":", 2)
+    return len(parts) == 3 and parts[0] in ("movie", "show") and all(parts)
+
+
+def item_key(item: Dict[str, Any]) -> Optional[str]:
+    """Typed key of a raw provider item without building a MediaItem (None without ids)."""
+    kind, obj = unwrap(item)
+    if obj is None:
+        return None
+    picked = pick_id(obj.get("ids") or {})
+    return media_key(kind, *picked) if picked else None
+
+
+_new = tuple.__new__  # builds the NamedTuples below without a Python-level __new__ call
+
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+class MediaItem(NamedTuple):
+    """A movie or show."""
+    kind: str  # "movie" or "show"
+    key: str  # typed key, e.g. "movie:trakt:1"
+    ids: Dict[str, Any]  # provider ids as received
+    title: str
+    year: int  # 0 when unknown
+    genres: Tuple[str, ...]
+    runtime: int  # minutes, 0 when unknown
+
+    @property
+    def label(self) -> str:
+        """'Title (Year)', or just the title without a year."""
+        return f"{self.title} ({self.year})" if self.year else self.title
+
+    @property
+    def trakt_id(self) -> Optional[int]:
+        value = self.ids.get("trakt")
+        return int(value) if value is not None else None
+
+
+class HistoryEvent(NamedTuple):
+    """One watch of a movie or episode."""
+    media: MediaItem  # shared by every event of the same title
+    watched_at: str  # ISO-8601 UTC, '' when unknown
+    season: Optional[int]
+    number: Optional[int]  # episode number
+    runtime: int  # episode runtime for shows, falling back to the show's
+    event_id: Any = None  # provider history id (Trakt), if any
+
+
+class MediaPool:
+    """
+    Interning tables for one load: one MediaItem per key, shared genre tuples
+    and interned title strings.
+    """
+
+    __slots__ = ("media", "_genres")
+
+    def __init__(self) -> None:
+        self.media: Dict[str, MediaItem] = {}
+        self._genres: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def media_for(self, item: Dict[str, Any]) -> Optional[MediaItem]:
+        """The MediaItem of a raw provider item (None if it is neither movie nor show)."""
+        if "movie" in item:
+            kind, obj = "movie", item["movie"]
+        elif "show" in item:
+            kind, obj = "show", item["show"]
+        else:
+            return None
+        ids = obj.get("ids") or {}
+        if "trakt" in ids:
+            key = f"{kind}:trakt:{ids['trakt']}"
+        else:
+            picked = pick_id(ids)
+            # Titles without ids are keyed by name so repeat watches still share one item
+            key = (media_key(kind, *picked) if picked
+                   else media_key(kind, "title", (obj.get("title") or "Unknown").strip().lower()))
+        media = self.media.get(key)
+        if media is None:
+            media = self.media[key] = self._build(kind, key, ids, obj)
+        return media
+
+    def _build(self, kind: str, key: str, ids: Dict[str, Any], obj: Dict[str, Any]) -> MediaItem:
+        genres = obj.get("genres") or ()
+        shared = self._genres.get(tuple(genres))
+        if shared is None:
+            shared = tuple(map(sys.intern, genres))
+            self._genres[shared] = shared
+        year = obj.get("year")
+        runtime = obj.get("runtime")
+        return _new(MediaItem, (
+            kind, key, ids, sys.intern(obj.get("title") or "Unknown"),
+            year if type(year) is int else _to_int(year),
+            shared,
+            runtime if type(runtime) is int else _to_int(runtime),
+        ))
+
+
+def load_media(items: Iterable[Dict[str, Any]], pool: Optional[MediaPool] = None) -> List[MediaItem]:
+    """MediaItems of raw candidate/list items, in order; non-media entries are skipped."""
+    pool = pool or MediaPool()
+    result = []
+    for item in items:
+        media = pool.media_for(item)
+        if media is not None:
+            result.append(media)
+    return result
+
+
+def load_history(items: Iterable[Dict[str, Any]], pool: Optional[MediaPool] = None) -> List[HistoryEvent]:
+    """HistoryEvents of raw Trakt/Simkl history items, in order; non-media entries are skipped."""
+    pool = pool or MediaPool()
+    media_for = pool.media_for
+    events = []
+    append = events.append
+    for item in items:
+        media = media_for(item)
+        if media is None:
+            continue
+        episode = item.get("episode")
+        if episode:
+            runtime = episode.get("runtime")
+            runtime = (runtime if type(runtime) is int else _to_int(runtime)) or media.runtime
+            season, number = episode.get("season"), episode.get("number")
+        else:
+            runtime, season, number = media.runtime, None, None
+        append(_new(HistoryEvent, (media, item.get("watched_at") or "", season, number, runtime, item.get("id"))))
+    return events
+
+
+def as_events(history: Sequence[Union[Dict[str, Any], HistoryEvent]]) -> Sequence[HistoryEvent]:
+    """``history`` as HistoryEvents, converting raw provider dicts if needed."""
+    if history and isinstance(history[0], HistoryEvent):
+        return history  # type: ignore[return-value]
+    return load_history(history)  # type: ignore[arg-type]
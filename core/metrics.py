@@ -0,0 +1,235 @@
+"""
+Metrics Module
+
+Prometheus metrics for scheduled runs and the service, derived from the
+tracing spans (core/tracing.py) so every instrumented call site feeds
+both. ``enable()`` registers the span listener; afterwards
+
+- ``cli.py --metrics-file PATH <command>`` (or METRICS_TEXTFILE) writes the
+  registry in the text exposition format for node_exporter's textfile
+  collector when the command ends, and
+- ``cli.py serve`` exposes the same registry at ``GET /metrics``.
+
+Exported series (prefix ``trakt_agent_``):
+
+    http_requests_total{endpoint,method,status}       counter
+    http_errors_total{endpoint,kind}                   counter  kind: rate_limited, server, client, exception
+    http_request_duration_seconds{endpoint}            histogram
+    http_response_bytes_total{endpoint}                counter
+    llm_request_duration_seconds{call}                 histogram
+    llm_time_to_first_token_seconds                    histogram (streamed calls only)
+    llm_tokens_total{type}                             counter  type: prompt, completion
+    llm_errors_total{call}                             counter
+    stage_duration_seconds{stage,user}                 histogram
+    stage_runs_total{stage,user,status}                counter
+    candidates{state}                                  gauge    state: fetched, valid, watched, duplicate, genre, blocklist, year
+    run_last_timestamp_seconds{command}                gauge
+    run_last_success{command}                          gauge
+    run_duration_seconds{command}                      gauge
+"""
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import logger
+from core import tracing
+
+PREFIX = "trakt_agent_"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """One metric family; samples are keyed by their label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = PREFIX + name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        super().__init__(name, help_text)
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DURATION_BUCKETS) -> None:
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        # label key -> (per-bucket counts, sum, count)
+        self.values: Dict[LabelKey, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {n}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """The agent's metric families."""
+
+    def __init__(self) -> None:
+        self.http_requests = Counter("http_requests_total", "Provider API requests by endpoint and status.")
+        self.http_errors = Counter("http_errors_total", "Failed provider API requests by endpoint and kind.")
+        self.http_duration = Histogram("http_request_duration_seconds", "Provider API request latency.")
+        self.http_bytes = Counter("http_response_bytes_total", "Provider API response bytes.")
+        self.llm_duration = Histogram("llm_request_duration_seconds", "LLM call latency including queueing and retries.")
+        self.llm_ttft = Histogram("llm_time_to_first_token_seconds", "Time to the first streamed token.")
+        self.llm_tokens = Counter("llm_tokens_total", "LLM tokens by type.")
+        self.llm_errors = Counter("llm_errors_total", "Failed LLM calls.")
+        self.stage_duration = Histogram("stage_duration_seconds", "Pipeline stage duration.")
+        self.stage_runs = Counter("stage_runs_total", "Pipeline stage runs by outcome.")
+        self.candidates = Gauge("candidates", "Candidates in the last filter pass by state.")
+        self.run_timestamp = Gauge("run_last_timestamp_seconds", "Unix time the last CLI run finished.")
+        self.run_success = Gauge("run_last_success", "1 if the last CLI run succeeded, else 0.")
+        self.run_duration = Gauge("run_duration_seconds", "Duration of the last CLI run.")
+
+    def families(self) -> List[Metric]:
+        return [m for m in vars(self).values() if isinstance(m, Metric)]
+
+    def observe_span(self, span: tracing.Span) -> None:
+        """Updates the metrics a finished span maps to."""
+        attrs = span.attrs
+        if span.category == "http":
+            endpoint = attrs.get("endpoint", span.name)
+            status = attrs.get("status")
+            self.http_requests.inc(endpoint=endpoint, method=attrs.get("method", ""), status=status or "error")
+            self.http_duration.observe(span.duration, endpoint=endpoint)
+            self.http_bytes.inc(attrs.get("bytes") or 0, endpoint=endpoint)
+            kind = ("exception" if status is None else "rate_limited" if status == 429
+                    else "server" if status >= 500 else "client" if status >= 400 else None)
+            if kind:
+                self.http_errors.inc(endpoint=endpoint, kind=kind)
+        elif span.category == "llm":
+            self.llm_duration.observe(span.duration, call=span.name)
+            for kind in ("prompt", "completion"):
+                tokens = attrs.get(f"{kind}_tokens")
+                if tokens:
+                    self.llm_tokens.inc(tokens, type=kind)
+            if attrs.get("ttft_ms") is not None:
+                self.llm_ttft.observe(attrs["ttft_ms"] / 1000)
+            if "error" in attrs:
+                self.llm_errors.inc(call=span.name)
+        elif span.category == "stage":
+            labels = {"stage": span.name, "user": attrs.get("user", "")}
+            status = "failed" if "error" in attrs else attrs.get("status", "ran")
+            if status == "ran":
+                self.stage_duration.observe(span.duration, **labels)
+            self.stage_runs.inc(status=status, **labels)
+        elif span.category == "filter":
+            self.candidates.set(attrs.get("candidates", 0), state="fetched")
+            for state in ("valid", "watched", "duplicate", "genre", "blocklist", "year"):
+                self.candidates.set(attrs.get(state, 0), state=state)
+
+    def record_run(self, command: str, ok: bool, seconds: float) -> None:
+        self.run_timestamp.set(time.time(), command=command)
+        self.run_success.set(1 if ok else 0, command=command)
+        self.run_duration.set(seconds, command=command)
+
+    def render(self) -> str:
+        """The registry in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for family in self.families():
+            samples = family.render()
+            if samples:
+                lines += family.header() + samples
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+_enabled = False
+
+
+def enable() -> Registry:
+    """Starts feeding finished spans into REGISTRY (idempotent)."""
+    global _enabled
+    if not _enabled:
+        tracing.add_listener(REGISTRY.observe_span)
+        _enabled = True
+    return REGISTRY
+
+
+def write_textfile(path, registry: Optional[Registry] = None) -> None:
+    """
+    Writes the registry for the node_exporter textfile collector.
+
+    The file is written next to ``path`` and renamed into place, so the
+    collector never reads a half-written file.
+    """
+    registry = registry or REGISTRY
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(registry.render())
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    logger.debug(f"Wrote metrics to {path}")
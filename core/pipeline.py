@@ -0,0 +1,249 @@
+"""
+Pipeline Module
+
+Single 'cli.py run' pipeline with content-addressed stage caching and
+concurrent stage execution.
+
+Stages form a dependency graph rather than a fixed sequence:
+
+    fetch-history ──→ profile ──┐
+          │                     ├──→ recommend
+    fetch-candidates ───────────┘
+
+Profile generation only needs history, so it runs on the LLM while the
+candidate pools are still downloading; recommend waits for all three. Wall
+time therefore approaches the longest chain instead of the sum of stages.
+
+After a stage completes, the hashes of its input files and of the model
+configuration are recorded in the workspace's stage cache; on the next run
+the stage is skipped when those hashes and its outputs are unchanged.
+Unchanged history therefore never triggers a new LLM profile generation,
+and a run where only the candidate pool moved only re-runs recommend.
+"""
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import (
+    API_BASE_URL, MODEL_NAME, TEMPERATURE,
+    PROFILE_ANALYSIS_LIMIT, PROFILE_CHUNK_SIZE, PROFILE_REDUCE_FANIN,
+    CANDIDATE_LIMIT, NUM_RECOMMENDATIONS,
+    PIPELINE_WORKERS, logger
+)
+from core import tracing
+from core.crosswalk import crosswalk_path
+from core.serialization import read_json, write_json
+from core.workspace import Workspace
+
+STAGES = ("fetch-history", "fetch-candidates", "profile", "recommend")
+FETCH_STAGES = ("fetch-history", "fetch-candidates")
+DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "fetch-history": (),
+    "fetch-candidates": (),
+    "profile": ("fetch-history",),
+    "recommend": ("fetch-history", "fetch-candidates", "profile"),
+}
+CACHE_FILE_NAME = "stage_cache.json"
+
+
+class StageResult(NamedTuple):
+    stage: str
+    status: str  # "ran", "skipped", "failed" or "blocked"
+    seconds: float
+    reason: str = ""
+    started: float = 0.0  # offset from the start of the run
+
+
+def hash_file(path) -> str:
+    """SHA-256 of a file's contents, or 'missing'."""
+    import hashlib  # deferred: run's startup budget (scripts/startup_check.py)
+
+    if not path.exists():
+        return "missing"
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_value(value: Any) -> str:
+    """SHA-256 of a JSON-serializable value."""
+    import hashlib
+
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def stage_inputs(stage: str, workspace: Workspace, seed_items: Sequence[str] = ()) -> Dict[str, str]:
+    """Input hashes that decide whether ``stage`` must re-run."""
+    model = {"base_url": API_BASE_URL, "model": MODEL_NAME, "temperature": TEMPERATURE}
+    if stage == "profile":
+        return {
+            "history": hash_file(workspace.history_file),
+            "preferences": hash_file(workspace.preferences_file),
+            "model": hash_value({**model, "analysis_limit": PROFILE_ANALYSIS_LIMIT,
+                                 "chunk_size": PROFILE_CHUNK_SIZE, "fan_in": PROFILE_REDUCE_FANIN}),
+        }
+    if stage == "recommend":
+        return {
+            "history": hash_file(workspace.history_file),
+            "candidates": hash_file(workspace.candidates_file),
+            "crosswalk": hash_file(crosswalk_path(workspace)),
+            "preferences": hash_file(workspace.preferences_file),
+            "profile": hash_file(workspace.profile_file),
+            "model": hash_value({**model, "candidates": CANDIDATE_LIMIT, "count": NUM_RECOMMENDATIONS}),
+            "seeds": hash_value(list(seed_items)),
+        }
+    # fetch stages read remote state, which cannot be hashed up front
+    return {}
+
+
+def stage_outputs(stage: str, workspace: Workspace) -> Dict[str, str]:
+    """Output hashes; a stage whose outputs were deleted or edited re-runs."""
+    if stage == "fetch-history":
+        return {"history": hash_file(workspace.history_file)}
+    if stage == "fetch-candidates":
+        return {"candidates": hash_file(workspace.candidates_file)}
+    if stage == "profile":
+        return {"profile": hash_file(workspace.profile_file),
+                "markdown": hash_file(workspace.profile_markdown_file)}
+    if stage == "recommend":
+        return {"recommendations": hash_file(workspace.recommendations_file)}
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+class StageCache:
+    """Per-workspace record of the inputs and outputs of each completed stage (thread-safe)."""
+
+    def __init__(self, workspace: Workspace) -> None:
+        self.path = workspace.data_dir / CACHE_FILE_NAME
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                self.entries = read_json(self.path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable stage cache {self.path}: {e}")
+
+    def is_fresh(self, stage: str, inputs: Dict[str, str], outputs: Dict[str, str]) -> bool:
+        entry = self.entries.get(stage)
+        if not entry or not inputs:
+            return False
+        return entry.get("key") == hash_value(inputs) and entry.get("outputs") == outputs
+
+    def record(self, stage: str, inputs: Dict[str, str], outputs: Dict[str, str]) -> None:
+        with self._lock:
+            self.entries[stage] = {
+                "key": hash_value(inputs),
+                "inputs": inputs,
+                "outputs": outputs,
+                "completed_at": time.time(),
+            }
+
+    def invalidate(self, stage: str) -> None:
+        with self._lock:
+            self.entries.pop(stage, None)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            write_json(self.path, self.entries, indent=True)
+
+
+def run_cached_stage(stage: str, workspace: Workspace, cache: StageCache, action: Callable[[], None],
+                     seed_items: Sequence[str] = (), force: bool = False) -> StageResult:
+    """Runs ``action`` unless the cache says the stage is up to date."""
+    start = time.perf_counter()
+    if not force and cache.is_fresh(stage, stage_inputs(stage, workspace, seed_items), stage_outputs(stage, workspace)):
+        logger.info(f"Skipping {stage}: inputs unchanged")
+        return StageResult(stage, "skipped", time.perf_counter() - start, "inputs unchanged")
+
+    try:
+        action()
+    except Exception as e:
+        cache.invalidate(stage)
+        logger.error(f"Stage {stage} failed: {e}")
+        return StageResult(stage, "failed", time.perf_counter() - start, str(e))
+
+    # Hash inputs after the run so files a stage creates or rewrites itself
+    # don't force a second run.
+    cache.record(stage, stage_inputs(stage, workspace, seed_items), stage_outputs(stage, workspace))
+    return StageResult(stage, "ran", time.perf_counter() - start)
+
+
+def run_pipeline(workspace: Optional[Workspace] = None, seed_items: Sequence[str] = (),
+                 fetch: bool = True, force: bool = False,
+                 max_workers: int = PIPELINE_WORKERS) -> List[StageResult]:
+    """
+    Runs the stage graph with caching; independent stages run concurrently.
+
+    A failed stage blocks its dependents but not unrelated stages, e.g. a
+    failed candidate fetch still lets the profile finish and be cached.
+
+    Args:
+        workspace: User workspace (defaults to the global config paths).
+        seed_items: Seed titles passed to recommend (part of its cache key).
+        fetch: Re-download history and candidates first.
+        force: Ignore the cache and run every stage.
+        max_workers: Stages allowed to run at the same time.
+
+    Returns:
+        One StageResult per stage, in STAGES order.
+    """
+    from core.batch import run_stage
+    from core.scheduler import Task, run_graph
+
+    ws = workspace or Workspace.default()
+    ws.ensure_dirs()
+    cache = StageCache(ws)
+
+    actions: Dict[str, Callable[[], None]] = {
+        "fetch-history": lambda: run_stage("fetch-history", ws),
+        "fetch-candidates": lambda: run_stage("fetch-candidates", ws),
+        "profile": lambda: run_stage("profile", ws),
+        "recommend": lambda: _recommend(ws, seed_items),
+    }
+
+    def _task(stage: str) -> Callable[[], StageResult]:
+        def _run() -> StageResult:
+            if stage in FETCH_STAGES and not fetch:
+                return StageResult(stage, "skipped", 0.0, "--no-fetch")
+            with tracing.span(stage, "stage", user=ws.name) as span:
+                result = run_cached_stage(stage, ws, cache, actions[stage], seed_items, force)
+                span.set(status=result.status)
+            if result.status == "failed":
+                # Let the scheduler block the stages that depend on this one
+                raise RuntimeError(result.reason)
+            return result
+        return _run
+
+    tasks = [Task(stage, _task(stage), DEPENDENCIES[stage]) for stage in STAGES]
+    try:
+        runs = run_graph(tasks, max_workers=max_workers)
+    finally:
+        cache.save()
+
+    results = []
+    for stage in STAGES:
+        run = runs[stage]
+        if run.status == "done":
+            results.append(run.result._replace(seconds=run.seconds, started=run.started))
+        else:
+            status = "failed" if run.status == "failed" else "blocked"
+            results.append(StageResult(stage, status, run.seconds, run.error, run.started))
+    return results
+
+
+def critical_path(results: Sequence[StageResult]) -> Tuple[List[str], float]:
+    """The dependency chain that determined the wall time of a run, and its length in seconds."""
+    from core.scheduler import TaskRun, Task, critical_path as _critical_path
+
+    runs = {r.stage: TaskRun(r.stage, r.status, r.started, r.started + r.seconds) for r in results}
+    tasks = [Task(stage, lambda: None, DEPENDENCIES.get(stage, ())) for stage in runs]
+    return _critical_path(tasks, runs)
+
+
+def _recommend(workspace: Workspace, seed_items: Sequence[str]) -> None:
+    from core import recommend
+    recommend.main(seed_items=list(seed_items), workspace=workspace)
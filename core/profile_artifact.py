@@ -0,0 +1,200 @@
+"""
+Profile Artifact Module
+
+The profile stage writes one machine-readable JSON artifact (PROFILE_FILE):
+the LLM narrative, structured fields parsed from it, exact viewing
+statistics and precomputed feature vectors. The human-readable Markdown
+(PROFILE_MARKDOWN_FILE) is rendered from the artifact. recommend and the
+service load the artifact as-is and score candidates with its features
+instead of re-deriving anything from the narrative.
+
+Schema (``schema_version`` 1)::
+
+    {
+      "schema_version": 1,
+      "generated_at": 1760000000.0,
+      "model": "qwen/qwen3-4b-2507",
+      "source_items": 2000,
+      "narrative": "## Core Preferences ...",
+      "updates": [{"date": "2026-10-19", "added": 3, "text": "- ..."}],
+      "taste_summary": "Cerebral Sci-Fi Puzzle Solver",
+      "themes": ["Moral ambiguity", ...],
+      "preferred_genres": ["science-fiction", ...],
+      "genre_exclusions": [...], "title_blocklist": [...], "min_year": 0,
+      "statistics": {...},
+      "features": {
+        "genre_weights": {"science-fiction": 0.31, ...},
+        "era_weights": {"2010": 0.42, ...},
+        "seed_embeddings": {"model": "...", "titles": [...], "vectors": [[...]]}
+      }
+    }
+"""
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import EMBEDDING_MODEL, MODEL_NAME, PROFILE_SEED_COUNT, logger
+from core.serialization import read_json, write_json
+from core.workspace import Workspace
+
+SCHEMA_VERSION = 1
+REQUIRED_KEYS = ("schema_version", "narrative", "preferred_genres", "themes", "features")
+
+# Statistics copied into the artifact (histograms are summarized by the feature vectors)
+_STAT_KEYS = (
+    "total_items", "movies", "tv_episodes", "unique_shows", "movie_pct", "tv_pct",
+    "avg_episodes_per_show", "binge_runs", "binge_episode_pct", "watch_hours",
+    "movie_hours", "tv_hours", "top_shows",
+)
+
+
+def extract_section(text: str, heading: str) -> str:
+    """Body of a '## heading' Markdown section, or an empty string."""
+    start = text.find(heading)
+    if start < 0:
+        return ""
+    start += len(heading)
+    end = text.find("\n## ", start)
+    return text[start:end if end >= 0 else len(text)].strip()
+
+
+def parse_bullets(section: str) -> List[str]:
+    """Bullet texts of a Markdown section, without list markers or bold labels."""
+    bullets = []
+    for line in section.splitlines():
+        line = line.strip()
+        marker = re.match(r"[-*]\s+", line)
+        if not marker:
+            continue
+        text = re.sub(r"\*\*(.+?)\*\*:?", r"\1", line[marker.end():]).strip()
+        if text:
+            bullets.append(text)
+    return bullets
+
+
+def artifact_statistics(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """The subset of viewing statistics stored in the artifact."""
+    return {k: stats[k] for k in _STAT_KEYS if k in stats}
+
+
+def genre_weights(stats: Dict[str, Any]) -> Dict[str, float]:
+    """Genre shares as weights summing to 1, keyed by lower-case genre."""
+    distribution = stats.get("genre_distribution") or []
+    total = sum(pct for _, pct in distribution)
+    if not total:
+        return {}
+    return {genre.lower(): round(pct / total, 4) for genre, pct in distribution}
+
+
+def era_weights(stats: Dict[str, Any]) -> Dict[str, float]:
+    """Decade shares as weights summing to 1, keyed by decade ('1990')."""
+    histogram = stats.get("decade_histogram") or {}
+    total = sum(histogram.values())
+    if not total:
+        return {}
+    return {str(decade): round(count / total, 4) for decade, count in histogram.items()}
+
+
+def seed_embeddings(titles: Sequence[str]) -> Dict[str, Any]:
+    """Embeds the seed titles with EMBEDDING_MODEL; empty when disabled or unavailable."""
+    if not EMBEDDING_MODEL or not titles:
+        return {}
+    from core.llm_gateway import get_gateway
+    try:
+        vectors = get_gateway().embed(list(titles), model=EMBEDDING_MODEL)
+    except Exception as e:
+        logger.warning(f"Skipping seed embeddings: {e}")
+        return {}
+    return {"model": EMBEDDING_MODEL, "titles": list(titles), "vectors": vectors}
+
+
+def build_artifact(narrative: str, stats: Dict[str, Any], preferences: Dict[str, Any]) -> Dict[str, Any]:
+    """Assembles a new artifact from a full profile build."""
+    weights = genre_weights(stats)
+    seeds = [title for title, _ in stats.get("top_shows", [])][:PROFILE_SEED_COUNT]
+    preferred = list(preferences.get("preferred_genres") or [])
+    preferred += [g for g in sorted(weights, key=lambda g: -weights[g])[:5] if g not in preferred]
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "generated_at": time.time(),
+        "model": MODEL_NAME,
+        "source_items": stats.get("total_items", 0),
+        "narrative": narrative.strip(),
+        "updates": [],
+        "taste_summary": extract_section(narrative, "## Taste Summary"),
+        "themes": parse_bullets(extract_section(narrative, "## Themes & Psychology")),
+        "preferred_genres": preferred,
+        "genre_exclusions": list(preferences.get("genre_exclusions") or []),
+        "title_blocklist": list(preferences.get("title_blocklist") or []),
+        "min_year": preferences.get("preferred_min_year", 0),
+        "statistics": artifact_statistics(stats),
+        "features": {
+            "genre_weights": weights,
+            "era_weights": era_weights(stats),
+            "seed_embeddings": seed_embeddings(seeds),
+        },
+    }
+
+
+def render_markdown(artifact: Dict[str, Any]) -> str:
+    """Human-readable profile rendered from the artifact."""
+    parts = [
+        "# Taste Profile\n",
+        f"*Generated from {artifact.get('source_items', 0)} watched items*\n",
+        artifact.get("narrative", ""),
+    ]
+    updates = artifact.get("updates") or []
+    if updates:
+        parts.append("## Recent Viewing Updates\n")
+        for update in updates:
+            parts.append(f"### {update['date']} (+{update['added']} items)\n{update['text'].strip()}\n")
+    return "\n".join(parts).rstrip() + "\n"
+
+
+def validate_artifact(data: Any) -> Dict[str, Any]:
+    """
+    Checks that ``data`` is a profile artifact this version can read.
+
+    Raises:
+        ValueError: If it isn't a dict, has another schema version or misses keys.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("profile artifact is not a JSON object")
+    if data.get("schema_version") != SCHEMA_VERSION:
+        raise ValueError(f"unsupported profile schema version {data.get('schema_version')!r}")
+    missing = [k for k in REQUIRED_KEYS if k not in data]
+    if missing:
+        raise ValueError(f"profile artifact missing {', '.join(missing)}")
+    return data
+
+
+def load_artifact(path) -> Optional[Dict[str, Any]]:
+    """The artifact at ``path``, or None if it is missing, legacy Markdown or invalid."""
+    if not path.exists():
+        return None
+    try:
+        return validate_artifact(read_json(path))
+    except (OSError, ValueError) as e:
+        logger.debug(f"Ignoring profile {path.name}: {e}")
+        return None
+
+
+def load_legacy_profile(path) -> Optional[Dict[str, Any]]:
+    """A hand-written JSON profile without schema_version (preferred_genres/themes keys), or None."""
+    if not path.exists():
+        return None
+    try:
+        data = read_json(path)
+    except (OSError, ValueError):
+        return None
+    if isinstance(data, dict) and "schema_version" not in data:
+        return data
+    return None
+
+
+def save_artifact(workspace: Workspace, artifact: Dict[str, Any]) -> None:
+    """Writes the JSON artifact and its Markdown rendering."""
+    workspace.ensure_dirs()
+    write_json(workspace.profile_file, artifact)
+    with open(workspace.profile_markdown_file, "w") as f:
+        f.write(render_markdown(artifact))
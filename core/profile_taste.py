@@ -4,110 +4,379 @@ Taste Profile Analysis Module
 
 Analyzes watch history to generate a personalized taste profile
 using LLM-based pattern recognition.
+
+Profiles are updated incrementally: the history events a profile covers are
+recorded next to the workspace data, and later runs only summarize the new
+events with a short prompt and merge the result into the existing profile.
+A full rebuild happens on request, when preferences.json changed since the
+profile was built, or once the merged deltas exceed PROFILE_REBUILD_DRIFT
+of the history the last rebuild was based on.
 """
-import json
+import time
 from collections import Counter
-from typing import Dict, List, Any
+from datetime import date
+from typing import Dict, List, Any, Optional, Sequence, Tuple, Union
 
 from config import (
-    API_BASE_URL, MODEL_NAME, API_KEY, TEMPERATURE,
-    HISTORY_FILE, PROFILE_FILE, PREFERENCES_FILE,
-    PROFILE_ANALYSIS_LIMIT, logger
+    MODEL_NAME, TEMPERATURE,
+    PROFILE_ANALYSIS_LIMIT, PROFILE_DELTA_LIMIT, PROFILE_REBUILD_DRIFT,
+    BINGE_GAP_HOURS, BINGE_MIN_EPISODES,
+    logger, configure_logging
+)
+from core import tracing
+from core.llm_gateway import get_gateway
+from core.media import HistoryEvent, as_events, load_history
+from core.profile_artifact import (
+    artifact_statistics, build_artifact, era_weights, genre_weights, load_artifact, save_artifact
 )
+from core.prompt_encoder import collapse_history, encode_history, render_entry, stratified_sample
+from core.serialization import read_items, read_json, write_json
+from core.summarize import summarize_history
+from core.workspace import Workspace
+
+COVERAGE_FILE_NAME = "profile_coverage.json"
+_EPOCH_DAY = date(1970, 1, 1).toordinal()
+HIGHLIGHT_LIMIT = 25  # Sampled titles shown next to the period summaries
 
-def calculate_statistics(history: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _minutes_since_epoch(watched_at: str, day_cache: Dict[str, int]) -> Optional[int]:
+    """Minutes since 1970 for an ISO-8601 UTC timestamp; day ordinals are cached per date."""
+    if not watched_at or len(watched_at) < 16:
+        return None
+    day = day_cache.get(watched_at[:10])
+    if day is None:
+        try:
+            day = date(int(watched_at[0:4]), int(watched_at[5:7]), int(watched_at[8:10])).toordinal() - _EPOCH_DAY
+        except ValueError:
+            return None
+        day_cache[watched_at[:10]] = day
+    try:
+        return day * 1440 + int(watched_at[11:13]) * 60 + int(watched_at[14:16])
+    except ValueError:
+        return None
+
+def calculate_statistics(history: Sequence[Union[Dict[str, Any], HistoryEvent]]) -> Dict[str, Any]:
     """
-    Calculate viewing statistics from watch history.
+    Calculate viewing statistics from watch history in a single pass.
+    
+    Memory is bounded by the number of distinct titles, genres and years,
+    not by the number of events, so 100k+ events aggregate in well under a
+    second. Genres are counted once per title so a long-running show does
+    not drown out everything else; watch time uses episode/movie runtimes
+    when the history was fetched with extended info.
     
     Args:
-        history: List of watch history items from Trakt.
+        history: Watch history (newest first), as HistoryEvents or raw
+            Trakt/Simkl items.
         
     Returns:
-        Dictionary containing total items, movie/TV breakdown, decade analysis.
+        Dictionary with the movie/TV breakdown, genre distribution,
+        decade/year histograms, per-show episode counts, binge runs and
+        watch-time rollups.
     """
+    movies = 0
+    episodes = 0
+    show_episodes: Counter = Counter()
+    show_titles: Dict[str, str] = {}
+    genre_counts: Counter = Counter()
+    seen_titles = set()
+    year_counts: Counter = Counter()
+    movie_minutes = 0
+    tv_minutes = 0
+    minutes_by_year: Counter = Counter()
     
-    total_items = len(history)
-    movies = [item for item in history if "movie" in item]
-    shows = [item for item in history if "show" in item]
+    gap_limit = BINGE_GAP_HOURS * 60
+    day_cache: Dict[str, int] = {}
+    run_show = None
+    run_length = 0
+    run_last = None
+    binge_runs = 0
+    binge_episodes = 0
+    longest_binge = (0, "")
     
-    # Count unique shows vs total episodes
-    unique_shows = len(set(item["show"]["ids"]["trakt"] for item in shows))
+    def close_run() -> None:
+        nonlocal binge_runs, binge_episodes, longest_binge
+        if run_length >= BINGE_MIN_EPISODES:
+            binge_runs += 1
+            binge_episodes += run_length
+            if run_length > longest_binge[0]:
+                longest_binge = (run_length, show_titles.get(run_show, ""))
     
-    # Calculate percentages
-    movie_pct = (len(movies) / total_items * 100) if total_items > 0 else 0
-    tv_pct = 100 - movie_pct
-    
-    # Analyze decades (from movies and shows)
-    decades = []
-    for item in history:
-        if "movie" in item and "year" in item["movie"]:
-            year = item["movie"]["year"]
-            if year:
-                decades.append((year // 10) * 10)
-        elif "show" in item and "year" in item["show"]:
-            year = item["show"]["year"]
-            if year:
-                decades.append((year // 10) * 10)
+    for event in as_events(history):
+        media = event.media
+        key = media.key
+        runtime = event.runtime
+        if media.kind == "movie":
+            movies += 1
+            movie_minutes += runtime
+            show_key = None
+        else:
+            episodes += 1
+            show_key = key
+            show_episodes[show_key] += 1
+            if show_key not in show_titles:
+                show_titles[show_key] = media.title
+            tv_minutes += runtime
+        
+        if key not in seen_titles:
+            seen_titles.add(key)
+            for genre in media.genres:
+                genre_counts[genre] += 1
+        if media.year:
+            year_counts[media.year] += 1
+        
+        watched_at = event.watched_at
+        if runtime and watched_at[:4].isdigit():
+            minutes_by_year[int(watched_at[:4])] += runtime
+        
+        # Binge runs: consecutive events of one show with short gaps (history is newest first)
+        when = _minutes_since_epoch(watched_at, day_cache)
+        if (show_key is not None and show_key == run_show
+                and (when is None or run_last is None or abs(run_last - when) <= gap_limit)):
+            run_length += 1
+        else:
+            close_run()
+            run_show, run_length = show_key, (1 if show_key is not None else 0)
+        run_last = when
+    close_run()
     
-    decade_counts = Counter(decades).most_common(3)
+    total_items = movies + episodes
+    unique_shows = len(show_episodes)
+    movie_pct = (movies / total_items * 100) if total_items > 0 else 0
+    decade_counts: Counter = Counter()
+    for year, count in year_counts.items():
+        decade_counts[(year // 10) * 10] += count
+    genre_total = sum(genre_counts.values())
     
     stats = {
         "total_items": total_items,
-        "movies": len(movies),
-        "tv_episodes": len(shows),
+        "movies": movies,
+        "tv_episodes": episodes,
         "unique_shows": unique_shows,
         "movie_pct": round(movie_pct, 1),
-        "tv_pct": round(tv_pct, 1),
-        "top_decades": decade_counts,
-        "avg_episodes_per_show": round(len(shows) / unique_shows, 1) if unique_shows > 0 else 0
+        "tv_pct": round(100 - movie_pct, 1),
+        "top_decades": decade_counts.most_common(3),
+        "avg_episodes_per_show": round(episodes / unique_shows, 1) if unique_shows > 0 else 0,
+        "genre_distribution": [
+            (genre, round(count / genre_total * 100, 1)) for genre, count in genre_counts.most_common()
+        ],
+        "decade_histogram": dict(sorted(decade_counts.items())),
+        "year_histogram": dict(sorted(year_counts.items())),
+        "top_shows": [(show_titles[k], n) for k, n in show_episodes.most_common(10)],
+        "binge_runs": binge_runs,
+        "binge_episode_pct": round(binge_episodes / episodes * 100, 1) if episodes else 0,
+        "longest_binge": longest_binge,
+        "watch_hours": round((movie_minutes + tv_minutes) / 60, 1),
+        "movie_hours": round(movie_minutes / 60, 1),
+        "tv_hours": round(tv_minutes / 60, 1),
+        "hours_by_year": {year: round(m / 60, 1) for year, m in sorted(minutes_by_year.items())},
     }
     
     return stats
 
-def analyze_taste() -> None:
+def format_statistics(stats: Dict[str, Any], top_genres: int = 8) -> str:
+    """Prompt block with the computed numbers, so the model does not have to estimate them."""
+    lines = [
+        "VIEWING STATISTICS (computed from the full history):",
+        f"- Total items analyzed: {stats['total_items']} ({stats['movies']} movies, "
+        f"{stats['tv_episodes']} TV episodes from {stats['unique_shows']} shows)",
+        f"- Content preference: TV {stats['tv_pct']}% | Movies {stats['movie_pct']}%",
+    ]
+    if stats["genre_distribution"]:
+        genres = ", ".join(f"{g} {pct}%" for g, pct in stats["genre_distribution"][:top_genres])
+        lines.append(f"- Genre distribution (share of titles): {genres}")
+    if stats["top_decades"]:
+        lines.append(f"- Top decades: {', '.join(f'{d}s ({c} items)' for d, c in stats['top_decades'])}")
+    if stats["top_shows"]:
+        lines.append(f"- Most watched shows: {', '.join(f'{t} ({n} eps)' for t, n in stats['top_shows'][:5])}")
+    binge = f"- Binge behavior: Avg {stats['avg_episodes_per_show']} episodes per show"
+    if stats["binge_runs"]:
+        length, title = stats["longest_binge"]
+        binge += (f"; {stats['binge_runs']} binge runs cover {stats['binge_episode_pct']}% of episodes "
+                  f"(longest: {length} eps of {title})")
+    lines.append(binge)
+    if stats["watch_hours"]:
+        lines.append(f"- Watch time: {stats['watch_hours']}h ({stats['tv_hours']}h TV, {stats['movie_hours']}h movies)")
+    return "\n".join(lines) + "\n"
+
+def event_key(item: Union[Dict[str, Any], HistoryEvent]) -> str:
+    """
+    Stable identifier of one history event (raw item or HistoryEvent).
+    
+    Trakt history entries carry their own id; Simkl entries are keyed by
+    media type, id, episode and watch time.
+    """
+    if isinstance(item, HistoryEvent):
+        if item.event_id is not None:
+            return str(item.event_id)
+        media = item.media
+        ids = media.ids
+        ident = ids.get("trakt") or ids.get("simkl") or ids.get("imdb") or media.title
+        season = "" if item.season is None else item.season
+        number = "" if item.number is None else item.number
+        return f"{media.kind}:{ident}:{season}x{number}:{item.watched_at}"
+    if item.get("id") is not None:
+        return str(item["id"])
+    kind = "movie" if "movie" in item else "show"
+    media = item.get(kind) or {}
+    ids = media.get("ids") or {}
+    ident = ids.get("trakt") or ids.get("simkl") or ids.get("imdb") or media.get("title")
+    episode = item.get("episode") or {}
+    return f"{kind}:{ident}:{episode.get('season', '')}x{episode.get('number', '')}:{item.get('watched_at', '')}"
+
+def load_coverage(workspace: Workspace) -> Dict[str, Any]:
+    """Which history events the current profile covers (empty if unknown)."""
+    path = workspace.data_dir / COVERAGE_FILE_NAME
+    if not path.exists():
+        return {}
+    try:
+        return read_json(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable profile coverage {path}: {e}")
+        return {}
+
+def preferences_hash(workspace: Workspace) -> str:
+    """Content hash of the workspace preferences file ('missing' without one)."""
+    from core.pipeline import hash_file
+    return hash_file(workspace.preferences_file)
+
+def save_coverage(workspace: Workspace, history: List[Dict[str, Any]],
+                  base_events: int, delta_events: int) -> None:
+    """Records the events (and the preferences) covered by the profile just written."""
+    workspace.ensure_dirs()
+    coverage = {
+        "events": sorted({event_key(item) for item in history}),
+        "base_events": base_events,
+        "delta_events": delta_events,
+        "preferences": preferences_hash(workspace),
+        "updated_at": time.time(),
+    }
+    write_json(workspace.data_dir / COVERAGE_FILE_NAME, coverage)
+
+def plan_update(history: List[Dict[str, Any]], coverage: Dict[str, Any],
+                profile_exists: bool, full: bool = False,
+                preferences: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Decides how to bring the profile up to date.
+    
+    ``preferences`` is the current preferences_hash; when given and it differs
+    from the one the coverage was recorded with, the profile is rebuilt.
+    
+    Returns:
+        ("full", history), ("incremental", new_events) or ("current", []).
+    """
+    if full or not coverage or not profile_exists:
+        return "full", history
+    if preferences is not None and coverage.get("preferences") != preferences:
+        logger.info("Preferences changed since the profile was built, rebuilding profile")
+        return "full", history
+    
+    covered = set(coverage.get("events", []))
+    new_events = [item for item in history if event_key(item) not in covered]
+    if not new_events:
+        return "current", []
+    
+    drift = (coverage.get("delta_events", 0) + len(new_events)) / max(coverage.get("base_events", 0), 1)
+    if drift > PROFILE_REBUILD_DRIFT:
+        logger.info(f"{len(new_events)} new events push drift to {drift:.0%} "
+                    f"(limit {PROFILE_REBUILD_DRIFT:.0%}), rebuilding profile")
+        return "full", history
+    return "incremental", new_events
+
+def update_profile(workspace: Workspace, history: List[Dict[str, Any]],
+                   new_events: List[Dict[str, Any]], coverage: Dict[str, Any],
+                   artifact: Dict[str, Any]) -> None:
+    """
+    Summarizes only ``new_events`` and merges the result into the existing profile.
+    
+    The prompt carries the profile's taste summary and at most
+    PROFILE_DELTA_LIMIT new events, so its size tracks the delta rather
+    than the history. Statistics and feature weights are recomputed exactly
+    (no LLM involved).
+    """
+    summary = artifact.get("taste_summary", "")
+    summary_text = f"CURRENT TASTE SUMMARY: {summary}\n\n" if summary else ""
+    delta_lines = encode_history(new_events, PROFILE_DELTA_LIMIT)
+    
+    logger.info(f"Updating profile with {len(new_events)} new history events...")
+    prompt = f"""You are an expert media analyst maintaining a viewer's taste profile.
+
+{summary_text}NEW VIEWING SINCE THE LAST UPDATE ({len(new_events)} items, {len(delta_lines)} titles shown):
+{chr(10).join(delta_lines)}
+
+In 2-4 bullet points, describe only what this new viewing adds to or changes in the profile: reinforced or new genres, themes, eras, or shifts in viewing style. Do not restate the existing profile. If nothing changes, reply with one bullet saying the new viewing is consistent with it."""
+
+    response = get_gateway().complete(prompt, temperature=TEMPERATURE)
+    
+    stats = calculate_statistics(history)
+    artifact.setdefault("updates", []).append({"date": time.strftime("%Y-%m-%d"), "added": len(new_events), "text": response.strip()})
+    artifact["generated_at"] = time.time()
+    artifact["statistics"] = artifact_statistics(stats)
+    artifact["features"]["genre_weights"] = genre_weights(stats)
+    artifact["features"]["era_weights"] = era_weights(stats)
+    save_artifact(workspace, artifact)
+    save_coverage(workspace, history, coverage.get("base_events", 0),
+                  coverage.get("delta_events", 0) + len(new_events))
+    logger.info(f"Profile updated incrementally in {workspace.profile_file}")
+
+def analyze_taste(workspace: Optional[Workspace] = None, full: bool = False) -> None:
     """
     Main taste analysis function.
     
-    Loads watch history, calculates statistics, and uses LLM to generate
-    a comprehensive taste profile. Saves output to PROFILE_FILE.
+    Loads watch history and brings the taste profile up to date. Unchanged
+    history costs nothing, a small delta is merged with a short prompt, and
+    a full rebuild (statistics plus the complete analysis prompt) runs for
+    new profiles, when ``full`` is set or when drift passes the threshold.
+    Saves the JSON artifact to the workspace profile file (PROFILE_FILE by
+    default) and renders the Markdown next to it.
     """
-    if not HISTORY_FILE.exists():
+    ws = workspace or Workspace.default()
+    if not ws.history_file.exists():
         logger.error("No history data found. Run 'cli.py fetch' first.")
         return
 
-    with open(HISTORY_FILE, "r") as f:
-        history = json.load(f)
+    with tracing.span(f"load {ws.history_file.name}", "io"):
+        history = read_items(ws.history_file)
     
-    # Calculate statistics
-    stats = calculate_statistics(history)
+    coverage = load_coverage(ws)
+    artifact = load_artifact(ws.profile_file)
+    mode, new_events = plan_update(history, coverage, artifact is not None, full, preferences_hash(ws))
+    if mode == "current":
+        logger.info(f"Profile already covers all {len(history)} history events")
+        return
+    if mode == "incremental":
+        update_profile(ws, history, new_events, coverage, artifact)
+        return
     
-    # Pre-process history into a readable string
-    watched_list = []
-    for item in history:
-        if "movie" in item:
-            watched_list.append(f"Movie: {item['movie']['title']} ({item['movie'].get('year', 'N/A')})")
-        elif "show" in item:
-            watched_list.append(f"Show: {item['show']['title']} (S{item['episode']['season']}E{item['episode']['number']})")
+    # Calculate statistics on the typed events, built once
+    events = load_history(history)
+    stats = calculate_statistics(events)
     
-    watched_text = "\n".join(watched_list[:PROFILE_ANALYSIS_LIMIT])
+    # Pre-process history into prompt lines, one per distinct title. When the
+    # titles don't fit the prompt budget, the history is summarized chunk by
+    # chunk so every event is represented, plus a stratified sample of titles.
+    entries = collapse_history(events)
+    if len(entries) > PROFILE_ANALYSIS_LIMIT:
+        summaries = summarize_history(events, ws, encode_history, event_key)
+        highlights = "\n".join(render_entry(e) for e in stratified_sample(entries, HIGHLIGHT_LIMIT))
+        history_text = (
+            f"WATCH HISTORY SUMMARIES ({len(summaries)} periods covering all {len(history)} items, oldest first):\n"
+            + "\n\n".join(f"Period {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+            + f"\n\nREPRESENTATIVE TITLES ({HIGHLIGHT_LIMIT} of {len(entries)}, sampled across eras and formats):\n{highlights}"
+        )
+    else:
+        watched_text = "\n".join(render_entry(e) for e in entries)
+        history_text = f"WATCH HISTORY ({len(entries)} titles from {len(history)} items):\n{watched_text}"
     
     # Load user preferences
     preferences = {}
-    if PREFERENCES_FILE.exists():
-        with open(PREFERENCES_FILE, "r") as f:
-            preferences = json.load(f)
+    if ws.preferences_file.exists():
+        preferences = read_json(ws.preferences_file)
     
     genre_exclusions = preferences.get("genre_exclusions", [])
     min_scores = preferences.get("min_imdb_score", {})
     
     # Format statistics for prompt
-    stats_text = f"""
-VIEWING STATISTICS:
-- Total items analyzed: {stats['total_items']} ({stats['movies']} movies, {stats['tv_episodes']} TV episodes from {stats['unique_shows']} shows)
-- Content preference: TV {stats['tv_pct']}% | Movies {stats['movie_pct']}%
-- Top decades: {', '.join([f"{d}s ({c} items)" for d, c in stats['top_decades']])}
-- Binge behavior: Avg {stats['avg_episodes_per_show']} episodes per show
-"""
+    stats_text = format_statistics(stats)
     
     exclusions_text = ""
     if genre_exclusions:
@@ -126,25 +395,22 @@ VIEWING STATISTICS:
     
     prompt = f"""You are an expert media analyst. Deeply analyze this watch history to understand the viewer's sophisticated taste.
 
-WATCH HISTORY (Top {PROFILE_ANALYSIS_LIMIT} items):
-{watched_text}
+{history_text}
 
 {stats_text}{exclusions_text}{quality_text}
 
-Analyze deeply for:
-1. Genre distribution and patterns
-2. Psychological themes and narrative elements  
-3. Viewing style (pacing, tone, complexity preferences)
-4. Creative patterns (directors, visual styles, storytelling approaches)
-5. Emotional drivers and what the viewer seeks
-6. Both explicit and subtle preferences
+The statistics above are exact; use them as given. Analyze deeply for:
+1. Psychological themes and narrative elements
+2. Viewing style (pacing, tone, complexity preferences)
+3. Creative patterns (directors, visual styles, storytelling approaches)
+4. Emotional drivers and what the viewer seeks
 
 OUTPUT FORMAT (be specific and insightful):
 
 ## Core Preferences
-- **Primary Genres**: [List with percentages if detectable, e.g., "Sci-Fi (45%), Thriller (30%)"]
-- **Content Type**: [TV vs Movies preference with insight]
-- **Era Preference**: [Decades, classic vs modern]
+- **Primary Genres**: [Top genres with their percentages from the statistics]
+- **Content Type**: [TV vs Movies split from the statistics, with insight]
+- **Era Preference**: [Decades from the statistics, classic vs modern]
 
 ## Themes & Psychology
 - [List 4-6 recurring psychological themes, narrative patterns, or philosophical questions]
@@ -173,30 +439,20 @@ OUTPUT FORMAT (be specific and insightful):
 
 Be perceptive and find patterns that aren't obvious. This profile will drive personalized recommendations."""
 
-    from openai import OpenAI
-    client = OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
-    
-    response_obj = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=TEMPERATURE
-    )
-    
-    response = response_obj.choices[0].message.content
+    response = get_gateway().complete(prompt, temperature=TEMPERATURE)
     
-    # Save to Markdown
-    with open(PROFILE_FILE, "w") as f:
-        f.write("# Taste Profile\n\n")
-        f.write(f"*Generated from {stats['total_items']} watched items*\n\n")
-        f.write(response)
+    # Save the JSON artifact and its Markdown rendering
+    save_artifact(ws, build_artifact(response, stats, preferences))
+    save_coverage(ws, history, base_events=len(history), delta_events=0)
         
-    logger.info(f"Enhanced profile saved to {PROFILE_FILE}")
+    logger.info(f"Enhanced profile saved to {ws.profile_file} ({ws.profile_markdown_file.name})")
     logger.info(f"Profile includes: viewing patterns, themes, style preferences, and emotional drivers")
 
-def main():
-    analyze_taste()
+def main(workspace: Optional[Workspace] = None, full: bool = False):
+    analyze_taste(workspace, full)
 
 if __name__ == "__main__":
+    configure_logging()
     try:
         analyze_taste()
     except FileNotFoundError as e:
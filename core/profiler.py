@@ -0,0 +1,215 @@
+"""
+Profiler Module
+
+CPU and memory profiling around any CLI subcommand, for capturing why
+``recommend`` or ``profile`` got slow on a real account without editing
+code. Outputs go to PROFILES_DIR, named after the run id
+(``<time>-<pid>-<command>``):
+
+    <run>.pstats      cProfile stats of every thread (``python -m pstats``, snakeviz)
+    <run>.collapsed   sampled stacks in collapsed format (flamegraph.pl, speedscope)
+    <run>.mem.txt     tracemalloc peak and top-N allocations by line and by file
+
+The pipeline and batch commands work on thread pools, so CPU profiling
+covers worker threads too: on Python 3.12+ one cProfile instance sees
+every thread; before that each new thread gets its own and the stats are
+merged.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+from config import OUTPUT_DIR, logger
+
+PROFILES_DIR = OUTPUT_DIR / "profiles"
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples for the collapsed output
+MEMORY_FRAMES = 10  # Traceback depth kept by tracemalloc
+
+
+def make_run_id(command: str) -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{command}"
+
+
+class StackSampler:
+    """Samples every thread's stack on a timer and counts collapsed stacks."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(parts))] += 1
+
+    def write(self, path: Path) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CpuProfiler:
+    """cProfile over the calling thread and every thread started while active."""
+
+    def __init__(self) -> None:
+        self._main = cProfile.Profile()
+        self._threads: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        # Python 3.12+ profiles through sys.monitoring, which already covers all threads
+        self._per_thread = sys.version_info < (3, 12)
+
+    def _thread_hook(self, frame, event, arg) -> None:
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self._lock:
+            self._threads.append(profile)
+        profile.enable()
+
+    def start(self) -> None:
+        if self._per_thread:
+            threading.setprofile(self._thread_hook)
+        self._main.enable()
+
+    def stop(self) -> pstats.Stats:
+        self._main.disable()
+        if self._per_thread:
+            threading.setprofile(None)  # type: ignore[arg-type]
+        stats = pstats.Stats(self._main)
+        with self._lock:
+            for profile in self._threads:
+                try:
+                    stats.add(profile)
+                except (TypeError, ValueError):
+                    pass  # a thread that never ran profiled code
+        return stats
+
+
+class Profiler:
+    """
+    Context manager wrapping a command with the selected profilers.
+
+    Args:
+        command: Subcommand name, used in the run id.
+        cpu: Record cProfile stats.
+        memory: Trace allocations with tracemalloc.
+        collapsed: Also sample stacks for a flame graph.
+        top: Rows in the memory report and the printed CPU summary.
+        out_dir: Output directory (default PROFILES_DIR).
+    """
+
+    def __init__(self, command: str, cpu: bool = False, memory: bool = False, collapsed: bool = False,
+                 top: int = 25, out_dir: Optional[Path] = None) -> None:
+        self.run_id = make_run_id(command)
+        self.cpu = cpu
+        self.memory = memory
+        self.collapsed = collapsed
+        self.top = top
+        self.out_dir = Path(out_dir or PROFILES_DIR)
+        self.outputs: List[Path] = []
+        self.summary: List[str] = []
+        self._cpu: Optional[CpuProfiler] = None
+        self._sampler: Optional[StackSampler] = None
+
+    def __enter__(self) -> "Profiler":
+        if self.memory:
+            tracemalloc.start(MEMORY_FRAMES)
+        if self.collapsed:
+            self._sampler = StackSampler()
+            self._sampler.start()
+        if self.cpu:
+            self._cpu = CpuProfiler()
+            self._cpu.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # Snapshot first so the other profilers' bookkeeping isn't in the memory report
+        snapshot = peak = None
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        stats = self._cpu.stop() if self._cpu else None
+        if self._sampler:
+            self._sampler.stop()
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        base = self.out_dir / self.run_id
+        if stats is not None:
+            path = base.with_suffix(".pstats")
+            stats.dump_stats(str(path))
+            self.outputs.append(path)
+            self.summary += cpu_summary(stats, self.top)
+        if self._sampler:
+            path = base.with_suffix(".collapsed")
+            self._sampler.write(path)
+            self.outputs.append(path)
+        if snapshot is not None:
+            path = base.with_suffix(".mem.txt")
+            report = memory_report(snapshot, peak, self.top)
+            path.write_text("\n".join(report) + "\n")
+            self.outputs.append(path)
+            self.summary += report[:12]  # peak + the ten largest lines
+        for path in self.outputs:
+            logger.debug(f"Profile written to {path}")
+
+
+def cpu_summary(stats: pstats.Stats, top: int) -> List[str]:
+    """The ``top`` functions by cumulative time, as printed by pstats."""
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats("cumulative").print_stats(top)
+    lines = [line for line in buffer.getvalue().splitlines() if line.strip()]
+    # Drop the per-file header pstats prints before the table
+    start = next((i for i, line in enumerate(lines) if "function calls" in line), 0)
+    return lines[start:]
+
+
+def memory_report(snapshot: tracemalloc.Snapshot, peak: int, top: int) -> List[str]:
+    """Peak traced memory and the largest live allocations by line and by file."""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+    by_line = snapshot.statistics("lineno")
+    total = sum(stat.size for stat in by_line)
+    lines = [f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB, live at exit: {total / 1024 / 1024:.1f} MiB",
+             f"Top {top} allocations by line:"]
+    for stat in by_line[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"  {stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {frame.filename}:{frame.lineno}")
+    lines.append(f"Top {top} allocations by file:")
+    for stat in snapshot.statistics("filename")[:top]:
+        lines.append(f"  {stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {stat.traceback[0].filename}")
+    return lines
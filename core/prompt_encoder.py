@@ -0,0 +1,128 @@
+"""
+Prompt Encoder Module
+
+Turns watch history into compact prompt lines. Episodes are collapsed into
+one line per show (episode count, season span, last watched) and repeat
+movie watches into one line per movie, so a binge of one show takes a
+single line instead of the whole budget. When the distinct titles still
+don't fit, a stratified sample across movies/shows, decades and recency is
+taken instead of the head of the list.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from core.media import HistoryEvent, as_events
+
+
+def collapse_history(history: Sequence[Union[Dict[str, Any], HistoryEvent]]) -> List[Dict[str, Any]]:
+    """
+    One entry per distinct movie or show, in order of first appearance.
+
+    Args:
+        history: Watch history as HistoryEvents or raw items (newest first,
+            so entries come out by recency).
+
+    Returns:
+        Entries with kind, title, year, watch count, season span and last watch date.
+    """
+    entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    for event in as_events(history):
+        media = event.media
+        watched = event.watched_at[:10]
+        entry = entries.get(media.key)
+        if entry is None:
+            entry = entries[media.key] = {
+                "kind": media.kind,
+                "title": media.title,
+                "year": media.year or None,
+                "count": 0,
+                "first_season": None,
+                "last_season": None,
+                "last_watched": watched,
+            }
+        entry["count"] += 1
+        if watched > entry["last_watched"]:
+            entry["last_watched"] = watched
+        season = event.season
+        if season is not None:
+            if entry["first_season"] is None or season < entry["first_season"]:
+                entry["first_season"] = season
+            if entry["last_season"] is None or season > entry["last_season"]:
+                entry["last_season"] = season
+    return list(entries.values())
+
+
+def render_entry(entry: Dict[str, Any]) -> str:
+    """Prompt line for one collapsed entry."""
+    year = f" ({entry['year']})" if entry["year"] else ""
+    if entry["kind"] == "movie":
+        details = [f"watched {entry['count']}x"] if entry["count"] > 1 else []
+    else:
+        details = [f"{entry['count']} ep" + ("s" if entry["count"] != 1 else "")]
+        first, last = entry["first_season"], entry["last_season"]
+        if first is not None:
+            details.append(f"S{first}" if first == last else f"S{first}-S{last}")
+    if entry["last_watched"]:
+        details.append(f"last {entry['last_watched']}")
+    label = "Movie" if entry["kind"] == "movie" else "Show"
+    return f"{label}: {entry['title']}{year}" + (f" - {', '.join(details)}" if details else "")
+
+
+def _spread(items: List[Any], k: int) -> List[Any]:
+    """``k`` items evenly spaced over ``items``, always including the first (most recent)."""
+    if k >= len(items):
+        return list(items)
+    if k == 1:
+        return [items[0]]
+    step = (len(items) - 1) / (k - 1)
+    return [items[round(i * step)] for i in range(k)]
+
+
+def stratified_sample(entries: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """
+    Up to ``limit`` entries drawn across (movie/show, decade) strata.
+
+    Every stratum gets a slot before any gets a second (largest strata
+    first); remaining slots are split in proportion to stratum size. Within
+    a stratum picks are spread over the recency order. The result keeps the
+    original recency order.
+    """
+    if len(entries) <= limit:
+        return list(entries)
+    if limit <= 0:
+        return []
+
+    strata: "OrderedDict[Tuple[str, int], List[int]]" = OrderedDict()
+    for index, entry in enumerate(entries):
+        decade = (entry["year"] // 10) * 10 if entry["year"] else 0
+        strata.setdefault((entry["kind"], decade), []).append(index)
+
+    by_size = sorted(strata, key=lambda s: -len(strata[s]))
+    quotas = {s: 0 for s in strata}
+    for stratum in by_size[:limit]:
+        quotas[stratum] = 1
+    remaining = limit - sum(quotas.values())
+    if remaining > 0:
+        spare = {s: len(strata[s]) - quotas[s] for s in strata}
+        total_spare = sum(spare.values())
+        shares = {s: remaining * spare[s] / total_spare for s in strata}
+        for s in strata:
+            quotas[s] += int(shares[s])
+        leftover = limit - sum(quotas.values())
+        for s in sorted(strata, key=lambda s: -(shares[s] - int(shares[s]))):
+            if leftover <= 0:
+                break
+            if quotas[s] < len(strata[s]):
+                quotas[s] += 1
+                leftover -= 1
+
+    chosen = sorted(i for s, rows in strata.items() for i in _spread(rows, quotas[s]))
+    return [entries[i] for i in chosen]
+
+
+def encode_history(history: Sequence[Union[Dict[str, Any], HistoryEvent]], limit: Optional[int] = None) -> List[str]:
+    """Collapsed prompt lines for ``history``, stratified-sampled down to ``limit`` if given."""
+    entries = collapse_history(history)
+    if limit is not None:
+        entries = stratified_sample(entries, limit)
+    return [render_entry(entry) for entry in entries]
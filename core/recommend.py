@@ -1,144 +1,138 @@
 #!/usr/bin/env -S venv/bin/python
-import json
-from typing import List, Set, Dict, Any, Optional
+import logging
+from typing import List, NamedTuple, Set, Dict, Any, Optional, Union
 
 from pathlib import Path
 
 from config import (
-    API_BASE_URL, MODEL_NAME, API_KEY, TEMPERATURE,
-    HISTORY_FILE, CANDIDATES_FILE, PROFILE_FILE, RECOMMENDATIONS_FILE,
-    CANDIDATE_LIMIT, NUM_RECOMMENDATIONS, logger
+    MODEL_NAME, TEMPERATURE,
+    CANDIDATE_LIMIT, NUM_RECOMMENDATIONS, PROFILE_PROMPT_UPDATES, logger,
+    configure_logging
 )
+from core import tracing
+from core.candidate_table import CandidateTable, popcount
+from core.crosswalk import Crosswalk, load_crosswalk
+from core.llm_gateway import get_gateway
+from core.media import is_media_key, item_key, pick_id, unwrap
+from core.profile_artifact import load_artifact, load_legacy_profile
+from core.serialization import read_items, read_json
+from core.workspace import Workspace
 
 def load_json(path: Path) -> List[Dict[str, Any]]:
-    """Safe JSON loader that returns empty list on failure."""
+    """Loads a history/candidates file, dropping malformed items; an empty list if it is missing."""
     if not path.exists():
         logger.warning(f"File not found: {path}")
         return []
-    with open(path, "r") as f:
-        return json.load(f)
+    with tracing.span(f"load {path.name}", "io"):
+        return read_items(path)
 
 def get_item_id(item: Dict[str, Any]) -> Optional[str]:
     """Extracts a unique ID (Trakt, Simkl, or IMDB) from a movie or show object."""
-    ids = {}
-    if "movie" in item:
-        ids = item["movie"]["ids"]
-    elif "show" in item:
-        ids = item["show"]["ids"]
-    else:
+    _, obj = unwrap(item)
+    if obj is None:
         return None
-        
-    # Priority: Trakt > Simkl > IMDB
-    if "trakt" in ids:
-        return str(ids["trakt"])
-    if "simkl" in ids:
-        return str(ids["simkl"])
-    if "imdb" in ids:
-        return str(ids["imdb"])
-    
-    # Fallback to any key
-    if ids:
-        return str(list(ids.values())[0])
-        
-    return None
+    picked = pick_id(obj.get("ids") or {})
+    return picked[1] if picked else None
+
+def get_trakt_id(item: Dict[str, Any]) -> Optional[int]:
+    """Extracts the numeric Trakt ID from a movie or show object."""
+    _, obj = unwrap(item)
+    trakt = (obj.get("ids") or {}).get("trakt") if obj is not None else None
+    return int(trakt) if trakt is not None else None
+
+def _year_of(obj: Dict[str, Any]) -> int:
+    try:
+        return int(obj.get("year") or 0)
+    except (ValueError, TypeError):
+        return 0
 
 def get_title_year(item: Dict[str, Any]) -> str:
-    """Extensions title (year) string from item."""
-    title = "Unknown"
-    year = ""
-    
-    if "movie" in item:
-        title = item["movie"]["title"]
-        year = item["movie"].get("year", "")
-    elif "show" in item:
-        title = item["show"]["title"]
-        year = item["show"].get("year", "")
-        
+    """Extracts 'Title (Year)' from a movie or show object."""
+    _, obj = unwrap(item)
+    if obj is None:
+        return "Unknown"
+    title, year = obj.get("title") or "Unknown", _year_of(obj)
     return f"{title} ({year})" if year else title
 
 def get_year(item: Dict[str, Any]) -> int:
     """Extracts year as integer from item."""
-    try:
-        if "movie" in item:
-            return int(item["movie"]["year"])
-        if "show" in item:
-            return int(item["show"]["year"])
-    except (ValueError, TypeError, KeyError):
-        return 0
-    return 0
+    _, obj = unwrap(item)
+    return _year_of(obj) if obj is not None else 0
 
 def get_genres(item: Dict[str, Any]) -> List[str]:
     """Extracts genres from a movie or show object."""
-    if "movie" in item:
-        return item["movie"].get("genres", [])
-    if "show" in item:
-        return item["show"].get("genres", [])
-    return []
-
-def filter_candidates(candidates: List[Dict[str, Any]], watched_ids: Set[int], genre_exclusions: List[str] = [], title_blocklist: List[str] = [], min_year: int = 0) -> List[str]:
-    """Filters candidates by watched status, excluded genres, blocked titles, and minimum year."""
-    valid_candidates = []
-    filtered_watched = 0
-    filtered_genre = 0
-    filtered_title = 0
-    filtered_year = 0
+    _, obj = unwrap(item)
+    return obj.get("genres", []) if obj is not None else []
+
+def filter_candidates(candidates: Union[List[Dict[str, Any]], CandidateTable], watched_ids: Set[str], genre_exclusions: List[str] = [], title_blocklist: List[str] = [], min_year: int = 0, features: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Filters candidates by watched status, duplicates, excluded genres, blocked titles, and minimum year.
+
+    Accepts raw candidate dicts or a prebuilt CandidateTable; each filter is a
+    row-mask operation on the table. With profile ``features`` (genre and era
+    weights from the profile artifact) the survivors are ordered by affinity,
+    so the CANDIDATE_LIMIT cut keeps the best matches. ``watched_ids`` are
+    typed keys ('movie:trakt:1'), canonical ones when the table was built with
+    a crosswalk.
+
+    Raises:
+        ValueError: If a watched id is a bare provider id (a movie and a show
+            can share one, so it can't be matched safely).
+    """
+    bare = [key for key in watched_ids if not is_media_key(key)]
+    if bare:
+        raise ValueError(f"watched_ids must be typed keys like 'movie:trakt:1', got {bare[:3]!r}")
+    with tracing.span("filter candidates", "filter") as span:
+        table = candidates if isinstance(candidates, CandidateTable) else CandidateTable.from_items(candidates)
     
-    # Normalize exclusions to lowercase for matching
-    excluded_genres_lower = [g.lower() for g in genre_exclusions]
-    blocked_titles_lower = [t.lower() for t in title_blocklist]
+        # Each filter only counts rows not already removed by an earlier one
+        watched = table.watched | table.mask_ids(watched_ids)
+        duplicate = table.duplicates & ~watched
+        removed = watched | duplicate
+        genre = table.mask_genres(genre_exclusions) & ~removed
+        removed |= genre
+        title = table.mask_titles(title_blocklist) & ~removed
+        removed |= title
+        year = table.mask_older_than(min_year) & ~removed if min_year > 0 else 0
+        removed |= year
     
-    for item in candidates:
-        tid = get_item_id(item)
-        desc = get_title_year(item)
-        genres = get_genres(item)
-        genres_lower = [g.lower() for g in genres]
-        
-        # Extract just the title for blocklist matching
-        title_only = desc.split(" (")[0].lower() if " (" in desc else desc.lower()
-        
-        # Skip watched items
-        if tid and tid in watched_ids:
-            filtered_watched += 1
-            continue
-        
-        # Skip items with excluded genres
-        if any(excl in genres_lower for excl in excluded_genres_lower):
-            filtered_genre += 1
-            if filtered_genre <= 5:
-                logger.debug(f"Filtered (genre): {desc} - {genres}")
-            continue
-        
-        # Skip blocked titles
-        if title_only in blocked_titles_lower:
-            filtered_title += 1
-            logger.debug(f"Filtered (blocklist): {desc}")
-            continue
-        
-        # Skip items older than min_year
-        if min_year > 0:
-            year = get_year(item)
-            if year > 0 and year < min_year:
-                filtered_year += 1
-                logger.debug(f"Filtered (year): {desc} ({year} < {min_year})")
-                continue
-        
-        if tid:
-            valid_candidates.append(desc)
+        if logger.isEnabledFor(logging.DEBUG):
+            for row in table.rows(genre)[:5]:
+                logger.debug(f"Filtered (genre): {table.labels[row]}")
+            for row in table.rows(title):
+                logger.debug(f"Filtered (blocklist): {table.labels[row]}")
+            for row in table.rows(year):
+                logger.debug(f"Filtered (year): {table.labels[row]} ({table.years[row]} < {min_year})")
     
-    logger.info(f"Filtered {len(candidates)} candidates → {len(valid_candidates)} valid items")
-    logger.info(f"Removed {filtered_watched} watched, {filtered_genre} by genre, {filtered_title} by blocklist, {filtered_year} by year")
+        valid_rows = table.rows(table.with_id & ~removed)
+        if features and (features.get("genre_weights") or features.get("era_weights")):
+            eras = {int(k): v for k, v in (features.get("era_weights") or {}).items()}
+            scores = table.scores(valid_rows, features.get("genre_weights") or {}, eras)
+            order = sorted(range(len(valid_rows)), key=lambda i: -scores[i])
+            valid_rows = [valid_rows[i] for i in order]
+        valid_candidates = [table.labels[row] for row in valid_rows]
+    
+        logger.info(f"Filtered {len(table)} candidates → {len(valid_candidates)} valid items")
+        logger.info(f"Removed {popcount(watched)} watched, {popcount(duplicate)} duplicates, {popcount(genre)} by genre, {popcount(title)} by blocklist, {popcount(year)} by year")
+        span.set(candidates=len(table), valid=len(valid_candidates), watched=popcount(watched),
+                 duplicate=popcount(duplicate), genre=popcount(genre), blocklist=popcount(title), year=popcount(year))
     
     return valid_candidates
 
 def generate_recommendations(profile_data: Dict[str, Any], candidates: List[str], exclusions: List[str], preferred_genres: List[str] = [], seed_items: List[str] = []) -> str:
     """Calls LLM to generate recommendations."""
     # Format profile JSON into a concise string for the prompt
+    summary = profile_data.get("taste_summary")
     profile_text = (
+        (f"TASTE SUMMARY: {summary}\n" if summary else "") +
         f"PREFERRED GENRES: {', '.join(profile_data.get('preferred_genres', []))}\n"
         f"THEMES: {', '.join(profile_data.get('themes', []))}\n"
         f"MIN YEAR: {profile_data.get('min_year', 2005)}\n"
         f"EXCLUSIONS: {', '.join(profile_data.get('genre_exclusions', []))}"
     )
+    # Incremental profile updates describe viewing since the last full build
+    updates = (profile_data.get("updates") or [])[-PROFILE_PROMPT_UPDATES:]
+    if updates:
+        profile_text += "\nRECENT VIEWING SHIFTS (newest last):\n" + "\n".join(u["text"].strip() for u in updates)
     candidate_list_str = "\n".join([f"- {c}" for c in candidates[:CANDIDATE_LIMIT]])
     
     exclusion_text = ""
@@ -183,88 +177,135 @@ Select {NUM_RECOMMENDATIONS} diverse, fresh, and high-quality matches now:"""
     if seed_items:
         logger.info(f"Using seed items: {seed_items}")
         
-    from openai import OpenAI
-    client = OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
-    
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=TEMPERATURE
-    )
-    
-    result = response.choices[0].message.content
+    result = get_gateway().complete(prompt, temperature=TEMPERATURE)
     return result if result else "No recommendations generated."
 
-def main(seed_items: List[str] = []) -> None:
+def build_watched_ids(history: List[Dict[str, Any]], crosswalk: Optional[Crosswalk] = None) -> Set[str]:
+    """
+    Collects the typed keys (e.g. 'movie:trakt:1') of every watched item in the history.
+
+    With a ``crosswalk`` the keys are canonical, so they match candidates
+    identified by another provider's ids.
+    """
+    watched_ids = set()
+    for item in history:
+        key = (crosswalk.canonical_item(item) if crosswalk else None) or item_key(item)
+        if key:
+            watched_ids.add(key)
+    return watched_ids
+
+class Catalog(NamedTuple):
+    """The parsed history and candidate pool, as filtering needs them."""
+    history_size: int
+    watched_count: int  # distinct titles watched in the history
+    watched_ids: Set[str]  # watched keys not yet marked in table.watched
+    table: CandidateTable
+
+def load_catalog(workspace: Optional[Workspace] = None) -> Optional[Catalog]:
+    """
+    Loads the history and candidates, from the binary snapshot (core/snapshot.py)
+    when it is current, from JSON otherwise (writing a fresh snapshot for next
+    time). None if either file is missing or empty.
+    """
+    from core.snapshot import load_snapshot, source_stamp, write_snapshot  # mmap/hashlib: only when loading
+
+    ws = workspace or Workspace.default()
+    with tracing.span("load snapshot", "io") as span:
+        snapshot = load_snapshot(ws)
+        span.set(hit=snapshot is not None)
+        if snapshot is not None:
+            # The table reads from the mapping, which stays open as long as the table does
+            return Catalog(snapshot.history_size, snapshot.watched_count, set(), snapshot.candidate_table())
+
+    stamp = source_stamp(ws)  # before reading, so a concurrent fetch leaves the snapshot stale
+    history = load_json(ws.history_file)
+    candidates_data = load_json(ws.candidates_file)
+    if not history or not candidates_data:
+        return None
+    crosswalk = load_crosswalk(ws, history, candidates_data)
+    watched_ids = build_watched_ids(history, crosswalk)
+    table = CandidateTable.from_items(candidates_data, crosswalk)
+    write_snapshot(ws, history, candidates_data, stamp, table=table, watched_ids=watched_ids)
+    return Catalog(len(history), len(watched_ids), watched_ids, table)
+
+def load_preferences(path: Path) -> Dict[str, Any]:
+    """Loads preferences.json, returning an empty dict if missing or unreadable."""
+    if not path.exists():
+        return {}
+    try:
+        prefs = read_json(path)
+        logger.info(f"Loaded preferences - Exclusions: {prefs.get('genre_exclusions', [])}, Preferred: {prefs.get('preferred_genres', [])}, Blocklist: {prefs.get('title_blocklist', [])}, Min Year: {prefs.get('preferred_min_year', 0)}")
+        return prefs
+    except Exception as e:
+        logger.warning(f"Could not load preferences: {e}")
+        return {}
+
+def load_profile(workspace: Workspace, prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Loads the profile artifact, falling back to a synthetic profile built from preferences."""
+    artifact = load_artifact(workspace.profile_file)
+    if artifact is not None:
+        return artifact
+    legacy = load_legacy_profile(workspace.profile_file)
+    if legacy is not None:
+        logger.info("Using hand-written JSON profile (no precomputed features)")
+        return legacy
+    # No (valid) profile yet: derive one from preferences without touching disk
+    logger.info("No profile artifact found, using a synthetic profile from preferences (run 'cli.py profile')")
+    return {
+        "preferred_genres": prefs.get("preferred_genres", []),
+        "genre_exclusions": prefs.get("genre_exclusions", []),
+        "title_blocklist": prefs.get("title_blocklist", []),
+        "min_year": prefs.get("preferred_min_year", 0),
+        "themes": [
+            "Moral Ambiguity",
+            "Systemic Failure", 
+            "Cognitive Complexity",
+            "Realism in Fantasy/Sci-Fi"
+        ],
+        "features": {},
+    }
+
+def write_recommendations(path: Path, recommendations: str) -> None:
+    """Writes the recommendations Markdown file."""
+    with open(path, "w") as f:
+        f.write(f"# 📺 Personalized Recommendations\n\n**Source**: Trakt Trending (Filtered)\n\n")
+        f.write(recommendations)
+
+def main(seed_items: List[str] = [], workspace: Optional[Workspace] = None) -> None:
+    ws = workspace or Workspace.default()
     try:
         logger.info("Loading data...")
-        history = load_json(HISTORY_FILE)
-        candidates_data = load_json(CANDIDATES_FILE)
+        # Watched IDs are keyed canonically across providers
+        catalog = load_catalog(ws)
         
-        if not history or not candidates_data:
+        if catalog is None:
             logger.error("Missing history or candidates data. Run fetch_data.py first.")
             return
 
-        # Create set of watched IDs
-        watched_ids = set()
-        for item in history:
-            tid = get_item_id(item)
-            if tid:
-                watched_ids.add(tid)
-
         # Load preferences FIRST (for hard genre filtering)
-        exclusions = []
-        preferred_genres = []
-        title_blocklist = []
-        preferred_min_year = 0
-        if Path("preferences.json").exists():
-            try:
-                with open("preferences.json", "r") as f:
-                    prefs = json.load(f)
-                    exclusions = prefs.get("genre_exclusions", [])
-                    preferred_genres = prefs.get("preferred_genres", [])
-                    title_blocklist = prefs.get("title_blocklist", [])
-                    preferred_min_year = prefs.get("preferred_min_year", 0)
-                    logger.info(f"Loaded preferences - Exclusions: {exclusions}, Preferred: {preferred_genres}, Blocklist: {title_blocklist}, Min Year: {preferred_min_year}")
-            except Exception as e:
-                logger.warning(f"Could not load preferences: {e}")
+        prefs = load_preferences(ws.preferences_file)
+        exclusions = prefs.get("genre_exclusions", [])
+        preferred_genres = prefs.get("preferred_genres", [])
+        title_blocklist = prefs.get("title_blocklist", [])
+        preferred_min_year = prefs.get("preferred_min_year", 0)
         
+        profile_data = load_profile(ws, prefs)
         
-        # Filter candidates by watched status, excluded genres, AND blocked titles
-        valid_candidates = filter_candidates(candidates_data, watched_ids, exclusions, title_blocklist, preferred_min_year)
-        
-        if not PROFILE_FILE.exists():
-            # If profile doesn't exist, create a synthetic one from preferences
-            logger.info("Creating synthetic JSON profile from preferences...")
-            synthetic_profile = {
-                "preferred_genres": preferred_genres,
-                "genre_exclusions": exclusions,
-                "title_blocklist": title_blocklist,
-                "min_year": preferred_min_year,
-                "themes": [
-                    "Moral Ambiguity",
-                    "Systemic Failure", 
-                    "Cognitive Complexity",
-                    "Realism in Fantasy/Sci-Fi"
-                ]
-            }
-            with open(PROFILE_FILE, "w") as f:
-                json.dump(synthetic_profile, f, indent=2)
-            
-        with open(PROFILE_FILE, "r") as f:
-            profile_data = json.load(f)
+        # Filter candidates by watched status, excluded genres, AND blocked titles,
+        # then rank the survivors with the profile's precomputed features
+        valid_candidates = filter_candidates(catalog.table, catalog.watched_ids, exclusions, title_blocklist,
+                                             preferred_min_year, profile_data.get("features"))
 
         recommendations = generate_recommendations(profile_data, valid_candidates, exclusions, preferred_genres, seed_items)
         
-        with open(RECOMMENDATIONS_FILE, "w") as f:
-            f.write(f"# 📺 Personalized Recommendations\n\n**Source**: Trakt Trending (Filtered)\n\n")
-            f.write(recommendations)
+        write_recommendations(ws.recommendations_file, recommendations)
             
-        logger.info(f"Done! Saved to {RECOMMENDATIONS_FILE.name}")
+        logger.info(f"Done! Saved to {ws.recommendations_file.name}")
 
     except Exception as e:
         logger.error(f"Error generating recommendations: {e}")
         raise e
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -0,0 +1,138 @@
+"""
+Scheduler Module
+
+Minimal dependency-graph executor for pipeline stages. Each Task names the
+tasks it depends on; a task starts as soon as all of its dependencies have
+finished, so independent network-bound and LLM-bound work overlaps on the
+thread pool. A failed task blocks everything downstream of it but never
+the unrelated branches. ``critical_path`` reports the chain of tasks that
+determined the total wall time.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from config import logger
+
+
+class Task(NamedTuple):
+    name: str
+    action: Callable[[], Any]
+    deps: Tuple[str, ...] = ()
+
+
+class TaskRun(NamedTuple):
+    name: str
+    status: str  # "done", "failed" or "blocked"
+    started: float  # seconds since the graph started
+    finished: float
+    result: Any = None
+    error: str = ""
+
+    @property
+    def seconds(self) -> float:
+        return self.finished - self.started
+
+
+def topological_order(tasks: Sequence[Task]) -> List[str]:
+    """
+    Task names in dependency order.
+
+    Raises:
+        ValueError: On duplicate names, unknown dependencies or cycles.
+    """
+    by_name: Dict[str, Task] = {}
+    for task in tasks:
+        if task.name in by_name:
+            raise ValueError(f"Duplicate task: {task.name}")
+        by_name[task.name] = task
+    for task in tasks:
+        unknown = [d for d in task.deps if d not in by_name]
+        if unknown:
+            raise ValueError(f"Task {task.name} depends on unknown task(s): {', '.join(unknown)}")
+
+    order: List[str] = []
+    state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+    def visit(name: str, path: List[str]) -> None:
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = 1
+        for dep in by_name[name].deps:
+            visit(dep, path + [name])
+        state[name] = 2
+        order.append(name)
+
+    for task in tasks:
+        visit(task.name, [])
+    return order
+
+
+def run_graph(tasks: Sequence[Task], max_workers: int = 4) -> Dict[str, TaskRun]:
+    """
+    Runs ``tasks`` concurrently, respecting dependencies.
+
+    Returns one TaskRun per task, keyed by name in topological order.
+    Exceptions raised by an action are caught and recorded; dependents of a
+    failed task are marked "blocked" without running.
+    """
+    order = topological_order(tasks)
+    by_name = {task.name: task for task in tasks}
+    pending = set(order)
+    runs: Dict[str, TaskRun] = {}
+    origin = time.perf_counter()
+
+    def _execute(task: Task) -> TaskRun:
+        started = time.perf_counter() - origin
+        try:
+            result = task.action()
+        except Exception as e:
+            logger.debug(f"Task {task.name} failed: {e}")
+            return TaskRun(task.name, "failed", started, time.perf_counter() - origin, error=str(e))
+        return TaskRun(task.name, "done", started, time.perf_counter() - origin, result)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="stage") as pool:
+        running: Dict[Future, str] = {}
+        while pending or running:
+            for name in [n for n in order if n in pending]:
+                deps = by_name[name].deps
+                if any(runs.get(d) is not None and runs[d].status != "done" for d in deps):
+                    now = time.perf_counter() - origin
+                    failed = [d for d in deps if d in runs and runs[d].status != "done"]
+                    runs[name] = TaskRun(name, "blocked", now, now, error=f"{', '.join(failed)} did not complete")
+                    pending.discard(name)
+                elif all(d in runs for d in deps):
+                    running[pool.submit(_execute, by_name[name])] = name
+                    pending.discard(name)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                run = future.result()
+                runs[running.pop(future)] = run
+
+    return {name: runs[name] for name in order}
+
+
+def critical_path(tasks: Sequence[Task], runs: Dict[str, TaskRun]) -> Tuple[List[str], float]:
+    """
+    The chain of dependent tasks that ends last, and its total duration.
+
+    Walks back from the task that finished last, each time following the
+    dependency that finished latest (the one the task actually waited on).
+    """
+    if not runs:
+        return [], 0.0
+    deps = {task.name: task.deps for task in tasks}
+    name = max(runs, key=lambda n: runs[n].finished)
+    path = [name]
+    while True:
+        upstream = [d for d in deps.get(name, ()) if d in runs]
+        if not upstream:
+            break
+        name = max(upstream, key=lambda n: runs[n].finished)
+        path.append(name)
+    path.reverse()
+    return path, sum(runs[n].seconds for n in path)
@@ -0,0 +1,159 @@
+"""
+Serialization Module
+
+Reads and writes the workspace JSON files (history, candidates, profile,
+coverage, credentials). Uses orjson when it is installed, which parses and
+writes large histories several times faster, and the stdlib json module
+otherwise; both read each other's output. orjson is imported on the first
+dumps/loads rather than with this module, so commands that never touch JSON
+don't pay for it at startup. Files are written compact unless ``indent`` is
+asked for.
+
+Provider items are checked as they are decoded: read_items keeps only
+records with the movie/show shape the rest of the agent relies on (an
+object with an ``ids`` object, a string title, a list of string genres, ...)
+and reports the rest, so a malformed record is rejected at load time instead
+of raising deep inside filter_candidates.
+"""
+import gc
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Union
+
+from config import logger
+
+_UNLOADED = object()
+orjson: Any = _UNLOADED  # the orjson module, None without it; imported on first use
+
+
+def _orjson() -> Any:
+    global orjson
+    if orjson is _UNLOADED:
+        try:
+            import orjson as module
+        except ImportError:  # optional: pip install orjson
+            module = None
+        orjson = module
+    return orjson
+
+
+def backend() -> str:
+    """The JSON library in use: "orjson" or "json"."""
+    return "orjson" if _orjson() is not None else "json"
+
+
+class SchemaError(ValueError):
+    """A provider item that doesn't have the expected shape."""
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """``obj`` as UTF-8 JSON, compact unless ``indent``."""
+    fast = _orjson()
+    if fast is not None:
+        options = fast.OPT_NON_STR_KEYS | (fast.OPT_INDENT_2 if indent else 0)
+        try:
+            return fast.dumps(obj, option=options)
+        except TypeError:
+            pass  # types orjson rejects (e.g. int subclasses); the stdlib encoder takes them
+    text = json.dumps(obj, ensure_ascii=False, indent=2 if indent else None,
+                      separators=None if indent else (",", ":"))
+    return text.encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parses JSON text or UTF-8 bytes."""
+    # Decoded JSON has no reference cycles, but allocating 100k+ containers
+    # triggers full garbage collections that cost more than the parse itself
+    fast = _orjson()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return fast.loads(data) if fast is not None else json.loads(data)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def read_json(path: Path) -> Any:
+    """Parses the JSON file at ``path``. Raises OSError or ValueError."""
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_json(path: Path, obj: Any, indent: bool = False) -> None:
+    """Writes ``obj`` to ``path`` atomically (temp file + rename)."""
+    data = dumps(obj, indent)
+    fd, tmp = tempfile.mkstemp(dir=Path(path).parent, prefix=f".{Path(path).name}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def check_item(item: Any) -> str:
+    """Why ``item`` is not a usable movie/show record ('' if it is)."""
+    if type(item) is not dict:
+        return "not an object"
+    obj = item.get("movie")
+    if obj is None:
+        obj = item.get("show")
+        if obj is None:
+            return "no movie or show"
+    if type(obj) is not dict:
+        return "movie/show is not an object"
+    ids = obj.get("ids")
+    if ids is not None and type(ids) is not dict:
+        return "ids is not an object"
+    title = obj.get("title")
+    if title is not None and type(title) is not str:
+        return "title is not a string"
+    year = obj.get("year")
+    if year is not None and type(year) is not int and type(year) is not str:
+        return "year is not a number"
+    genres = obj.get("genres")
+    if genres is not None:
+        if type(genres) is not list:
+            return "genres is not a list"
+        for genre in genres:  # a loop, not all(...): no generator object per item
+            if type(genre) is not str:
+                return "genres is not a list of strings"
+    episode = item.get("episode")
+    if episode is not None and type(episode) is not dict:
+        return "episode is not an object"
+    return ""
+
+
+def validate_items(data: Any, source: str = "data", strict: bool = False) -> List[Dict[str, Any]]:
+    """
+    The well-formed movie/show records of a decoded item list.
+
+    Malformed records are dropped with a warning naming the first few, or,
+    with ``strict``, raise SchemaError.
+    """
+    if not isinstance(data, list):
+        raise SchemaError(f"{source}: expected a list of items, got {type(data).__name__}")
+    valid = []
+    rejected: List[Tuple[int, str]] = []
+    for index, item in enumerate(data):
+        reason = check_item(item)
+        if reason:
+            if strict:
+                raise SchemaError(f"{source}: item {index}: {reason}")
+            rejected.append((index, reason))
+        else:
+            valid.append(item)
+    if rejected:
+        examples = "; ".join(f"item {i}: {reason}" for i, reason in rejected[:3])
+        logger.warning(f"Skipped {len(rejected)} malformed items in {source} ({examples})")
+    return valid
+
+
+def read_items(path: Path, strict: bool = False) -> List[Dict[str, Any]]:
+    """Reads a history/candidates file and validates its items (see validate_items)."""
+    return validate_items(read_json(path), Path(path).name, strict)
@@ -0,0 +1,335 @@
+"""
+Service Module
+
+Long-running daemon behind 'cli.py serve'. Parsed history, the watched
+index, the candidate table, preferences and profile are kept in memory as
+one immutable AgentState; refreshes build a new state on a background
+thread and swap it in atomically, so requests never wait on file parsing or
+provider fetches. The LLM gateway stays warm for the life of the process.
+
+Endpoints (JSON, bound to localhost by default):
+    GET  /health                   state age and sizes
+    GET  /candidates               filtered candidate list (no LLM call)
+    GET  /recommend?seed=Title     recommendations, cached per state version and seeds
+    POST /mark      {"titles": []} mark titles watched, then refresh in the background
+    POST /refresh   {"fetch": true} reload files (and optionally re-fetch) in the background
+    GET  /metrics                  Prometheus text format (core/metrics.py)
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from config import (
+    SERVICE_HOST, SERVICE_PORT, SERVICE_REFRESH_INTERVAL, SERVICE_CACHE_SIZE,
+    LLM_WARMUP, LLM_KEEP_ALIVE_INTERVAL, logger
+)
+from core import metrics, recommend
+from core.candidate_table import CandidateTable
+from core.crosswalk import load_crosswalk
+from core.llm_gateway import get_gateway
+from core.workspace import Workspace
+
+
+@dataclass(frozen=True)
+class AgentState:
+    """Everything a request needs, parsed once per refresh."""
+
+    version: int
+    loaded_at: float
+    history_size: int
+    watched_count: int
+    watched_ids: FrozenSet[str]  # beyond the rows already marked in candidates.watched
+    candidates: CandidateTable
+    preferences: Dict[str, Any]
+    profile: Dict[str, Any]
+    valid_candidates: List[str] = field(default_factory=list)
+
+
+def load_state(workspace: Workspace, version: int) -> AgentState:
+    """Parses the workspace files into a fresh AgentState."""
+    catalog = recommend.load_catalog(workspace) or recommend.Catalog(0, 0, set(), CandidateTable())
+    prefs = recommend.load_preferences(workspace.preferences_file)
+    state = AgentState(
+        version=version,
+        loaded_at=time.time(),
+        history_size=catalog.history_size,
+        watched_count=catalog.watched_count,
+        watched_ids=frozenset(catalog.watched_ids),
+        candidates=catalog.table,
+        preferences=prefs,
+        profile=recommend.load_profile(workspace, prefs),
+    )
+    return with_filtered_candidates(state)
+
+
+def with_marks(state: AgentState, marked: FrozenSet[str]) -> AgentState:
+    """``state`` with the ``marked`` keys added to its watched set (and candidates refiltered)."""
+    new = marked - state.watched_ids
+    if not new:
+        return state
+    return with_filtered_candidates(replace(
+        state, watched_ids=state.watched_ids | new, watched_count=state.watched_count + len(new),
+    ))
+
+
+def with_filtered_candidates(state: AgentState) -> AgentState:
+    """Recomputes the valid candidate list for a state."""
+    prefs = state.preferences
+    valid = recommend.filter_candidates(
+        state.candidates, state.watched_ids,
+        prefs.get("genre_exclusions", []),
+        prefs.get("title_blocklist", []),
+        prefs.get("preferred_min_year", 0),
+        state.profile.get("features"),
+    )
+    return replace(state, valid_candidates=valid)
+
+
+class RecommendationService:
+    """Holds the in-memory state and serves requests against it."""
+
+    def __init__(self, workspace: Optional[Workspace] = None) -> None:
+        self.workspace = workspace or Workspace.default()
+        self._state: Optional[AgentState] = None
+        self._version = 0
+        self._swap_lock = threading.Lock()
+        # Keys marked through the service that no fetch has picked up yet; every
+        # swapped-in state gets them re-applied. Guarded by _swap_lock.
+        self._marked: FrozenSet[str] = frozenset()
+        self._refresh_lock = threading.Lock()
+        # Refresh asked for while one was running: None, or whether it should fetch.
+        # Guarded by _pending_lock together with taking/releasing _refresh_lock.
+        self._pending_lock = threading.Lock()
+        self._pending: Optional[bool] = None
+        self._cache: "OrderedDict[Tuple[int, Tuple[str, ...]], str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def state(self) -> AgentState:
+        if self._state is None:
+            raise RuntimeError("Service state not loaded yet")
+        return self._state
+
+    def _swap(self, state: Optional[AgentState] = None, marked: FrozenSet[str] = frozenset(),
+              fetched: FrozenSet[str] = frozenset()) -> None:
+        """
+        Installs the next state version: ``state`` (default: the current one)
+        with every pending mark applied. ``marked`` adds marks; ``fetched``
+        are marks the fetch behind ``state`` already saw, which are dropped.
+        """
+        with self._swap_lock:
+            self._marked = (self._marked - fetched) | marked
+            self._version += 1
+            base = state if state is not None else self.state
+            self._state = with_marks(replace(base, version=self._version), self._marked)
+        with self._cache_lock:
+            self._cache.clear()
+
+    def load(self) -> AgentState:
+        """Synchronous initial load."""
+        self._swap(load_state(self.workspace, 0))
+        logger.info(f"Service state v{self.state.version}: {self.state.history_size} history items, "
+                    f"{len(self.state.candidates)} candidates, {len(self.state.valid_candidates)} valid")
+        return self.state
+
+    def refresh(self, fetch: bool = False) -> None:
+        """Rebuilds state (optionally re-fetching from the provider) and swaps it in."""
+        with self._pending_lock:
+            if not self._refresh_lock.acquire(blocking=False):
+                # A refresh is already running; it runs once more afterwards, fetching if asked to
+                self._pending = bool(self._pending) or fetch
+                return
+        while True:
+            try:
+                fetched: FrozenSet[str] = frozenset()
+                if fetch:
+                    from core.batch import run_stage
+                    with self._swap_lock:
+                        fetched = self._marked  # already on the provider, so this fetch sees them
+                    run_stage("fetch", self.workspace)
+                self._swap(load_state(self.workspace, 0), fetched=fetched)
+                logger.info(f"Service state refreshed to v{self.state.version}")
+            except Exception as e:
+                logger.error(f"Background refresh failed, keeping v{self._state.version if self._state else 0}: {e}")
+            # Checking for a pending request and releasing the lock is one step,
+            # so a request arriving in between can't be dropped
+            with self._pending_lock:
+                pending, self._pending = self._pending, None
+                if pending is None:
+                    self._refresh_lock.release()
+                    return
+            fetch = pending
+
+    def refresh_async(self, fetch: bool = False) -> None:
+        threading.Thread(target=self.refresh, args=(fetch,), name="service-refresh", daemon=True).start()
+
+    def start_periodic_refresh(self, interval: float) -> None:
+        """Re-fetches and reloads every ``interval`` seconds (0 disables)."""
+        if interval <= 0:
+            return
+
+        def _loop() -> None:
+            while not self._stop.wait(interval):
+                self.refresh(fetch=True)
+
+        threading.Thread(target=_loop, name="service-periodic-refresh", daemon=True).start()
+
+    def recommend(self, seed_items: List[str]) -> Dict[str, Any]:
+        """Recommendations for the current state; identical requests hit the cache."""
+        state = self.state
+        key = (state.version, tuple(seed_items))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is None:
+            prefs = state.preferences
+            cached = recommend.generate_recommendations(
+                state.profile, state.valid_candidates,
+                prefs.get("genre_exclusions", []), prefs.get("preferred_genres", []), seed_items
+            )
+            with self._cache_lock:
+                self._cache[key] = cached
+                while len(self._cache) > SERVICE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return {"version": state.version, "candidates": len(state.valid_candidates), "recommendations": cached}
+
+    def mark(self, titles: List[str]) -> Dict[str, Any]:
+        """Marks titles watched, applies them to the in-memory state, then refreshes in the background."""
+        if self.workspace.provider == "both":
+            from core import mark_sync
+            reports, _ = mark_sync.mark_titles(titles, mark_sync.MARK_PROVIDERS, self.workspace)
+            # Search results were recorded in the crosswalk, so these match the table's canonical keys
+            crosswalk = load_crosswalk(self.workspace)
+            marked = sorted({crosswalk.canonical(item["type"], item["ids"]) for r in reports for item in r.marked})
+        elif self.workspace.provider == "simkl":
+            from core import mark_watched_simkl
+            marked = mark_watched_simkl.process_titles(titles, self.workspace)
+        else:
+            from core import mark_watched
+            marked = mark_watched.process_titles(titles, self.workspace)
+
+        if marked:
+            # Applied to whatever state is current when the swap lock is held, and
+            # re-applied to every refreshed state until a fetch has seen them
+            self._swap(marked=frozenset(marked))
+            self.refresh_async(fetch=True)
+        return {"marked": marked, "version": self.state.version}
+
+    def health(self) -> Dict[str, Any]:
+        state = self.state
+        return {
+            "version": state.version,
+            "age_seconds": round(time.time() - state.loaded_at, 1),
+            "history": state.history_size,
+            "watched": state.watched_count,
+            "candidates": len(state.candidates),
+            "valid_candidates": len(state.valid_candidates),
+        }
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def make_handler(service: RecommendationService):
+    """Builds the request handler class bound to ``service``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Dict[str, Any]) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length))
+
+        def _send_text(self, status: int, text: str, content_type: str) -> None:
+            payload = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _dispatch(self, routes: Dict[str, Any]) -> None:
+            url = urlparse(self.path)
+            route = routes.get(url.path)
+            if route is None:
+                self._send(404, {"error": f"Unknown endpoint {url.path}"})
+                return
+            try:
+                status, body = route(parse_qs(url.query))
+            except (ValueError, KeyError) as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                logger.error(f"{self.command} {url.path} failed: {e}")
+                status, body = 500, {"error": str(e)}
+            self._send(status, body)
+
+        def do_GET(self) -> None:
+            if urlparse(self.path).path == "/metrics":
+                self._send_text(200, metrics.REGISTRY.render(), "text/plain; version=0.0.4; charset=utf-8")
+                return
+            self._dispatch({
+                "/health": lambda q: (200, service.health()),
+                "/candidates": lambda q: (200, {"version": service.state.version,
+                                                "candidates": service.state.valid_candidates}),
+                "/recommend": lambda q: (200, service.recommend(q.get("seed", []))),
+            })
+
+        def do_POST(self) -> None:
+            def _mark(q):
+                titles = self._body().get("titles") or q.get("title", [])
+                if not titles:
+                    raise ValueError("No titles given")
+                return 200, service.mark(titles)
+
+            def _refresh(q):
+                fetch = bool(self._body().get("fetch")) or q.get("fetch", ["0"])[0] in ("1", "true")
+                service.refresh_async(fetch=fetch)
+                return 202, {"refreshing": True, "fetch": fetch, "version": service.state.version}
+
+            self._dispatch({"/mark": _mark, "/refresh": _refresh})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(f"{self.address_string()} - {format % args}")
+
+    return Handler
+
+
+def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+          workspace: Optional[Workspace] = None,
+          refresh_interval: float = SERVICE_REFRESH_INTERVAL) -> None:
+    """Loads state, warms the LLM and serves HTTP until interrupted."""
+    metrics.enable()
+    service = RecommendationService(workspace)
+    service.load()
+
+    gateway = get_gateway()
+    if LLM_WARMUP:
+        gateway.warm_up()
+    gateway.start_keep_alive(LLM_KEEP_ALIVE_INTERVAL)
+    service.start_periodic_refresh(refresh_interval)
+
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    logger.info(f"Serving on http://{host}:{port} (refresh every {refresh_interval:.0f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        service.stop()
+        server.server_close()
+        gateway.close()
@@ -0,0 +1,333 @@
+"""
+Catalog Snapshot Module
+
+Parsing the history and candidate JSON, observing every id into the
+crosswalk and rebuilding the candidate table costs seconds on large
+libraries, on every recommend run and every service refresh. Once a fetch
+has saved both files the agent also writes the parsed result to one compact
+binary file in the workspace data dir (SNAPSHOT_FILE_NAME), which later runs
+``mmap`` instead:
+
+    header       magic, format version, counts (SNAPSHOT_HEADER)
+    stamp        size/mtime of the JSON files and crosswalk it was built from
+    genres       uint64[rows]   genre bitmask per candidate
+    years        int32[rows]    release year per candidate (0 = unknown)
+    year keys    int32[years]   distinct years, in bitset order
+    key index    uint64[keys] sorted hashes of every row's typed and canonical
+                 key, then uint32[keys] the row of each
+    title index  uint64[rows] sorted normalized-title hashes, then uint32[rows]
+    bitsets      rows-bit sets: rows with an id, duplicate rows, rows watched in
+                 the history, one per genre, one per distinct year
+    strings      uint32 offsets, then UTF-8: genre names, then per candidate
+                 its bare id, label and normalized title
+
+Sections are 8-byte aligned and little-endian. The table a snapshot loads
+into (MappedCandidateTable) keeps the mapping open and reads the genre,
+year and string columns straight from it; id and title lookups binary-search
+the sorted indexes, so no postings are rebuilt. Only the bitsets are copied,
+into Python ints, because the filters combine them with ``&``/``|``. On
+big-endian hosts the numeric columns are copied and byte-swapped instead.
+
+A snapshot whose stamp no longer matches the files on disk (a fetch, a hand
+edit, a crosswalk update) is ignored and the JSON is parsed as before, so it
+can never serve stale data. Keys are hashed with 64-bit BLAKE2b; a collision
+would need ~2^32 titles.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import logger
+from core.candidate_table import CandidateTable, MappedCandidateTable
+from core.crosswalk import crosswalk_path, load_crosswalk
+from core.workspace import Workspace
+
+SNAPSHOT_FILE_NAME = "catalog_snapshot.bin"
+SNAPSHOT_MAGIC = b"TRKSNAP\x00"
+SNAPSHOT_VERSION = 2
+# magic, version, history events, watched keys, candidate rows, genres, distinct years,
+# key index entries, stamp bytes
+SNAPSHOT_HEADER = struct.Struct("<8sIIIIIIII")
+
+_file_lock = threading.Lock()  # recommend runs and service refreshes can write concurrently
+
+
+def snapshot_path(workspace: Workspace) -> Path:
+    return workspace.data_dir / SNAPSHOT_FILE_NAME
+
+
+def key_hash(key: str) -> int:
+    """64-bit hash of a typed/canonical media key."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def source_stamp(workspace: Workspace) -> bytes:
+    """Size and mtime of every file a snapshot is derived from."""
+    parts = []
+    for path in (workspace.history_file, workspace.candidates_file, crosswalk_path(workspace)):
+        try:
+            stat = os.stat(path)
+            parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path.name}:-")
+    return "\n".join(parts).encode("utf-8")
+
+
+def _pad(length: int) -> bytes:
+    return b"\x00" * (-length % 8)
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _bitset_width(rows: int) -> int:
+    return (rows + 63) // 64 * 8
+
+
+def _sorted_index(entries: List[Tuple[int, int]]) -> List[bytes]:
+    """A (hash, row) index as its sorted hash and row columns, each padded."""
+    entries.sort()
+    hashes = array("Q", [hashed for hashed, _ in entries])
+    rows = array("I", [row for _, row in entries])
+    return [_little_endian(hashes), _little_endian(rows), _pad(4 * len(rows))]
+
+
+def encode_snapshot(history_size: int, watched_keys: List[str], table: CandidateTable,
+                    stamp: bytes = b"") -> bytes:
+    """Serializes one catalog from a table built by ``CandidateTable.from_items``."""
+    genre_names = sorted(table.genre_vocab, key=table.genre_vocab.get)
+    genre_rows, year_rows = table.row_sets()
+    year_keys = sorted(year_rows)
+
+    key_entries = [(key_hash(key), row) for key, rows in table.key_rows().items() for row in rows]
+    title_entries = [(key_hash(title_key), row) for row, title_key in enumerate(table.title_keys)]
+
+    strings = list(genre_names)
+    for tid, label, title_key in zip(table.ids, table.labels, table.title_keys):
+        strings += (tid or "", label, title_key)
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = array("I", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    width = _bitset_width(table.size)
+    watched = table.mask_ids(watched_keys)
+    bitsets = [table.with_id, table.duplicates, watched, *genre_rows, *(year_rows[year] for year in year_keys)]
+    sections = [
+        SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, history_size, len(watched_keys),
+                             table.size, len(genre_names), len(year_keys), len(key_entries), len(stamp)),
+        stamp, _pad(len(stamp)),
+        _little_endian(array("Q", table.genre_masks)),
+        _little_endian(table.years), _pad(4 * table.size),
+        _little_endian(array("i", year_keys)), _pad(4 * len(year_keys)),
+        *_sorted_index(key_entries),
+        *_sorted_index(title_entries),
+        *(bitset.to_bytes(width, "little") for bitset in bitsets),
+        _little_endian(offsets), _pad(4 * len(offsets)),
+        *encoded,
+    ]
+    return b"".join(sections)
+
+
+class StringColumn(Sequence[str]):
+    """One per-row column of a snapshot's string table, decoded on access."""
+
+    __slots__ = ("_view", "_offsets", "_first", "_stride", "_size", "_empty")
+
+    def __init__(self, view: memoryview, offsets: Any, first: int, stride: int, size: int,
+                 empty: Optional[str] = "") -> None:
+        self._view, self._offsets = view, offsets
+        self._first, self._stride, self._size = first, stride, size
+        self._empty = empty  # what an empty string reads as (None for rows without an id)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, row: Any) -> Any:
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self._size))]
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError("row out of range")
+        index = self._first + row * self._stride
+        text = str(self._view[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+        return text or self._empty
+
+
+class Snapshot:
+    """
+    A memory-mapped catalog snapshot. Tables from candidate_table() read from
+    the mapping, which stays open while they are referenced; a snapshot that
+    never built one can be closed right away (context manager or close()).
+    """
+
+    def __init__(self, buffer: Any) -> None:
+        self._buffer = buffer
+        view = memoryview(buffer)
+        (magic, version, self.history_size, self.watched_count, self.rows, self._genre_count,
+         self._year_count, self._key_count, stamp_len) = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            view.release()
+            raise ValueError("not a catalog snapshot of this version")
+        offset = SNAPSHOT_HEADER.size
+        self.stamp = bytes(view[offset:offset + stamp_len])
+        offset += stamp_len + len(_pad(stamp_len))
+        self._sections: Dict[str, Tuple[int, int]] = {}
+        bitsets = 3 + self._genre_count + self._year_count
+        self._string_count = self._genre_count + 3 * self.rows
+        for name, width, count in (("genres", 8, self.rows), ("years", 4, self.rows),
+                                   ("year keys", 4, self._year_count),
+                                   ("key hashes", 8, self._key_count), ("key rows", 4, self._key_count),
+                                   ("title hashes", 8, self.rows), ("title rows", 4, self.rows),
+                                   ("bitsets", _bitset_width(self.rows), bitsets),
+                                   ("offsets", 4, self._string_count + 1)):
+            self._sections[name] = (offset, offset + width * count)
+            offset += width * count + len(_pad(width * count))
+        if offset > len(view):
+            view.release()
+            raise ValueError("truncated catalog snapshot")
+        self._strings_at = offset
+        self._view = view
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def _column(self, name: str, typecode: str) -> Any:
+        start, end = self._sections[name]
+        if sys.byteorder == "little":
+            return self._view[start:end].cast(typecode)  # zero-copy
+        column = array(typecode, self._view[start:end])
+        column.byteswap()
+        return column
+
+    def _bitsets(self) -> List[int]:
+        start, end = self._sections["bitsets"]
+        width = _bitset_width(self.rows)
+        return [int.from_bytes(self._view[at:at + width], "little") for at in range(start, end, width)]
+
+    @staticmethod
+    def _lookup(hashes: Any, rows: Any, key: str) -> List[int]:
+        target = key_hash(key)
+        index = bisect_left(hashes, target)
+        found = []
+        while index < len(hashes) and hashes[index] == target:
+            found.append(rows[index])
+            index += 1
+        return found
+
+    def candidate_table(self) -> MappedCandidateTable:
+        """The candidate table over the mapping, with the history's watched rows already marked."""
+        key_hashes, key_rows = self._column("key hashes", "Q"), self._column("key rows", "I")
+        title_hashes, title_rows = self._column("title hashes", "Q"), self._column("title rows", "I")
+        offsets = self._column("offsets", "I")
+        strings = self._view[self._strings_at:]
+        genre_names = list(StringColumn(strings, offsets, 0, 1, self._genre_count))
+
+        with_id, duplicates, watched, *row_sets = self._bitsets()
+        return MappedCandidateTable(
+            ids=StringColumn(strings, offsets, self._genre_count, 3, self.rows, empty=None),
+            labels=StringColumn(strings, offsets, self._genre_count + 1, 3, self.rows),
+            title_keys=StringColumn(strings, offsets, self._genre_count + 2, 3, self.rows),
+            years=self._column("years", "i"),
+            genre_masks=self._column("genres", "Q"),
+            genre_names=genre_names,
+            genre_rows=row_sets[:self._genre_count],
+            year_rows=dict(zip(self._column("year keys", "i"), row_sets[self._genre_count:])),
+            with_id=with_id, duplicates=duplicates, watched=watched,
+            key_rows=lambda key: self._lookup(key_hashes, key_rows, key),
+            title_rows=lambda title: self._lookup(title_hashes, title_rows, title),
+        )
+def load_snapshot(workspace: Optional[Workspace] = None) -> Optional[Snapshot]:
+    """
+    The workspace's snapshot, memory-mapped, or None when it is missing,
+    unreadable or older than the files it was built from.
+    """
+    ws = workspace or Workspace.default()
+    path = snapshot_path(ws)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = Snapshot(buffer)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Ignoring unreadable {path.name}: {e}")
+        return None
+    if snapshot.stamp != source_stamp(ws):
+        logger.info(f"{path.name} is older than the data files, parsing JSON instead")
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def write_snapshot(workspace: Optional[Workspace] = None,
+                   history: Optional[List[Dict[str, Any]]] = None,
+                   candidates: Optional[List[Dict[str, Any]]] = None,
+                   stamp: Optional[bytes] = None, table: Optional[CandidateTable] = None,
+                   watched_ids: Optional[Iterable[str]] = None) -> bool:
+    """
+    Writes the workspace's snapshot atomically (temp file + rename), reading
+    the history/candidates files unless they're given. ``stamp`` must be
+    taken before the given data was read; by default it is taken now.
+    A caller that already built the candidate ``table`` and ``watched_ids``
+    from that data (load_catalog) passes them in so they aren't rebuilt.
+
+    Returns whether a snapshot was written. Never raises: without one the
+    next run just parses the JSON.
+    """
+    from core.recommend import build_watched_ids, load_json
+
+    ws = workspace or Workspace.default()
+    try:
+        with _file_lock:
+            if not ws.history_file.exists() or not ws.candidates_file.exists():
+                return False
+            stamp = stamp if stamp is not None else source_stamp(ws)
+            history = history if history is not None else load_json(ws.history_file)
+            candidates = candidates if candidates is not None else load_json(ws.candidates_file)
+            if not history or not candidates:
+                return False
+            if table is None or watched_ids is None:
+                crosswalk = load_crosswalk(ws, history, candidates)
+                table = CandidateTable.from_items(candidates, crosswalk)
+                watched_ids = build_watched_ids(history, crosswalk)
+            if len(table.genre_vocab) > 64:
+                logger.warning("Too many genres for a catalog snapshot, skipping it")
+                return False
+            data = encode_snapshot(len(history), sorted(watched_ids), table, stamp=stamp)
+            path = snapshot_path(ws)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".snapshot-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+        logger.info(f"Wrote {path.name} ({table.size} candidates, {len(data) // 1024} KiB)")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not write the catalog snapshot: {e}")
+        return False
@@ -0,0 +1,162 @@
+"""
+Hierarchical History Summarization
+
+Lets the profile stage see the whole fetched history instead of the first
+PROFILE_ANALYSIS_LIMIT lines. The history is split into chunks, each chunk
+is summarized on the LLM (concurrently, up to LLM_PARALLEL_SLOTS), and the
+partial summaries are merged level by level until at most
+PROFILE_REDUCE_FANIN remain for the final profile prompt.
+
+Chunk boundaries are content-defined: a chunk ends after an event whose key
+hashes to a boundary, so adding new events or dropping the oldest ones only
+changes the chunks at the edges. Summaries are cached by the hash of their
+input, so unchanged chunks are never summarized twice.
+"""
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import (
+    MODEL_NAME, TEMPERATURE, LLM_PARALLEL_SLOTS,
+    PROFILE_CHUNK_SIZE, PROFILE_REDUCE_FANIN, logger
+)
+from core.llm_gateway import get_gateway
+from core.serialization import read_json, write_json
+from core.workspace import Workspace
+
+CACHE_FILE_NAME = "profile_chunks.json"
+PROMPT_VERSION = 2  # Bump when the prompts below change to invalidate cached summaries
+
+CHUNK_PROMPT = """Summarize this part of a viewer's watch history ({count} titles) in 3-5 short bullet points: dominant genres and themes, standout titles, and any shift in taste within the period.
+
+{lines}"""
+
+REDUCE_PROMPT = """Merge these summaries of consecutive periods of a viewer's watch history (oldest first) into 4-6 short bullet points. Keep lasting preferences, note how taste changed over time, and drop repetition.
+
+{lines}"""
+
+
+def chunk_history(history: Sequence[Dict[str, Any]], key: Callable[[Dict[str, Any]], str],
+                  size: int = PROFILE_CHUNK_SIZE) -> List[List[Dict[str, Any]]]:
+    """
+    Splits history (newest first) into oldest-first chunks of about ``size`` events.
+
+    A chunk closes after an event whose key hashes to a boundary (once it has
+    at least size/2 events) or when it reaches 2*size events.
+    """
+    chunks: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    minimum, maximum = max(1, size // 2), max(1, size * 2)
+    for item in reversed(history):
+        current.append(item)
+        boundary = zlib.crc32(key(item).encode("utf-8")) % size == 0
+        if (boundary and len(current) >= minimum) or len(current) >= maximum:
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SummaryCache:
+    """Partial summaries keyed by a hash of their prompt input."""
+
+    def __init__(self, workspace: Workspace) -> None:
+        self.path = workspace.data_dir / CACHE_FILE_NAME
+        self.entries: Dict[str, str] = {}
+        self.used: Dict[str, str] = {}
+        if self.path.exists():
+            try:
+                self.entries = read_json(self.path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable summary cache {self.path}: {e}")
+
+    @staticmethod
+    def key(kind: str, lines: Sequence[str]) -> str:
+        import hashlib  # deferred: profile's startup budget (scripts/startup_check.py)
+
+        payload = json.dumps([PROMPT_VERSION, MODEL_NAME, kind, list(lines)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        summary = self.entries.get(key)
+        if summary is not None:
+            self.used[key] = summary
+        return summary
+
+    def put(self, key: str, summary: str) -> None:
+        self.entries[key] = summary
+        self.used[key] = summary
+
+    def save(self, prune: bool = True) -> None:
+        """Writes the cache; pruning keeps only entries used by this build so it never outgrows the history."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json(self.path, self.used if prune else {**self.entries, **self.used})
+
+
+def _summarize_all(kind: str, groups: List[List[str]], cache: SummaryCache) -> List[str]:
+    """Summarizes each group of lines, reusing cached results; misses run concurrently."""
+    template = CHUNK_PROMPT if kind == "chunk" else REDUCE_PROMPT
+    keys = [SummaryCache.key(kind, lines) for lines in groups]
+    results = [cache.get(k) for k in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        logger.info(f"Summarizing {len(missing)} of {len(groups)} {kind}s "
+                    f"({len(groups) - len(missing)} cached)...")
+        gateway = get_gateway()
+
+        def _run(i: int) -> str:
+            prompt = template.format(count=len(groups[i]), lines="\n".join(groups[i]))
+            return gateway.complete(prompt, temperature=TEMPERATURE).strip()
+
+        workers = max(1, min(LLM_PARALLEL_SLOTS, len(missing)))
+        error: Optional[Exception] = None
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarize") as pool:
+            futures = {pool.submit(_run, i): i for i in missing}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                cache.put(keys[i], results[i])
+        if error is not None:
+            # Successful summaries are cached; a retry only redoes the failures
+            raise error
+    return [r for r in results if r is not None]
+
+
+def summarize_history(history: Sequence[Dict[str, Any]], workspace: Workspace,
+                      encode: Callable[[Sequence[Dict[str, Any]]], List[str]],
+                      key: Callable[[Dict[str, Any]], str]) -> List[str]:
+    """
+    Map-reduce summaries covering the whole history, oldest period first.
+
+    Args:
+        history: Watch history, newest first.
+        workspace: Workspace whose data dir holds the summary cache.
+        encode: Renders a chunk of events as prompt lines.
+        key: Stable event key used for chunk boundaries.
+
+    Returns:
+        At most PROFILE_REDUCE_FANIN summaries for the final profile prompt.
+    """
+    cache = SummaryCache(workspace)
+    try:
+        chunks = chunk_history(history, key, PROFILE_CHUNK_SIZE)
+        summaries = _summarize_all("chunk", [encode(chunk) for chunk in chunks], cache)
+        fan_in = max(2, PROFILE_REDUCE_FANIN)
+        while len(summaries) > fan_in:
+            # Even groups, so no level ends with a lone summary
+            groups_needed = -(-len(summaries) // fan_in)
+            size = -(-len(summaries) // groups_needed)
+            groups = [summaries[i:i + size] for i in range(0, len(summaries), size)]
+            summaries = _summarize_all("reduce", groups, cache)
+    except Exception:
+        # Keep what was summarized so far, including entries this run never reached
+        cache.save(prune=False)
+        raise
+    cache.save()
+    return summaries
@@ -0,0 +1,292 @@
+"""
+Tracing Module
+
+Lightweight spans for finding where a run spends its time. Tracing is off
+by default and a disabled ``span()`` is a shared no-op, so instrumented
+code pays almost nothing. ``cli.py --trace out.json`` enables recording,
+writes the spans in Chrome trace format (open in chrome://tracing or
+ui.perfetto.dev) and prints a summary table. Listeners (core/metrics.py)
+also receive every finished span, with or without recording.
+
+Spans carry attributes; ``annotate()`` adds them to the innermost open span
+of the current thread, so helpers (retry loops, response parsing) can
+report without being handed the span. Categories in use:
+
+    cli     the whole command
+    stage   pipeline stages
+    http    every requests call (endpoint, status, bytes)
+    llm     gateway calls (tokens, retries, time to first token, tokens/s)
+    io      credential and data file reads
+    filter  candidate filtering (pool size, survivors, removals per filter)
+"""
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+# Attributes summed per span name in the summary table
+SUMMED_ATTRS = ("bytes", "prompt_tokens", "completion_tokens", "retries")
+
+
+class Span:
+    """One timed operation; use as a context manager."""
+
+    __slots__ = ("name", "category", "attrs", "start", "duration", "thread_id", "_tracer")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, attrs: Dict[str, Any]) -> None:
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+        self.start = 0.0
+        self.duration = 0.0
+        self.thread_id = 0
+
+    def set(self, **attrs: Any) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self) -> "Span":
+        self.thread_id = threading.get_ident()
+        self._tracer._push(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self._tracer._pop(self)
+
+
+class _NoopSpan:
+    """Stand-in returned while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> "_NoopSpan":
+        return self
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """Collects finished spans from every thread."""
+
+    def __init__(self) -> None:
+        self.enabled = False  # spans are created (recording or listeners)
+        self.recording = False  # finished spans are kept for export
+        self.listeners: List[Callable[[Span], None]] = []
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self.thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _push(self, span: Span) -> None:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+
+    def _pop(self, span: Span) -> None:
+        stack = self._local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+        if self.recording:
+            with self._lock:
+                self.spans.append(span)
+                self.thread_names.setdefault(span.thread_id, threading.current_thread().name)
+        for listener in self.listeners:
+            try:
+                listener(span)
+            except Exception:
+                pass  # instrumentation must never break the traced code
+
+    def current(self) -> Optional[Span]:
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans = []
+            self.thread_names = {}
+            self.origin = time.perf_counter()
+
+
+_tracer = Tracer()
+
+
+def enable() -> None:
+    """Starts recording spans (and instruments requests)."""
+    _tracer.reset()
+    _tracer.recording = True
+    _tracer.enabled = True
+    instrument_requests()
+
+
+def disable() -> None:
+    """Stops recording; spans stay active while listeners are registered."""
+    _tracer.recording = False
+    _tracer.enabled = bool(_tracer.listeners)
+
+
+def is_enabled() -> bool:
+    """Whether spans are being recorded for a trace file."""
+    return _tracer.recording
+
+
+def add_listener(listener: Callable[[Span], None]) -> None:
+    """Calls ``listener(span)`` for every finished span from now on."""
+    if listener not in _tracer.listeners:
+        _tracer.listeners.append(listener)
+    _tracer.enabled = True
+    instrument_requests()
+
+
+def remove_listener(listener: Callable[[Span], None]) -> None:
+    if listener in _tracer.listeners:
+        _tracer.listeners.remove(listener)
+    _tracer.enabled = _tracer.recording or bool(_tracer.listeners)
+
+
+def span(name: str, category: str = "", **attrs: Any):
+    """Context manager timing ``name``; a no-op unless tracing is enabled."""
+    if not _tracer.enabled:
+        return _NOOP
+    return Span(_tracer, name, category, attrs)
+
+
+def annotate(**attrs: Any) -> None:
+    """Adds attributes to the innermost open span of this thread, if any."""
+    if _tracer.enabled:
+        current = _tracer.current()
+        if current is not None:
+            current.attrs.update(attrs)
+
+
+def spans() -> List[Span]:
+    with _tracer._lock:
+        return list(_tracer.spans)
+
+
+# ------------------------------------------------------------------------------
+# HTTP instrumentation
+# ------------------------------------------------------------------------------
+
+_instrumented = False
+
+
+def endpoint_name(url: str) -> str:
+    """Path of ``url`` with numeric ids collapsed, e.g. '/movies/:id' (query dropped)."""
+    from urllib.parse import urlparse
+    return _ID_SEGMENT.sub("/:id", urlparse(url).path) or "/"
+
+
+def instrument_requests() -> None:
+    """Wraps ``requests.Session.send`` (used by requests.get/post too) in http spans. Idempotent."""
+    global _instrumented
+    if _instrumented:
+        return
+    try:
+        import requests
+    except ImportError:
+        return
+    original = requests.Session.send
+
+    def send(self, request, **kwargs):
+        if not _tracer.enabled:
+            return original(self, request, **kwargs)
+        endpoint = endpoint_name(request.url)
+        with span(f"{request.method} {endpoint}", "http", endpoint=endpoint, method=request.method) as s:
+            response = original(self, request, **kwargs)
+            # Streamed bodies are left unread; their size is whatever the server declared
+            size = (int(response.headers.get("Content-Length") or 0) if kwargs.get("stream")
+                    else len(response.content))
+            s.set(status=response.status_code, bytes=size)
+            return response
+
+    requests.Session.send = send
+    _instrumented = True
+
+
+# ------------------------------------------------------------------------------
+# Export
+# ------------------------------------------------------------------------------
+
+def _json_safe(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+
+
+def to_chrome_trace(recorded: Optional[List[Span]] = None) -> Dict[str, Any]:
+    """Spans as Chrome trace 'complete' events (timestamps in microseconds)."""
+    recorded = spans() if recorded is None else recorded
+    events: List[Dict[str, Any]] = []
+    tids: Dict[int, int] = {}
+    for s in sorted(recorded, key=lambda s: s.start):
+        tid = tids.setdefault(s.thread_id, len(tids) + 1)
+        events.append({
+            "name": s.name, "cat": s.category or "default", "ph": "X", "pid": 1, "tid": tid,
+            "ts": round((s.start - _tracer.origin) * 1e6, 1), "dur": round(s.duration * 1e6, 1),
+            "args": {k: _json_safe(v) for k, v in s.attrs.items()},
+        })
+    for thread_id, tid in tids.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                       "args": {"name": _tracer.thread_names.get(thread_id, f"thread-{tid}")}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_trace(path) -> int:
+    """Writes the Chrome trace to ``path``; returns the number of spans."""
+    recorded = spans()
+    with open(path, "w") as f:
+        json.dump(to_chrome_trace(recorded), f)
+    return len(recorded)
+
+
+def summarize(recorded: Optional[List[Span]] = None) -> List[Dict[str, Any]]:
+    """Per span name: category, count, total/mean/max seconds and summed attributes; slowest first."""
+    recorded = spans() if recorded is None else recorded
+    rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for s in recorded:
+        row = rows.get((s.category, s.name))
+        if row is None:
+            row = rows[(s.category, s.name)] = {"name": s.name, "category": s.category, "count": 0,
+                                                "total": 0.0, "max": 0.0, "errors": 0}
+        row["count"] += 1
+        row["total"] += s.duration
+        row["max"] = max(row["max"], s.duration)
+        row["errors"] += "error" in s.attrs
+        for key in SUMMED_ATTRS:
+            value = s.attrs.get(key)
+            if isinstance(value, (int, float)):
+                row[key] = row.get(key, 0) + value
+    for row in rows.values():
+        row["mean"] = row["total"] / row["count"]
+    return sorted(rows.values(), key=lambda r: -r["total"])
+
+
+def format_summary(rows: List[Dict[str, Any]], limit: int = 25) -> List[str]:
+    """Summary rows as aligned text lines."""
+    lines = [f"{'Span':<40} {'Cat':<6} {'Count':>6} {'Total':>9} {'Mean':>9} {'Max':>9}  Attributes"]
+    for row in rows[:limit]:
+        extras = [f"{key}={row[key]:,}" for key in SUMMED_ATTRS if row.get(key)]
+        if row["errors"]:
+            extras.append(f"errors={row['errors']}")
+        lines.append(
+            f"{row['name'][:40]:<40} {row['category'][:6]:<6} {row['count']:>6} "
+            f"{row['total'] * 1000:>7.1f}ms {row['mean'] * 1000:>7.1f}ms {row['max'] * 1000:>7.1f}ms  {' '.join(extras)}"
+        )
+    if len(rows) > limit:
+        lines.append(f"... {len(rows) - limit} more span names in the trace file")
+    return lines
@@ -0,0 +1,149 @@
+"""
+Workspace Module
+
+A Workspace bundles everything that belongs to one user: credentials,
+fetched data, generated outputs and preferences. Core modules take an
+optional workspace and fall back to the global paths in config.py, so the
+single-user CLI keeps working unchanged while batch mode can run many users
+side by side in one process.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from config import (
+    BASE_DIR, DATA_DIR, OUTPUT_DIR,
+    TOKEN_FILE, SECRETS_FILE, SIMKL_TOKEN_FILE, PREFERENCES_FILE,
+    HISTORY_FILE, CANDIDATES_FILE, PROFILE_FILE, PROFILE_MARKDOWN_FILE, RECOMMENDATIONS_FILE,
+    SERVICE_PROVIDER
+)
+
+USERS_DIR: Path = BASE_DIR / "users"
+PROVIDERS = ("trakt", "simkl", "both")
+_FILE_SUFFIX = {"simkl": "_simkl", "both": "_merged"}  # history/candidates file name per provider
+
+# Keys a users.json entry may set explicitly (relative paths resolve against the user root)
+_PATH_FIELDS = (
+    "token_file", "secrets_file", "simkl_token_file", "preferences_file",
+    "data_dir", "output_dir", "history_file", "candidates_file",
+    "profile_file", "profile_markdown_file", "recommendations_file",
+)
+
+
+class Workspace(NamedTuple):
+    """Per-user file layout and provider selection (a NamedTuple: immutable and cheap to import)."""
+
+    name: str
+    provider: str
+    token_file: Path
+    secrets_file: Path
+    simkl_token_file: Path
+    preferences_file: Path
+    data_dir: Path
+    output_dir: Path
+    history_file: Path
+    candidates_file: Path
+    profile_file: Path
+    profile_markdown_file: Path
+    recommendations_file: Path
+
+    @classmethod
+    def default(cls) -> "Workspace":
+        """The single-user layout defined in config.py."""
+        return cls(
+            name="default",
+            provider=SERVICE_PROVIDER,
+            token_file=TOKEN_FILE,
+            secrets_file=SECRETS_FILE,
+            simkl_token_file=SIMKL_TOKEN_FILE,
+            preferences_file=PREFERENCES_FILE,
+            data_dir=DATA_DIR,
+            output_dir=OUTPUT_DIR,
+            history_file=HISTORY_FILE,
+            candidates_file=CANDIDATES_FILE,
+            profile_file=PROFILE_FILE,
+            profile_markdown_file=PROFILE_MARKDOWN_FILE,
+            recommendations_file=RECOMMENDATIONS_FILE,
+        )
+
+    @classmethod
+    def for_user(cls, name: str, root: Optional[Path] = None, provider: str = SERVICE_PROVIDER,
+                 **overrides: Union[str, Path]) -> "Workspace":
+        """
+        Layout rooted at ``root`` (default: users/<name>).
+
+        Credentials, preferences, data/ and output/ live under the root. A user
+        without their own secrets.json shares the global API app credentials.
+        """
+        root = Path(root) if root else USERS_DIR / name
+        if not root.is_absolute():
+            root = BASE_DIR / root
+        data_dir = root / "data"
+        output_dir = root / "output"
+        suffix = _FILE_SUFFIX.get(provider, "")
+        secrets_file = root / "secrets.json"
+
+        workspace = cls(
+            name=name,
+            provider=provider,
+            token_file=root / "token.json",
+            secrets_file=secrets_file if secrets_file.exists() else SECRETS_FILE,
+            simkl_token_file=root / "simkl_token.json",
+            preferences_file=root / "preferences.json",
+            data_dir=data_dir,
+            output_dir=output_dir,
+            history_file=data_dir / f"watch_history{suffix}.json",
+            candidates_file=data_dir / f"candidates{suffix}.json",
+            profile_file=output_dir / "Trakt Taste Profile.json",
+            profile_markdown_file=output_dir / "Trakt Taste Profile.md",
+            recommendations_file=output_dir / "Trakt Recommendations.md",
+        )
+        paths = {k: (Path(v) if Path(v).is_absolute() else root / v) for k, v in overrides.items()}
+        return workspace._replace(**paths) if paths else workspace
+
+    def ensure_dirs(self) -> None:
+        """Creates the data and output directories."""
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+
+def load_users(path: Path) -> List[Workspace]:
+    """
+    Reads a users.json file into workspaces.
+
+    Accepts a list of entries or ``{"users": [...]}``. Each entry needs a
+    ``name`` and may set ``root``, ``provider`` (one of PROVIDERS) and any
+    path field, e.g.::
+
+        {"users": [{"name": "alice"}, {"name": "bob", "provider": "simkl"}]}
+
+    Raises:
+        ValueError: If an entry has no name, names repeat, a key is unknown,
+            or the provider is not one of PROVIDERS.
+    """
+    with open(path, "r") as f:
+        raw: Any = json.load(f)
+    entries: List[Dict[str, Any]] = raw.get("users", []) if isinstance(raw, dict) else raw
+
+    workspaces = []
+    seen = set()
+    for entry in entries:
+        name = entry.get("name")
+        if not name:
+            raise ValueError(f"User entry without a name in {path}: {entry}")
+        if name in seen:
+            raise ValueError(f"Duplicate user '{name}' in {path}")
+        seen.add(name)
+
+        unknown = set(entry) - {"name", "root", "provider"} - set(_PATH_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown keys for user '{name}': {', '.join(sorted(unknown))}")
+        provider = entry.get("provider", SERVICE_PROVIDER)
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider '{provider}' for user '{name}'. Choose from {', '.join(PROVIDERS)}.")
+
+        overrides = {k: entry[k] for k in _PATH_FIELDS if k in entry}
+        workspaces.append(Workspace.for_user(
+            name, entry.get("root"), provider, **overrides
+        ))
+    return workspaces
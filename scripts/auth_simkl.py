@@ -8,7 +8,6 @@ Directs user to authorization URL and exchanges code for access token.
 import json
 import sys
 import logging
-import webbrowser
 from typing import Dict, Any, Optional
 import requests
 
@@ -16,7 +15,8 @@ from config import (
     SIMKL_BASE_URL,
     SIMKL_TOKEN_FILE,
     SECRETS_FILE,
-    logger
+    logger,
+    configure_logging
 )
 
 def load_simkl_secrets() -> Dict[str, str]:
@@ -70,6 +70,7 @@ def authenticate() -> Optional[Dict[str, Any]]:
     
     # Try to open browser
     try:
+        import webbrowser
         webbrowser.open(auth_url)
     except:
         pass
@@ -107,4 +108,5 @@ def authenticate() -> Optional[Dict[str, Any]]:
         return None
 
 if __name__ == "__main__":
+    configure_logging()
     authenticate()
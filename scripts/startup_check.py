@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Startup Budget Check
+
+Measures the import cost of each cli.py subcommand with `python -X importtime`
+and compares it with STARTUP_BUDGET_MS. The interpreter's own startup (site,
+encodings, ...) is measured separately and subtracted, so the numbers show
+what the CLI itself adds. Commands whose runtime is dominated by network
+round-trips or that run as daemons are reported but not held to the budget.
+
+Usage:
+    python scripts/startup_check.py            # all commands
+    python scripts/startup_check.py fetch mark # selected commands
+    python scripts/startup_check.py --top 10   # show the 10 most expensive imports
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from config import STARTUP_BUDGET_MS
+
+# Reported, but not held to the budget
+EXEMPT = {
+    "fetch": "network-bound (requests)",
+    "mark": "network-bound (requests)",
+    "auth-simkl": "interactive",
+    "serve": "long-running daemon",
+}
+
+
+def measure(code: str) -> Dict[str, Tuple[int, int]]:
+    """Runs ``code`` under -X importtime; returns {module: (self_us, cumulative_us)}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def command_cost(command: str, baseline: Dict[str, Tuple[int, int]]) -> Tuple[float, List[Tuple[str, int]]]:
+    """Milliseconds of imports a command adds on top of a bare interpreter, plus the heaviest modules."""
+    code = "import cli" if command == "--help" else f"import cli; cli.import_command({command!r})"
+    modules = measure(code)
+    added = {name: times for name, times in modules.items() if name not in baseline}
+    total_ms = sum(self_us for self_us, _ in added.values()) / 1000
+    heaviest = sorted(((name, cum) for name, (_, cum) in added.items()), key=lambda x: -x[1])
+    return total_ms, heaviest
+
+
+def main() -> None:
+    import cli
+
+    parser = argparse.ArgumentParser(description="Per-command import cost of cli.py")
+    parser.add_argument("commands", nargs="*", help="Commands to check (default: all)")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest imports to list per command")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS, help="Budget in ms")
+    args = parser.parse_args()
+
+    commands = args.commands or ["--help"] + list(cli.COMMAND_IMPORTS)
+    baseline = measure("pass")
+
+    print(f"{'Command':<12} {'Imports':>9}  Heaviest")
+    print("-" * 70)
+    over_budget = []
+    for command in commands:
+        total_ms, heaviest = command_cost(command, baseline)
+        top = ", ".join(f"{name} {cum / 1000:.1f}ms" for name, cum in heaviest[:args.top])
+        if command in EXEMPT:
+            flag = "  "
+            top = f"[{EXEMPT[command]}] {top}"
+        elif total_ms > args.budget:
+            flag = " !"
+            over_budget.append(command)
+        else:
+            flag = "  "
+        print(f"{command:<12} {total_ms:>7.1f}ms{flag} {top}")
+
+    print("-" * 70)
+    if over_budget:
+        print(f"Over the {args.budget:.0f}ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+    print(f"All commands within the {args.budget:.0f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
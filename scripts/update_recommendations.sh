@@ -19,21 +19,16 @@ if [ $# -eq 0 ]; then
 fi
 
 # Step 1: Mark items as watched
-echo "Step 1/4: Marking items as watched..."
-$PYTHON search_and_mark.py "$@"
+echo "Step 1/2: Marking items as watched..."
+$PYTHON cli.py mark "$@"
 echo ""
 
-# Step 2: Fetch latest data from Trakt
-echo "Step 2/4: Fetching latest data from Trakt..."
-$PYTHON fetch_data.py
+# Step 2: Fetch, profile and recommend (unchanged stages are skipped)
+echo "Step 2/2: Fetching data and generating new recommendations..."
+$PYTHON cli.py run
 echo ""
 
-# Step 3: Generate recommendations
-echo "Step 3/4: Generating new recommendations..."
-$PYTHON recommend.py
-echo ""
-
-# Step 4: Done!
+# Done!
 echo "=========================================="
 echo "✅ Workflow Complete!"
 echo "=========================================="
@@ -3,19 +3,18 @@
 Helper script to validate LLM connection and model availability
 """
 import sys
-from openai import OpenAI
-from config import API_BASE_URL, MODEL_NAME, API_KEY
+from config import API_BASE_URL, MODEL_NAME
+from core.llm_gateway import get_gateway
 
 def validate_llm():
     """Validate LLM server connection and model availability"""
     try:
         print(f"Connecting to {API_BASE_URL}...")
-        client = OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
+        gateway = get_gateway()
         
         # List available models
         print("Fetching available models...")
-        models = client.models.list()
-        available_models = [m.id for m in models.data]
+        available_models = gateway.list_models()
         
         print(f"\n✅ Connected to LLM server")
         print(f"Available models ({len(available_models)}):")
@@ -29,13 +28,7 @@ def validate_llm():
             
             # Test the model with a simple request
             print(f"\nTesting model response...")
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[{"role": "user", "content": "Reply with just 'OK'"}],
-                temperature=0.1,
-                max_tokens=10
-            )
-            result = response.choices[0].message.content
+            result = gateway.complete("Reply with just 'OK'", temperature=0.1, max_tokens=10)
             print(f"✅ Model responded: {result}")
             return True
         else:
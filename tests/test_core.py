@@ -13,7 +13,7 @@ from unittest.mock import patch, MagicMock
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from config import BASE_DIR, DATA_DIR
+from config import BASE_DIR, DATA_DIR, ensure_dirs
 
 
 class TestConfig:
@@ -26,7 +26,21 @@ class TestConfig:
     
     def test_data_dir_exists(self):
         """DATA_DIR should exist or be creatable."""
+        ensure_dirs()
         assert DATA_DIR.exists()
+    
+    def test_cli_import_is_lazy(self):
+        """Importing the CLI must not pull in provider or LLM modules."""
+        import subprocess
+        
+        code = (
+            "import sys, cli; "
+            "heavy = [m for m in ('requests', 'openai', 'webbrowser', 'core.fetch_data', 'core.recommend') if m in sys.modules]; "
+            "print(','.join(heavy))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == ""
 
 
 class TestRecommendFiltering:
@@ -82,7 +96,7 @@ class TestRecommendFiltering:
             {"movie": {"title": "Watched", "year": 2025, "ids": {"trakt": 1}, "genres": []}},
             {"movie": {"title": "Not Watched", "year": 2025, "ids": {"trakt": 2}, "genres": []}}
         ]
-        watched_ids = {1}
+        watched_ids = {"movie:trakt:1"}
         
         result = filter_candidates(candidates, watched_ids)
         assert len(result) == 1
@@ -120,6 +134,1045 @@ class TestRecommendFiltering:
         assert "Good Movie" in result[0]
 
 
+class TestCandidateTable:
+    """Test the columnar candidate representation."""
+    
+    def test_genre_vocab_is_interned_case_insensitive(self):
+        """Genres are interned once and matched regardless of case."""
+        from core.candidate_table import CandidateTable, popcount
+        
+        table = CandidateTable.from_items([
+            {"movie": {"title": "A", "year": 2020, "ids": {"trakt": 1}, "genres": ["Horror", "drama"]}},
+            {"show": {"title": "B", "year": 2021, "ids": {"trakt": 2}, "genres": ["horror"]}}
+        ])
+        assert len(table.genre_vocab) == 2
+        assert popcount(table.mask_genres(["HORROR"])) == 2
+        assert table.rows(table.mask_genres(["Drama"])) == [0]
+    
+    def test_filter_candidates_min_year(self):
+        """Items older than min_year are dropped, unknown years are kept."""
+        from core.recommend import filter_candidates
+        
+        candidates = [
+            {"movie": {"title": "Old", "year": 1999, "ids": {"trakt": 1}, "genres": []}},
+            {"movie": {"title": "New", "year": 2022, "ids": {"trakt": 2}, "genres": []}},
+            {"movie": {"title": "Undated", "ids": {"trakt": 3}, "genres": []}}
+        ]
+        
+        result = filter_candidates(candidates, set(), min_year=2010)
+        assert result == ["New (2022)", "Undated"]
+
+
+class TestMediaModel:
+    """Test the typed MediaItem/HistoryEvent model."""
+
+    def test_events_share_interned_media(self):
+        """Repeat watches share one MediaItem; genre tuples are shared across titles."""
+        from core.media import load_history
+
+        show = {"title": "Dark", "year": "2017", "ids": {"trakt": 7}, "genres": ["drama", "sci-fi"]}
+        events = load_history([
+            {"show": dict(show), "episode": {"season": 1, "runtime": 60}, "watched_at": "2024-01-02T10:00:00.000Z"},
+            {"show": dict(show), "episode": {"season": 2}, "watched_at": "2024-01-01T10:00:00.000Z"},
+            {"movie": {"title": "Arrival", "ids": {"trakt": 7}, "genres": ["drama", "sci-fi"], "runtime": 116}},
+            {"type": "unknown"},
+        ])
+        assert len(events) == 3
+        assert events[0].media is events[1].media and events[0].media.key == "show:trakt:7"
+        assert events[2].media.key == "movie:trakt:7" and events[2].media.genres is events[0].media.genres
+        assert (events[0].runtime, events[1].season, events[0].media.year) == (60, 2, 2017)
+
+    def test_movie_and_show_ids_do_not_collide(self):
+        """A watched movie doesn't remove the show with the same Trakt id; both survive dedupe."""
+        from core.candidate_table import CandidateTable
+        from core.recommend import build_watched_ids, filter_candidates
+        from core import fetch_data, mark_watched
+
+        movie = {"movie": {"title": "Same Id Movie", "year": 2020, "ids": {"trakt": 5}, "genres": []}}
+        show = {"show": {"title": "Same Id Show", "year": 2021, "ids": {"trakt": 5}, "genres": []}}
+        assert filter_candidates([movie, show], build_watched_ids([movie])) == ["Same Id Show (2021)"]
+        with patch.object(fetch_data, "fetch_category", side_effect=[[movie], [show], [movie], []]):
+            assert fetch_data.fetch_candidates() == [movie, show]
+        # Bare ids are ambiguous and rejected; marking returns typed keys
+        for bare in ({"5"}, {5}):
+            with pytest.raises(ValueError, match="typed keys"):
+                filter_candidates(CandidateTable.from_items([movie, show]), bare)
+        with patch("core.mark_watched.search_id", return_value=(5, "movie")), \
+             patch("core.mark_watched.mark_watched_ids", return_value=True):
+            marked = mark_watched.process_titles(["Same Id Movie"])
+        assert marked == ["movie:trakt:5"]
+        assert filter_candidates(CandidateTable.from_items([movie, show]), set(marked)) == ["Same Id Show (2021)"]
+
+    def test_typed_watched_keys_match_candidates_with_genres(self):
+        """Rows are indexed by their typed key however many genres they carry."""
+        from core.candidate_table import CandidateTable
+        from core.recommend import build_watched_ids, filter_candidates
+
+        history = [{"movie": {"title": "Dune", "ids": {"trakt": 1}}}]
+        candidates = [
+            {"movie": {"title": "Dune", "year": 2021, "ids": {"trakt": 1}, "genres": ["sci-fi", "drama"]}},
+            {"movie": {"title": "X", "year": 2021, "ids": {"trakt": 2}, "genres": ["drama"]}},
+        ]
+        assert build_watched_ids(history) == {"movie:trakt:1"}
+        assert filter_candidates(candidates, build_watched_ids(history)) == ["X (2021)"]
+        table = CandidateTable.from_items(candidates)
+        assert table.mask_ids(["movie:trakt:1"]) == 0b01 and table.mask_ids(["drama"]) == 0
+
+
+class TestCrosswalk:
+    """Test cross-provider id matching through the crosswalk."""
+
+    def test_watched_on_one_provider_filters_the_other(self):
+        """A Trakt watch removes the Simkl candidate sharing its IMDb id; cross-provider duplicates go too."""
+        from core.crosswalk import Crosswalk
+        from core.candidate_table import CandidateTable
+        from core.recommend import build_watched_ids, filter_candidates
+
+        history = [{"movie": {"title": "Arrival", "ids": {"trakt": 1, "imdb": "tt2543164"}}}]
+        candidates = [
+            {"movie": {"title": "Arrival", "year": 2016, "ids": {"simkl": 9, "imdb": "tt2543164"}}},
+            {"movie": {"title": "Dune", "year": 2021, "ids": {"trakt": 2, "imdb": "tt1160419"}}},
+            {"movie": {"title": "Dune", "year": 2021, "ids": {"simkl": 8, "imdb": "tt1160419"}}},
+        ]
+        assert filter_candidates(candidates, build_watched_ids(history)) == ["Arrival (2016)", "Dune (2021)", "Dune (2021)"]
+
+        crosswalk = Crosswalk()
+        crosswalk.observe(history + candidates)
+        assert crosswalk.canonical("movie", {"simkl": 9}) == "movie:trakt:1"
+        table = CandidateTable.from_items(candidates, crosswalk)
+        assert filter_candidates(table, build_watched_ids(history, crosswalk)) == ["Dune (2021)"]
+
+    def test_update_persists_links(self, tmp_path):
+        """Provider responses are merged into the workspace file; unchanged data doesn't rewrite it."""
+        from core.crosswalk import crosswalk_path, load_crosswalk, update_crosswalk
+        from core.workspace import Workspace
+
+        ws = Workspace.for_user("p", tmp_path)
+        assert update_crosswalk([{"show": {"title": "Dark", "ids": {"simkl": 3, "tvdb": 334824}}}], ws) == 1
+        assert update_crosswalk([{"show": {"title": "Dark", "ids": {"trakt": 4, "tvdb": 334824}}}], ws) == 1
+        path = crosswalk_path(ws)
+        mtime = path.stat().st_mtime_ns
+        update_crosswalk([{"show": {"ids": {"trakt": 4, "simkl": 3}}}, {"type": "unknown"}], ws)
+        assert path.stat().st_mtime_ns == mtime
+        assert load_crosswalk(ws).canonical("show", {"simkl": 3}) == "show:trakt:4"
+
+    def test_merged_fetch(self, tmp_path):
+        """Both providers are fetched concurrently and merged into one store without double counting."""
+        import threading
+        from core import fetch_data, fetch_data_simkl, fetch_merged
+        from core.workspace import Workspace
+
+        ws = Workspace.for_user("m", tmp_path, provider="both")
+        both_running = threading.Barrier(2, timeout=5)  # breaks unless the providers overlap
+
+        def respond(items):
+            def fetch(*args, **kwargs):
+                both_running.wait()
+                return items
+            return fetch
+
+        arrival = {"title": "Arrival", "year": 2016, "ids": {"trakt": 1, "imdb": "tt2543164"}}
+        trakt_history = [{"id": 10, "movie": arrival, "watched_at": "2024-01-02T00:00:00.000Z"}]
+        simkl_history = [{"movie": {"title": "Arrival", "year": 2016, "ids": {"simkl": 9, "imdb": "tt2543164"}}},
+                         {"show": {"title": "Dark", "year": 2017, "ids": {"simkl": 3}}}]
+        with patch.object(fetch_data, "fetch_history", side_effect=respond(trakt_history)), \
+             patch.object(fetch_data_simkl, "fetch_history", side_effect=respond(simkl_history)), \
+             patch.object(fetch_data, "fetch_candidates", side_effect=respond([{"movie": dict(arrival)}])), \
+             patch.object(fetch_data_simkl, "fetch_candidates", side_effect=respond(simkl_history[:1])):
+            fetch_merged.save_history(ws)
+            fetch_merged.save_candidates(ws)
+
+        # Only main() snapshots the catalog, once both halves are saved
+        from core.snapshot import snapshot_path
+        assert not snapshot_path(ws).exists()
+        assert ws.history_file.name == "watch_history_merged.json"
+        history = json.loads(ws.history_file.read_text())
+        assert [(item.get("movie") or item["show"])["title"] for item in history] == ["Arrival", "Dark"]
+        candidates = json.loads(ws.candidates_file.read_text())
+        assert candidates == [{"movie": {**arrival, "ids": {"simkl": 9, "imdb": "tt2543164", "trakt": 1}}}]
+
+    def test_merged_history_is_newest_first(self):
+        """Both histories interleave by watched_at; repeat watches stay, synced duplicates go."""
+        from core.crosswalk import Crosswalk
+        from core.fetch_merged import merge_history
+
+        arrival = {"title": "Arrival", "ids": {"trakt": 1, "imdb": "tt2543164"}}
+        trakt_history = [
+            {"id": 2, "movie": arrival, "watched_at": "2024-03-01T20:00:00.000Z"},
+            {"id": 1, "movie": arrival, "watched_at": "2024-01-01T20:00:00.000Z"},
+        ]
+        simkl_history = [
+            {"movie": {"title": "Arrival", "ids": {"simkl": 9, "imdb": "tt2543164"}}, "watched_at": "2024-03-01T20:00:00Z"},
+            {"show": {"title": "Dark", "ids": {"simkl": 3}}, "watched_at": "2024-02-01T20:00:00Z"},
+            {"show": {"title": "Dark", "ids": {"simkl": 3}}, "watched_at": "2023-12-01T20:00:00Z"},
+            {"show": {"title": "Lost", "ids": {"simkl": 4}}},
+        ]
+        crosswalk = Crosswalk()
+        crosswalk.observe(trakt_history + simkl_history)
+        merged = merge_history(trakt_history, simkl_history, crosswalk)
+        assert [((item.get("movie") or item["show"])["title"], item.get("watched_at", "")[:7]) for item in merged] == [
+            ("Arrival", "2024-03"), ("Dark", "2024-02"), ("Arrival", "2024-01"), ("Dark", "2023-12"), ("Lost", ""),
+        ]
+
+    def test_mark_on_both_providers(self):
+        """Titles are resolved once; a provider's rate limit is retried without re-sending to the other."""
+        from core import mark_sync, mark_watched, mark_watched_simkl
+
+        found = {"Dune": {"type": "movie", "title": "Dune", "year": 2021, "ids": {"trakt": 2, "imdb": "tt1160419"}},
+                 "Dark": {"type": "show", "title": "Dark", "year": 2017, "ids": {"trakt": 4, "slug": "dark"}}}
+
+        def post(url, headers, json):
+            calls.append((url.split("/")[2], json))
+            if calls.count(calls[-1]) == 1 and "simkl" in url:  # first Simkl attempt is rate limited
+                return MagicMock(status_code=429, headers={"Retry-After": "1"})
+            not_found = {"movies": [{"ids": {"imdb": "tt1160419"}}]} if "simkl" in url else {}
+            return MagicMock(status_code=200, json=MagicMock(return_value={"not_found": not_found}))
+
+        calls = []
+        with patch.object(mark_watched, "search_item", side_effect=lambda title, **kw: found.get(title)) as search, \
+             patch.object(mark_watched_simkl, "search_item", return_value=None), \
+             patch.object(mark_sync, "get_headers", return_value={}), \
+             patch.object(mark_sync, "TRAKT_BASE_URL", "http://trakt"), \
+             patch.object(mark_sync, "SIMKL_BASE_URL", "http://simkl"), \
+             patch.object(mark_sync.requests, "post", side_effect=post), \
+             patch.object(mark_sync.time, "sleep"):
+            (trakt, simkl), missing = mark_sync.mark_titles(["Dune", "Dark", "Nope"])
+
+        assert search.call_count == 3 and missing == ["Nope"]
+        assert [c[0] for c in calls].count("trakt") == 1
+        assert ("simkl", {"movies": [{"ids": {"imdb": "tt1160419"}}], "shows": []}) in calls
+        assert (trakt.ok, len(trakt.marked), trakt.attempts) == (True, 2, 1)
+        assert (simkl.ok, simkl.attempts) == (True, 2)
+        # Simkl gets no Trakt-only ids and reports Dune unknown; Dark has no id Simkl accepts
+        assert [item["title"] for item in simkl.not_found] == ["Dark", "Dune"] and simkl.marked == []
+
+    def test_mark_retries_only_what_the_server_cannot_have_recorded(self):
+        """Connect failures and 429 are retried; a timeout or 5xx is not, since a retry could add a second play."""
+        import requests
+        from urllib3.exceptions import MaxRetryError, NewConnectionError
+        from core import mark_sync
+
+        refused = requests.exceptions.ConnectionError(
+            MaxRetryError(None, "/sync/history", NewConnectionError(None, "refused")))
+        ok = MagicMock(status_code=200, json=MagicMock(return_value={}))
+        cases = [
+            ([refused, ok], 2, True),
+            ([requests.exceptions.ConnectTimeout(), ok], 2, True),
+            ([requests.exceptions.ReadTimeout(), ok], 1, False),
+            ([requests.exceptions.ConnectionError("Connection aborted"), ok], 1, False),
+            ([MagicMock(status_code=503, headers={}, raise_for_status=MagicMock(
+                side_effect=requests.exceptions.HTTPError("503"))), ok], 1, False),
+        ]
+        for responses, posts, succeeds in cases:
+            with patch.object(mark_sync, "get_headers", return_value={}), \
+                 patch.object(mark_sync.requests, "post", side_effect=responses) as post, \
+                 patch.object(mark_sync.time, "sleep"):
+                if succeeds:
+                    assert mark_sync.post_history("trakt", {"movies": []}) == ({}, 2)
+                else:
+                    with pytest.raises(mark_sync.SyncError):
+                        mark_sync.post_history("trakt", {"movies": []})
+            assert post.call_count == posts
+
+
+class TestSerialization:
+    """Test the JSON backend and load-time validation of provider items."""
+
+    @pytest.mark.parametrize("fast", [True, False])
+    def test_round_trip_is_compact(self, tmp_path, fast):
+        """Both backends write compact UTF-8 and read each other's output; non-string keys become strings."""
+        from core import serialization
+
+        data = {"title": "Amélie", "era_weights": {1990: 0.5}, "ids": [1, 2]}
+        path = tmp_path / "data.json"
+        with patch.object(serialization, "orjson", serialization._orjson() if fast else None):
+            serialization.write_json(path, data)
+            assert serialization.read_json(path) == {**data, "era_weights": {"1990": 0.5}}
+        assert path.read_text(encoding="utf-8") == json.dumps(
+            {**data, "era_weights": {"1990": 0.5}}, ensure_ascii=False, separators=(",", ":"))
+
+    def test_backend_is_imported_on_first_use(self):
+        """Importing the module doesn't import orjson; the first dumps/loads does (startup budget)."""
+        import subprocess
+
+        code = ("import sys, core.serialization as s; assert 'orjson' not in sys.modules; "
+                "s.loads(b'[]'); print(s.backend())")
+        result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parent.parent,
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() in ("orjson", "json")
+
+    def test_malformed_items_are_rejected_at_load(self, tmp_path):
+        """Bad records are dropped when the file is read, so filtering never sees them."""
+        from core.recommend import filter_candidates, load_json
+        from core.serialization import SchemaError, read_items
+
+        path = tmp_path / "candidates.json"
+        path.write_text(json.dumps([
+            {"movie": {"title": "Dune", "year": 2021, "ids": {"trakt": 2}, "genres": ["sci-fi"]}},
+            {"movie": {"title": 42, "ids": {"trakt": 3}}},
+            {"show": {"title": "Dark", "ids": {"trakt": 4}, "genres": [None]}},
+            {"show": {"title": "Lost", "ids": [4]}},
+            "not an item",
+        ]))
+        assert filter_candidates(load_json(path), set()) == ["Dune (2021)"]
+        with pytest.raises(SchemaError, match="item 1: title is not a string"):
+            read_items(path, strict=True)
+
+
+class TestSnapshot:
+    """Test the memory-mapped catalog snapshot."""
+
+    def _workspace(self, tmp_path):
+        from core.workspace import Workspace
+
+        ws = Workspace.for_user("snap", tmp_path)
+        ws.ensure_dirs()
+        ws.history_file.write_text(json.dumps([
+            {"movie": {"title": "Arrival", "ids": {"trakt": 1, "imdb": "tt2543164"}}},
+        ]))
+        ws.candidates_file.write_text(json.dumps([
+            {"movie": {"title": "Arrival", "year": 2016, "ids": {"simkl": 9, "imdb": "tt2543164"}}},
+            {"movie": {"title": "Amélie", "year": 2001, "ids": {"trakt": 5}, "genres": ["Comedy", "romance"]}},
+            {"movie": {"title": "Dune", "year": 2021, "ids": {"trakt": 2, "imdb": "tt1160419"}, "genres": ["sci-fi"]}},
+            {"movie": {"title": "Dune", "year": 2021, "ids": {"simkl": 8, "imdb": "tt1160419"}}},
+            {"show": {"title": "Dark", "year": 2017, "ids": {"tvdb": 334824}, "genres": ["drama"]}},
+            {"show": {"title": "No Ids", "genres": ["drama"]}},
+        ]))
+        return ws
+
+    def test_snapshot_filters_like_json(self, tmp_path):
+        """The first load parses JSON and writes the snapshot; the mapped table filters identically."""
+        from core.candidate_table import MappedCandidateTable
+        from core.recommend import filter_candidates, load_catalog
+        from core.snapshot import snapshot_path
+
+        ws = self._workspace(tmp_path)
+        parsed = load_catalog(ws)
+        assert snapshot_path(ws).exists()
+        mapped = load_catalog(ws)
+        assert isinstance(mapped.table, MappedCandidateTable)
+        assert mapped.watched_ids == set()
+        assert mapped.table.watched == parsed.table.mask_ids(parsed.watched_ids) == 0b1
+        assert (mapped.history_size, mapped.watched_count) == (parsed.history_size, parsed.watched_count) == (1, 1)
+
+        for args in ([], [["comedy"]], [[], ["dark"]], [[], [], 2010], [["drama"], [], 0, {"genre_weights": {"sci-fi": 1}}]):
+            expected = filter_candidates(parsed.table, parsed.watched_ids, *args)
+            assert filter_candidates(mapped.table, mapped.watched_ids, *args) == expected
+        assert filter_candidates(mapped.table, set()) == ["Amélie (2001)", "Dune (2021)", "Dark (2017)"]
+        # Ids and titles are found by binary search over the mapped hash indexes
+        for key in ("show:tvdb:334824", "movie:trakt:5", "movie:simkl:8", *parsed.watched_ids, "5", "movie:trakt:404"):
+            assert mapped.table.mask_ids([key]) == parsed.table.mask_ids([key])
+        assert mapped.table.mask_ids(["show:tvdb:334824", "movie:trakt:5"]) == 0b10010
+        assert mapped.table.mask_titles([" Dune", "amélie"]) == 0b1110
+        assert (mapped.table.ids[5], mapped.table.ids[1], mapped.table.labels[-1]) == (None, "5", "No Ids")
+
+    def test_stale_snapshot_is_ignored(self, tmp_path):
+        """Changing a data file invalidates the snapshot; the next load parses JSON and rewrites it."""
+        from core.recommend import filter_candidates, load_catalog
+        from core.snapshot import load_snapshot
+
+        ws = self._workspace(tmp_path)
+        load_catalog(ws)
+        ws.history_file.write_text(json.dumps([{"movie": {"title": "Amélie", "ids": {"trakt": 5}}}]))
+        assert load_snapshot(ws) is None
+        catalog = load_catalog(ws)
+        assert filter_candidates(catalog.table, catalog.watched_ids) == ["Arrival (2016)", "Dune (2021)", "Dark (2017)"]
+        mapped = load_catalog(ws)
+        assert mapped.table.watched == 0b10
+        assert filter_candidates(mapped.table, mapped.watched_ids) == ["Arrival (2016)", "Dune (2021)", "Dark (2017)"]
+
+    def test_cold_load_builds_the_table_once(self, tmp_path):
+        """The JSON path hands its table and watched set to the snapshot writer instead of rebuilding them."""
+        from core import recommend
+        from core.candidate_table import CandidateTable
+        from core.snapshot import load_snapshot
+
+        ws = self._workspace(tmp_path)
+        with patch.object(CandidateTable, "from_items", wraps=CandidateTable.from_items) as from_items, \
+             patch.object(recommend, "build_watched_ids", wraps=recommend.build_watched_ids) as watched:
+            recommend.load_catalog(ws)
+        assert from_items.call_count == watched.call_count == 1
+        snapshot = load_snapshot(ws)
+        assert snapshot is not None and snapshot.rows == 6
+        snapshot.close()
+
+    def test_fetch_writes_snapshot_once(self, tmp_path):
+        """A fetch snapshots the catalog once, after both files are saved, so it is current."""
+        from core import fetch_data, snapshot
+        from core.workspace import Workspace
+
+        ws = Workspace.for_user("once", tmp_path)
+        history = [{"movie": {"title": "Arrival", "ids": {"trakt": 1}}}]
+        candidates = [{"movie": {"title": "Dune", "year": 2021, "ids": {"trakt": 2}}}]
+        with patch.object(fetch_data, "fetch_history", return_value=history), \
+             patch.object(fetch_data, "fetch_candidates", return_value=candidates), \
+             patch.object(fetch_data, "write_snapshot", wraps=snapshot.write_snapshot) as write:
+            fetch_data.main(ws)
+        write.assert_called_once_with(ws)
+        loaded = snapshot.load_snapshot(ws)
+        assert loaded is not None and loaded.rows == 1
+        loaded.close()
+
+
+class TestLLMGateway:
+    """Test retry and slot handling in the shared LLM gateway."""
+    
+    def _response(self, text):
+        message = MagicMock()
+        message.content = text
+        response = MagicMock()
+        response.choices = [MagicMock(message=message)]
+        return response
+    
+    def test_complete_retries_connection_errors(self):
+        """Transient connection errors are retried within the deadline."""
+        import openai
+        from core.llm_gateway import LLMGateway
+        
+        gateway = LLMGateway(max_retries=2, backoff=0.0, timeout=5)
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            openai.APIConnectionError(request=MagicMock()),
+            self._response("1. **Dune (2021)**")
+        ]
+        gateway._client = client
+        
+        assert gateway.complete("prompt") == "1. **Dune (2021)**"
+        assert client.chat.completions.create.call_count == 2
+    
+    def test_tracing_does_not_change_the_request(self):
+        """Traced completions send the same request; only stream=True streams and records TTFT."""
+        from bench.mock_llm import MockLLMConfig, start
+        from core import tracing
+        from core.llm_gateway import LLMGateway
+
+        gateway = LLMGateway(max_retries=0)
+        gateway._client = MagicMock()
+        gateway._client.chat.completions.create.return_value = self._response("ok")
+        tracing.enable()
+        try:
+            assert gateway.complete("prompt") == "ok"
+        finally:
+            tracing.disable()
+        kwargs = gateway._client.chat.completions.create.call_args.kwargs
+        assert "stream" not in kwargs and "stream_options" not in kwargs
+
+        server, _, url = start(MockLLMConfig(responses=({"prompt": "ping", "response": "pong"},)))
+        gateway = LLMGateway(base_url=url, max_retries=0)
+        tracing.enable()
+        try:
+            assert gateway.complete("ping", stream=True) == "pong"
+        finally:
+            tracing.disable()
+            gateway.close()
+            server.shutdown()
+            server.server_close()
+        (span,) = [s for s in tracing.spans() if s.name == "llm complete"]
+        assert span.attrs["ttft_ms"] >= 0 and span.attrs["completion_tokens"] >= 1
+
+    def test_chat_times_out_waiting_for_slot(self):
+        """Calls fail fast when every parallel slot stays busy past the deadline."""
+        from core.llm_gateway import LLMGateway
+        
+        gateway = LLMGateway(parallel_slots=1)
+        gateway._client = MagicMock()
+        gateway._slots.acquire()
+        
+        with pytest.raises(TimeoutError):
+            gateway.chat([{"role": "user", "content": "hi"}], timeout=0.05)
+        gateway._client.chat.completions.create.assert_not_called()
+
+    def test_attempts_get_only_the_time_left(self):
+        """Each attempt's timeout stays within the deadline, and none starts once it has passed."""
+        import time
+        from core.llm_gateway import LLMGateway
+
+        gateway = LLMGateway(parallel_slots=1)
+        gateway._client = MagicMock()
+        gateway.chat([{"role": "user", "content": "hi"}], timeout=0.2)
+        assert 0 < gateway._client.chat.completions.create.call_args.kwargs["timeout"] <= 0.2
+
+        class SlowSlots:
+            def acquire(self, timeout=None):
+                time.sleep(0.06)
+                return True
+
+            def release(self):
+                pass
+
+        gateway._slots = SlowSlots()
+        gateway._client.reset_mock()
+        with pytest.raises(TimeoutError):
+            gateway.chat([{"role": "user", "content": "hi"}], timeout=0.05)
+        gateway._client.chat.completions.create.assert_not_called()
+
+    def test_keep_alive_restarts_after_close(self):
+        """close() stops the keep-alive loop, and a later start_keep_alive runs a new one."""
+        import threading
+        from core.llm_gateway import LLMGateway
+
+        gateway = LLMGateway()
+        pinged = threading.Event()
+        with patch.object(gateway, "ping", side_effect=lambda: pinged.set() or True):
+            gateway.start_keep_alive(0.01)
+            first = gateway._keep_alive
+            assert pinged.wait(2)
+            gateway.close()
+            first.join(2)
+            assert not first.is_alive()
+
+            pinged.clear()
+            gateway.start_keep_alive(0.01)
+            assert gateway._keep_alive is not first and pinged.wait(2)
+            gateway.close()
+
+
+class TestWorkspaces:
+    """Test per-user workspaces and batch isolation."""
+    
+    def test_load_users_builds_isolated_layouts(self, tmp_path):
+        """Each user gets their own data/output paths under their root."""
+        from core.workspace import load_users
+        
+        users_file = tmp_path / "users.json"
+        users_file.write_text(json.dumps({"users": [
+            {"name": "alice", "root": str(tmp_path / "alice")},
+            {"name": "bob", "root": str(tmp_path / "bob"), "provider": "simkl"}
+        ]}))
+        
+        alice, bob = load_users(users_file)
+        assert alice.history_file == tmp_path / "alice" / "data" / "watch_history.json"
+        assert bob.history_file == tmp_path / "bob" / "data" / "watch_history_simkl.json"
+        assert alice.profile_file != bob.profile_file
+    
+    def test_load_users_rejects_duplicates(self, tmp_path):
+        """Duplicate user names would share files, so they are rejected."""
+        from core.workspace import load_users
+        
+        users_file = tmp_path / "users.json"
+        users_file.write_text(json.dumps([{"name": "alice"}, {"name": "alice"}]))
+        
+        with pytest.raises(ValueError):
+            load_users(users_file)
+    
+    def test_run_batch_isolates_failures(self, tmp_path):
+        """One user's failure does not stop the others."""
+        from core import batch
+        from core.workspace import Workspace
+        
+        workspaces = [Workspace.for_user(n, tmp_path / n) for n in ("ok", "broken")]
+        
+        def fake_stage(stage, workspace):
+            if workspace.name == "broken" and stage == "profile":
+                raise RuntimeError("LLM down")
+        
+        with patch("core.batch.run_stage", side_effect=fake_stage):
+            results = batch.run_batch(workspaces, max_workers=2)
+        
+        assert [r.name for r in results] == ["ok", "broken"]
+        assert results[0].ok and set(results[0].durations) == set(batch.STAGES)
+        assert not results[1].ok and results[1].failed_stage == "profile"
+
+
+class TestService:
+    """Test the in-memory state behind 'cli.py serve'."""
+    
+    def _workspace(self, tmp_path):
+        from core.workspace import Workspace
+        
+        ws = Workspace.for_user("svc", tmp_path)
+        ws.ensure_dirs()
+        ws.history_file.write_text(json.dumps([
+            {"movie": {"title": "Seen", "year": 2020, "ids": {"trakt": 1}}}
+        ]))
+        ws.candidates_file.write_text(json.dumps([
+            {"movie": {"title": "Seen", "year": 2020, "ids": {"trakt": 1}, "genres": []}},
+            {"movie": {"title": "Fresh", "year": 2024, "ids": {"trakt": 2}, "genres": []}},
+            {"show": {"title": "Other", "year": 2023, "ids": {"trakt": 3}, "genres": []}}
+        ]))
+        ws.profile_file.write_text(json.dumps({"preferred_genres": ["drama"]}))
+        return ws
+    
+    def test_recommend_is_cached_per_state(self, tmp_path):
+        """Repeated identical requests reuse the LLM result until state changes."""
+        from core.service import RecommendationService
+        
+        service = RecommendationService(self._workspace(tmp_path))
+        service.load()
+        assert service.state.valid_candidates == ["Fresh (2024)", "Other (2023)"]
+        
+        with patch("core.recommend.generate_recommendations", return_value="1. **Fresh (2024)**") as gen:
+            first = service.recommend([])
+            second = service.recommend([])
+        assert first == second
+        assert gen.call_count == 1
+    
+    def test_mark_updates_watched_set_immediately(self, tmp_path):
+        """Marked titles leave the candidate list before the background refresh."""
+        from core.service import RecommendationService
+        
+        service = RecommendationService(self._workspace(tmp_path))
+        service.load()
+        
+        with patch("core.mark_watched.process_titles", return_value=["show:trakt:3"]), \
+             patch.object(service, "refresh_async") as refresh:
+            result = service.mark(["Other"])
+        
+        assert result["marked"] == ["show:trakt:3"]
+        assert service.state.valid_candidates == ["Fresh (2024)"]
+        refresh.assert_called_once_with(fetch=True)
+
+    def test_refresh_requested_during_refresh_is_not_lost(self, tmp_path):
+        """A fetch asked for while a refresh runs is run right after it, once."""
+        import threading
+        from core import service as service_module
+        from core.service import RecommendationService
+
+        service = RecommendationService(self._workspace(tmp_path))
+        service.load()
+        loading, release = threading.Event(), threading.Event()
+        real_load_state = service_module.load_state
+
+        def slow_load_state(*args):
+            loading.set()
+            release.wait(2)
+            return real_load_state(*args)
+
+        with patch.object(service_module, "load_state", side_effect=slow_load_state) as load_state, \
+             patch("core.batch.run_stage") as run_stage:
+            worker = threading.Thread(target=service.refresh)
+            worker.start()
+            assert loading.wait(2)
+            service.refresh(fetch=True)
+            service.refresh(fetch=False)
+            release.set()
+            worker.join(2)
+        assert load_state.call_count == 2
+        run_stage.assert_called_once_with("fetch", service.workspace)
+        assert not service._refresh_lock.locked() and service._pending is None
+
+    def test_marks_survive_concurrent_marks_and_refreshes(self, tmp_path):
+        """Marks made at the same time both stick, and a refresh that didn't fetch them re-applies them."""
+        import threading
+        from core.service import RecommendationService
+
+        service = RecommendationService(self._workspace(tmp_path))
+        service.load()
+        both_marking = threading.Barrier(2, timeout=5)
+
+        def process_titles(titles, workspace):
+            both_marking.wait()
+            return {"Fresh": ["movie:trakt:2"], "Other": ["show:trakt:3"]}[titles[0]]
+
+        with patch("core.mark_watched.process_titles", side_effect=process_titles), \
+             patch.object(service, "refresh_async"):
+            workers = [threading.Thread(target=service.mark, args=([title],)) for title in ("Fresh", "Other")]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join(5)
+        assert service.state.valid_candidates == []
+
+        service.refresh()  # reloads files the marks aren't in yet
+        assert service.state.valid_candidates == []
+        with patch("core.batch.run_stage"):
+            service.refresh(fetch=True)  # a fetch after the marks owns them from now on
+        assert service._marked == frozenset()
+        assert service.state.valid_candidates == ["Fresh (2024)", "Other (2023)"]
+
+    def test_recommend_cache_is_bounded(self, tmp_path):
+        """Distinct seed lists evict the least recently used response past SERVICE_CACHE_SIZE."""
+        from core import service as service_module
+        from core.service import RecommendationService
+
+        service = RecommendationService(self._workspace(tmp_path))
+        service.load()
+        with patch.object(service_module, "SERVICE_CACHE_SIZE", 2), \
+             patch("core.recommend.generate_recommendations", return_value="1. **Fresh (2024)**") as gen:
+            for seeds in (["a"], ["b"], ["a"], ["c"], ["a"]):
+                service.recommend(seeds)
+        assert gen.call_count == 3
+        assert list(service._cache) == [(service.state.version, ("c",)), (service.state.version, ("a",))]
+
+
+class TestPipelineCache:
+    """Test content-addressed stage skipping in 'cli.py run'."""
+    
+    def _run(self, ws, calls):
+        from core import pipeline
+        
+        def fake_stage(stage, workspace):
+            calls.append(stage)
+            if stage == "profile":
+                workspace.profile_file.write_text(json.dumps({"themes": ["x"]}))
+        
+        def fake_recommend(workspace, seeds):
+            calls.append("recommend")
+            workspace.recommendations_file.write_text("1. **Dune (2021)**")
+        
+        with patch("core.batch.run_stage", side_effect=fake_stage), \
+             patch("core.pipeline._recommend", side_effect=fake_recommend):
+            return pipeline.run_pipeline(ws, fetch=False)
+    
+    def test_unchanged_inputs_skip_llm_stages(self, tmp_path):
+        """A second run with identical files skips profile and recommend."""
+        from core.workspace import Workspace
+        
+        ws = Workspace.for_user("p", tmp_path)
+        ws.ensure_dirs()
+        ws.history_file.write_text("[]")
+        ws.candidates_file.write_text("[]")
+        
+        calls = []
+        self._run(ws, calls)
+        assert calls == ["profile", "recommend"]
+        
+        calls.clear()
+        results = self._run(ws, calls)
+        assert calls == []
+        assert [r.status for r in results] == ["skipped"] * 4
+    
+    def test_candidate_change_only_reruns_recommend(self, tmp_path):
+        """New candidates invalidate recommend but not the profile."""
+        from core.workspace import Workspace
+        
+        ws = Workspace.for_user("p", tmp_path)
+        ws.ensure_dirs()
+        ws.history_file.write_text("[]")
+        ws.candidates_file.write_text("[]")
+        
+        calls = []
+        self._run(ws, calls)
+        ws.candidates_file.write_text('[{"movie": {"title": "New"}}]')
+        
+        calls.clear()
+        self._run(ws, calls)
+        assert calls == ["recommend"]
+
+
+class TestScheduler:
+    """Test the stage dependency graph executor."""
+    
+    def test_independent_tasks_overlap(self):
+        """Tasks without dependencies run concurrently; dependents wait."""
+        import time
+        from core.scheduler import Task, run_graph, critical_path
+        
+        tasks = [
+            Task("a", lambda: time.sleep(0.2)),
+            Task("b", lambda: time.sleep(0.2)),
+            Task("c", lambda: time.sleep(0.05), ("a",)),
+        ]
+        runs = run_graph(tasks, max_workers=3)
+        assert all(r.status == "done" for r in runs.values())
+        assert runs["c"].started >= runs["a"].finished
+        assert max(r.finished for r in runs.values()) < 0.4
+        
+        path, _ = critical_path(tasks, runs)
+        assert path == ["a", "c"]
+    
+    def test_failure_blocks_only_dependents(self):
+        """A failed task blocks downstream tasks but not unrelated branches."""
+        from core.scheduler import Task, run_graph
+        
+        def boom():
+            raise RuntimeError("fetch failed")
+        
+        runs = run_graph([
+            Task("history", lambda: "ok"),
+            Task("candidates", boom),
+            Task("profile", lambda: "ok", ("history",)),
+            Task("recommend", lambda: "ok", ("candidates", "profile")),
+        ])
+        assert runs["profile"].status == "done"
+        assert runs["candidates"].status == "failed"
+        assert runs["recommend"].status == "blocked"
+    
+    def test_cycle_rejected(self):
+        """Cycles and unknown dependencies are reported up front."""
+        from core.scheduler import Task, run_graph
+        
+        with pytest.raises(ValueError):
+            run_graph([Task("a", lambda: None, ("b",)), Task("b", lambda: None, ("a",))])
+        with pytest.raises(ValueError):
+            run_graph([Task("a", lambda: None, ("missing",))])
+
+
+class TestBenchmarks:
+    """Test the offline benchmark suite."""
+    
+    def test_synthetic_data_is_deterministic(self):
+        """The same seed gives the same history; history ids overlap the catalog."""
+        from bench.synthetic import make_catalog, make_history
+        from core.recommend import build_watched_ids
+        
+        assert make_history(300, seed=1) == make_history(300, seed=1)
+        catalog = make_catalog(300)
+        history = make_history(300, catalog_size=300)
+        assert len(history) == 300
+        catalog_ids = {f"{k}:trakt:{item[k]['ids']['trakt']}" for item in catalog for k in ("movie", "show") if k in item}
+        assert build_watched_ids(history) & catalog_ids
+    
+    def test_suite_runs_and_flags_regressions(self):
+        """Micro-benchmarks and the stand-in pipeline run; slower results are regressions."""
+        from bench import suite
+        
+        results = suite.run_suite([200], only=["filter_candidates", "pipeline"], repeat=1)
+        assert [r.key for r in results] == ["filter_candidates[200]", "pipeline[200]"]
+        
+        report = suite.to_json(results)
+        slower = json.loads(json.dumps(report))
+        for entry in slower["results"].values():
+            entry["seconds"] *= 2
+        assert suite.compare(report, report) == []
+        assert suite.compare(slower, report, threshold=0.25) == ["filter_candidates[200]", "pipeline[200]"]
+
+
+class TestFakeProvider:
+    """Test the local Trakt/Simkl stand-in server."""
+    
+    @pytest.fixture
+    def provider(self):
+        from bench.fake_provider import FakeProviderConfig, start
+        
+        server, provider, url = start(FakeProviderConfig(history_size=250, catalog_size=40))
+        yield provider, url
+        server.shutdown()
+        server.server_close()
+    
+    def _workspace(self, tmp_path):
+        from core.workspace import Workspace
+        
+        # A per-user secrets.json must exist before for_user, or it falls back to the global one
+        (tmp_path / "secrets.json").write_text(json.dumps({"client_id": "c"}))
+        ws = Workspace.for_user("fake", tmp_path)
+        ws.ensure_dirs()
+        ws.token_file.write_text(json.dumps({"access_token": "t"}))
+        return ws
+    
+    def test_fetch_pages_history_and_merges_candidates(self, provider, tmp_path):
+        """fetch_data pages through history and keeps bare /popular titles."""
+        from core import fetch_data
+        
+        fake, url = provider
+        ws = self._workspace(tmp_path)
+        with patch("core.fetch_data.TRAKT_BASE_URL", url + "/trakt"), \
+             patch("core.fetch_data.TRAKT_API_DELAY", 0):
+            history = fetch_data.fetch_history(limit=250, workspace=ws)
+            candidates = fetch_data.fetch_candidates(ws)
+        
+        assert history == fake.history
+        assert fake.stats()["requests"]["GET trakt history"] == 3
+        assert len(candidates) == 40
+    
+    def test_injects_rate_limits_and_records_watches(self, provider):
+        """Exhausting the bucket gives 429 + Retry-After; POSTs show up in history."""
+        import requests
+        from bench.fake_provider import FakeProvider, FakeProviderConfig
+        
+        limited = FakeProvider(FakeProviderConfig(history_size=10, catalog_size=10, rate_limit=1, burst=2))
+        statuses = [limited.handle("GET", "/trakt/sync/last_activities", {}, None)[0] for _ in range(3)]
+        assert statuses == [200, 200, 429]
+        assert limited.handle("GET", "/trakt/sync/last_activities", {}, None)[2]["Retry-After"] == "1"
+        
+        fake, url = provider
+        movie_id = next(k[1] for k in fake.media if k[0] == "movie")
+        resp = requests.post(url + "/simkl/sync/history", json={"movies": [{"ids": {"simkl": movie_id}}]})
+        assert resp.status_code == 201 and resp.json()["added"]["movies"] == 1
+        page = requests.get(url + "/trakt/sync/history?limit=5")
+        assert page.headers["X-Pagination-Item-Count"] == "251"
+        assert page.json()[0]["movie"]["ids"]["trakt"] == movie_id
+
+
+class TestMockLLM:
+    """Test the OpenAI-compatible mock LLM server."""
+    
+    def test_gateway_round_trip_with_replay_and_templates(self):
+        """Replayed prompts, the recommendation template, streaming and embeddings all work."""
+        from bench.mock_llm import MockLLMConfig, start
+        from core.llm_gateway import LLMGateway
+        
+        config = MockLLMConfig(responses=({"prompt": "ping", "response": "pong from {model}"},))
+        server, mock, url = start(config)
+        gateway = LLMGateway(base_url=url, max_retries=0)
+        try:
+            assert gateway.complete("ping") == f"pong from {config.model}"
+            prompt = "Select 2 items from the CANDIDATE LIST below.\n\nCANDIDATE LIST (3 items):\n- A (2020)\n- B (2021)\n- C (2022)\n\nGo"
+            reply = gateway.complete(prompt)
+            assert reply.splitlines()[1].startswith("2. **B (2021)**")
+            chunks = list(gateway.chat([{"role": "user", "content": prompt}], stream=True))
+            assert "".join(c.choices[0].delta.content or "" for c in chunks) == reply
+            vectors = gateway.embed(["x", "y"])
+            assert len(vectors) == 2 and vectors[0] != vectors[1] and vectors[0] == gateway.embed(["x"])[0]
+        finally:
+            gateway.close()
+            server.shutdown()
+            server.server_close()
+        assert mock.stats()["chat_requests"] == 3
+    
+    def test_slots_queue_requests_and_prefix_cache_skips_prompt_work(self):
+        """No more than parallel_slots requests decode at once; repeated prefixes count as cached."""
+        from concurrent.futures import ThreadPoolExecutor
+        from bench.mock_llm import MockLLM, MockLLMConfig
+        
+        mock = MockLLM(MockLLMConfig(gen_tps=500, parallel_slots=2))
+        messages = [{"role": "user", "content": "Summarize this part of a viewer's history"}]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            outputs = list(pool.map(lambda _: list(mock.generate(messages, None)), range(6)))
+        
+        stats = mock.stats()
+        assert stats["peak_active"] == 2 and stats["chat_requests"] == 6
+        assert stats["cached_tokens"] == 5 * outputs[0][-1][1]["usage"]["prompt_tokens"]
+        truncated = list(mock.generate(messages, 3))
+        assert len(truncated) == 3 and truncated[-1][1]["finish_reason"] == "length"
+
+
+class TestTracing:
+    """Test span recording, HTTP instrumentation and trace export."""
+    
+    def test_spans_export_chrome_trace_and_summary(self):
+        """Nested spans, annotate() and failures end up in the trace and the summary."""
+        from core import tracing
+        
+        assert tracing.span("off") is tracing.span("also off")  # shared no-op while disabled
+        tracing.enable()
+        try:
+            with tracing.span("stage", "stage"):
+                for _ in range(2):
+                    with tracing.span("llm chat", "llm", prompt_tokens=10):
+                        tracing.annotate(completion_tokens=5)
+                with pytest.raises(ValueError):
+                    with tracing.span("parse", "io"):
+                        raise ValueError("bad json")
+        finally:
+            tracing.disable()
+        
+        trace = tracing.to_chrome_trace()
+        complete = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+        assert [e["name"] for e in complete] == ["stage", "llm chat", "llm chat", "parse"]
+        assert complete[1]["args"] == {"prompt_tokens": 10, "completion_tokens": 5}
+        assert complete[0]["dur"] >= complete[1]["dur"] + complete[2]["dur"]
+        rows = {r["name"]: r for r in tracing.summarize()}
+        assert rows["llm chat"]["count"] == 2 and rows["llm chat"]["completion_tokens"] == 10
+        assert rows["parse"]["errors"] == 1
+        assert tracing.format_summary(list(rows.values()))[0].startswith("Span")
+    
+    def test_http_calls_are_traced_per_endpoint(self):
+        """Every requests call gets an http span with endpoint, status and bytes."""
+        import requests
+        from bench.fake_provider import FakeProviderConfig, start
+        from core import tracing
+        
+        server, _, url = start(FakeProviderConfig(history_size=20, catalog_size=10))
+        tracing.enable()
+        try:
+            requests.get(url + "/trakt/movies/1")
+            requests.get(url + "/trakt/sync/history?limit=5")
+        finally:
+            tracing.disable()
+            server.shutdown()
+            server.server_close()
+        
+        http = [s for s in tracing.spans() if s.category == "http"]
+        assert [s.name for s in http] == ["GET /trakt/movies/:id", "GET /trakt/sync/history"]
+        assert http[1].attrs["status"] == 200 and http[1].attrs["bytes"] > 0
+
+
+class TestMetrics:
+    """Test the Prometheus metrics derived from spans."""
+    
+    def test_spans_feed_prometheus_textfile(self, tmp_path):
+        """HTTP errors, stage durations and filter counts land in the exposition output."""
+        import requests
+        from bench.fake_provider import FakeProviderConfig, start
+        from core import metrics, tracing
+        from core.recommend import filter_candidates
+        
+        registry = metrics.Registry()
+        server, _, url = start(FakeProviderConfig(history_size=10, catalog_size=10, error_429=1.0))
+        tracing.add_listener(registry.observe_span)
+        try:
+            requests.get(url + "/trakt/movies/5")
+            with tracing.span("recommend", "stage", user="alice", status="ran"):
+                filter_candidates([{"movie": {"title": "A", "year": 2020, "ids": {"trakt": 1}, "genres": []}},
+                                   {"movie": {"title": "B", "year": 2021, "ids": {"trakt": 2}, "genres": []}}],
+                                  {"movie:trakt:1"})
+        finally:
+            tracing.remove_listener(registry.observe_span)
+            server.shutdown()
+            server.server_close()
+        registry.record_run("run", True, 1.5)
+        
+        path = tmp_path / "trakt_agent.prom"
+        metrics.write_textfile(path, registry)
+        text = path.read_text()
+        assert 'trakt_agent_http_requests_total{endpoint="/trakt/movies/:id",method="GET",status="429"} 1' in text
+        assert 'trakt_agent_http_errors_total{endpoint="/trakt/movies/:id",kind="rate_limited"} 1' in text
+        assert 'trakt_agent_stage_duration_seconds_count{stage="recommend",user="alice"} 1' in text
+        assert 'trakt_agent_candidates{state="valid"} 1' in text
+        assert 'trakt_agent_run_last_success{command="run"} 1' in text
+        assert "# TYPE trakt_agent_http_request_duration_seconds histogram" in text
+        assert not tracing.is_enabled() and tracing.span("x") is tracing.span("y")
+
+
+class TestProfiler:
+    """Test the --profile-cpu/--profile-mem hooks."""
+    
+    def test_profiles_cover_worker_threads(self, tmp_path):
+        """CPU stats include code run on a thread pool; memory and stack reports are written."""
+        import pstats
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from core.profiler import Profiler
+        
+        def busy_worker(n):
+            deadline = time.perf_counter() + 0.05
+            blocks = []
+            while time.perf_counter() < deadline:
+                blocks.append(bytearray(1024))
+            return len(blocks)
+        
+        with Profiler("test", cpu=True, memory=True, collapsed=True, top=5, out_dir=tmp_path) as profiler:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                kept = list(pool.map(busy_worker, range(2)))
+        
+        suffixes = sorted(p.name.split(".", 1)[1] for p in profiler.outputs)
+        assert suffixes == ["collapsed", "mem.txt", "pstats"] and all(p.exists() for p in profiler.outputs)
+        functions = {name for _, _, name in pstats.Stats(str(profiler.outputs[0])).stats}
+        assert "busy_worker" in functions
+        assert "busy_worker" in profiler.outputs[1].read_text()
+        assert profiler.outputs[2].read_text().startswith("Peak traced memory")
+        assert kept
+
+
+class TestLLMBenchmark:
+    """Test the LLM throughput and concurrency benchmark."""
+
+    def test_measures_real_prompts_and_suggests_slots(self):
+        """Captured prompts run against the mock server; the suggested slots match its parallel slots."""
+        from bench.llm_bench import benchmark_model, build_prompts, suggest
+        from bench.mock_llm import MockLLMConfig, start
+
+        prompts = build_prompts(history_size=600, candidate_limits=(10, 50))
+        assert {"summary", "profile", "recommend[10]", "recommend[50]"} <= set(prompts)
+        assert "CANDIDATE LIST (10 items)" in prompts["recommend[10]"]
+
+        server, mock, url = start(MockLLMConfig(prompt_tps=20000, gen_tps=400, parallel_slots=2))
+        try:
+            results = benchmark_model(url, "bench-model", prompts, (1, 2, 4), 4, ("recommend",))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert all(r.errors == 0 and r.prompt_tokens > 0 and r.decode_tps > 0 for r in results)
+        stats = mock.stats()
+        assert stats["cached_tokens"] < stats["prompt_tokens"] / 50  # unique tags defeat the prefix cache
+        advice = suggest(results, context=4096, latency_budget=60)
+        assert "LLM_PARALLEL_SLOTS = 2" in advice[0]
+        assert "CANDIDATE_LIMIT = 50" in advice[1]
+
+
 class TestProfileStatistics:
     """Test taste profile statistics calculation."""
     
@@ -139,6 +1192,271 @@ class TestProfileStatistics:
         assert stats["movies"] == 2
         assert stats["tv_episodes"] == 1
         assert stats["unique_shows"] == 1
+    
+    def test_calculate_statistics_genres_binges_and_watch_time(self):
+        """Genres count once per title, close episodes form binge runs, runtimes add up."""
+        from core.profile_taste import calculate_statistics
+        
+        show = {"title": "Dark", "year": 2017, "ids": {"trakt": 7}, "genres": ["sci-fi", "drama"]}
+        history = [
+            {"show": show, "episode": {"season": 1, "number": n, "runtime": 60},
+             "watched_at": f"2024-03-01T2{3 - n}:00:00.000Z"}
+            for n in (3, 2, 1)
+        ] + [
+            {"movie": {"title": "Heat", "year": 1995, "ids": {"trakt": 9}, "genres": ["crime"], "runtime": 170},
+             "watched_at": "2024-02-01T20:00:00.000Z"},
+        ]
+        
+        stats = calculate_statistics(history)
+        
+        assert dict(stats["genre_distribution"]) == {"sci-fi": 33.3, "drama": 33.3, "crime": 33.3}
+        assert stats["binge_runs"] == 1
+        assert stats["longest_binge"] == (3, "Dark")
+        assert stats["top_shows"] == [("Dark", 3)]
+        assert stats["watch_hours"] == 5.8
+        assert stats["decade_histogram"] == {1990: 1, 2010: 3}
+
+
+class TestPromptEncoder:
+    """Test history compression and stratified sampling for prompts."""
+    
+    def test_binge_collapses_to_one_line(self):
+        """Episodes of one show become a single line with count and season span."""
+        from core.prompt_encoder import encode_history
+        
+        history = [
+            {"show": {"title": "Dark", "year": 2017, "ids": {"trakt": 7}},
+             "episode": {"season": s, "number": n}, "watched_at": f"2024-03-0{s}T20:00:00.000Z"}
+            for s in (3, 2, 1) for n in range(10)
+        ] + [{"movie": {"title": "Heat", "year": 1995, "ids": {"trakt": 9}}}]
+        
+        lines = encode_history(history)
+        assert lines == ["Show: Dark (2017) - 30 eps, S1-S3, last 2024-03-03", "Movie: Heat (1995)"]
+    
+    def test_stratified_sample_covers_formats_and_decades(self):
+        """Sampling keeps every format/decade stratum instead of the head of the list."""
+        from core.prompt_encoder import collapse_history, stratified_sample
+        
+        history = [{"show": {"title": f"New Show {i}", "year": 2020, "ids": {"trakt": i}}} for i in range(90)]
+        history += [{"movie": {"title": f"Old Movie {i}", "year": 1970, "ids": {"trakt": 1000 + i}}} for i in range(10)]
+        
+        sample = stratified_sample(collapse_history(history), 10)
+        assert len(sample) == 10
+        assert {e["kind"] for e in sample} == {"show", "movie"}
+        assert sample[0]["title"] == "New Show 0"
+
+
+class TestIncrementalProfile:
+    """Test incremental taste profile updates."""
+    
+    def _history(self, n):
+        return [{"id": i, "movie": {"title": f"Movie {i}", "year": 2000, "ids": {"trakt": i}}} for i in range(n)]
+    
+    def test_plan_update_modes(self):
+        """No coverage rebuilds, a small delta merges, a large delta rebuilds."""
+        from core.profile_taste import plan_update, event_key
+        
+        history = self._history(100)
+        assert plan_update(history, {}, True)[0] == "full"
+        
+        coverage = {"events": [event_key(h) for h in history], "base_events": 100, "delta_events": 0}
+        assert plan_update(history, coverage, True) == ("current", [])
+        
+        grown = self._history(105)
+        mode, new_events = plan_update(grown, coverage, True)
+        assert mode == "incremental"
+        assert [e["id"] for e in new_events] == [100, 101, 102, 103, 104]
+        
+        assert plan_update(self._history(200), coverage, True)[0] == "full"
+        assert plan_update(grown, coverage, True, full=True)[0] == "full"
+        assert plan_update(grown, dict(coverage, preferences="a"), True, preferences="a")[0] == "incremental"
+        assert plan_update(grown, dict(coverage, preferences="a"), True, preferences="b")[0] == "full"
+    
+    def test_incremental_update_sends_only_delta(self, tmp_path):
+        """The update prompt lists only new events and the profile keeps its body."""
+        from core import profile_taste
+        from core.workspace import Workspace
+        
+        ws = Workspace.for_user("p", tmp_path)
+        ws.ensure_dirs()
+        ws.history_file.write_text(json.dumps(self._history(100)))
+        profile_taste.save_artifact(ws, profile_taste.build_artifact(
+            "## Taste Summary\nCerebral Sci-Fi Fan\n", profile_taste.calculate_statistics(self._history(100)), {}
+        ))
+        profile_taste.save_coverage(ws, self._history(100), base_events=100, delta_events=0)
+        
+        history = self._history(100) + [{"id": 500, "movie": {"title": "Arrival", "year": 2016, "ids": {"trakt": 500}}}]
+        ws.history_file.write_text(json.dumps(history))
+        
+        gateway = MagicMock()
+        gateway.complete.return_value = "- More slow-burn sci-fi"
+        with patch("core.profile_taste.get_gateway", return_value=gateway):
+            profile_taste.analyze_taste(ws)
+        
+        prompt = gateway.complete.call_args[0][0]
+        assert "Arrival" in prompt
+        assert "Movie 5" not in prompt
+        assert "Cerebral Sci-Fi Fan" in prompt
+        
+        text = ws.profile_markdown_file.read_text()
+        assert "## Taste Summary" in text and "More slow-burn sci-fi" in text
+        assert json.loads(ws.profile_file.read_text())["updates"][0]["added"] == 1
+        assert profile_taste.load_coverage(ws)["delta_events"] == 1
+
+    def test_update_without_updates_key_and_preference_changes(self, tmp_path):
+        """Artifacts without "updates" still merge; editing preferences.json forces a rebuild."""
+        from core import profile_taste
+        from core.workspace import Workspace
+
+        ws = Workspace.for_user("p", tmp_path)
+        ws.ensure_dirs()
+        artifact = profile_taste.build_artifact(
+            "## Taste Summary\nCerebral Sci-Fi Fan\n", profile_taste.calculate_statistics(self._history(100)), {}
+        )
+        del artifact["updates"]  # hand-edited or older artifacts
+        profile_taste.save_artifact(ws, artifact)
+        profile_taste.save_coverage(ws, self._history(100), base_events=100, delta_events=0)
+        history = self._history(101)
+        ws.history_file.write_text(json.dumps(history))
+
+        gateway = MagicMock()
+        gateway.complete.return_value = "- More of the same"
+        with patch("core.profile_taste.get_gateway", return_value=gateway):
+            profile_taste.analyze_taste(ws)
+        assert json.loads(ws.profile_file.read_text())["updates"][0]["added"] == 1
+
+        ws.preferences_file.write_text(json.dumps({"genre_exclusions": ["horror"]}))
+        ws.history_file.write_text(json.dumps(self._history(102)))
+        gateway.complete.return_value = "## Taste Summary\nRebuilt\n"
+        with patch("core.profile_taste.get_gateway", return_value=gateway), \
+             patch("core.summarize.get_gateway", return_value=gateway):
+            profile_taste.analyze_taste(ws)
+        assert "horror" in gateway.complete.call_args[0][0]
+        coverage = profile_taste.load_coverage(ws)
+        assert (coverage["base_events"], coverage["delta_events"]) == (102, 0)
+        assert coverage["preferences"] == profile_taste.preferences_hash(ws)
+
+    def test_incremental_update_reaches_recommend_prompt(self, tmp_path):
+        """recommend sees what an incremental update added to the profile."""
+        from core import profile_taste, recommend
+        from core.workspace import Workspace
+
+        ws = Workspace.for_user("p", tmp_path)
+        ws.ensure_dirs()
+        profile_taste.save_artifact(ws, profile_taste.build_artifact(
+            "## Taste Summary\nCerebral Sci-Fi Fan\n", profile_taste.calculate_statistics(self._history(100)), {}
+        ))
+        profile_taste.save_coverage(ws, self._history(100), base_events=100, delta_events=0)
+        history = self._history(100) + [{"id": 500, "movie": {"title": "Arrival", "year": 2016, "ids": {"trakt": 500}}}]
+        ws.history_file.write_text(json.dumps(history))
+
+        def recommend_prompt():
+            gateway = MagicMock()
+            gateway.complete.return_value = "1. **Dune (2021)**"
+            with patch("core.recommend.get_gateway", return_value=gateway):
+                recommend.generate_recommendations(recommend.load_profile(ws, {}), ["Dune (2021)"], [])
+            return gateway.complete.call_args[0][0]
+
+        before = recommend_prompt()
+        gateway = MagicMock()
+        gateway.complete.return_value = "- Leaning into first-contact stories"
+        with patch("core.profile_taste.get_gateway", return_value=gateway):
+            profile_taste.analyze_taste(ws)
+        after = recommend_prompt()
+        assert "first-contact" not in before and "first-contact" in after
+
+
+
+class TestProfileArtifact:
+    """Test the machine-readable profile artifact."""
+    
+    def test_artifact_round_trip_and_markdown(self, tmp_path):
+        """The artifact carries parsed fields and features; Markdown is rendered beside it."""
+        from core.profile_artifact import build_artifact, load_artifact, save_artifact
+        from core.recommend import load_profile
+        from core.workspace import Workspace
+        
+        ws = Workspace.for_user("p", tmp_path)
+        narrative = "## Themes & Psychology\n- **Moral ambiguity**\n- Systems failing people\n\n## Taste Summary\nDark Puzzle Solver"
+        stats = {"total_items": 4, "genre_distribution": [("Drama", 60.0), ("Crime", 40.0)],
+                 "decade_histogram": {1990: 1, 2010: 3}}
+        save_artifact(ws, build_artifact(narrative, stats, {"genre_exclusions": ["horror"]}))
+        
+        artifact = load_artifact(ws.profile_file)
+        assert artifact["themes"] == ["Moral ambiguity", "Systems failing people"]
+        assert artifact["taste_summary"] == "Dark Puzzle Solver"
+        assert artifact["features"]["genre_weights"] == {"drama": 0.6, "crime": 0.4}
+        assert artifact["features"]["era_weights"] == {"1990": 0.25, "2010": 0.75}
+        assert "Dark Puzzle Solver" in ws.profile_markdown_file.read_text()
+        assert load_profile(ws, {}) == artifact
+    
+    def test_legacy_markdown_profile_is_ignored(self, tmp_path):
+        """A Markdown profile in the .json file falls back to preferences without being overwritten."""
+        from core.recommend import load_profile
+        from core.workspace import Workspace
+        
+        ws = Workspace.for_user("p", tmp_path)
+        ws.ensure_dirs()
+        ws.profile_file.write_text("# Taste Profile\n\n## Core Preferences")
+        
+        profile = load_profile(ws, {"preferred_genres": ["drama"]})
+        assert profile["preferred_genres"] == ["drama"]
+        assert ws.profile_file.read_text().startswith("# Taste Profile")
+    
+    def test_features_rank_candidates(self):
+        """Genre and era weights order the surviving candidates."""
+        from core.recommend import filter_candidates
+        
+        candidates = [
+            {"movie": {"title": "Comedy", "year": 2001, "ids": {"trakt": 1}, "genres": ["comedy"]}},
+            {"movie": {"title": "Drama", "year": 2015, "ids": {"trakt": 2}, "genres": ["drama"]}},
+        ]
+        features = {"genre_weights": {"drama": 0.9, "comedy": 0.1}, "era_weights": {"2010": 0.5}}
+        assert filter_candidates(candidates, set()) == ["Comedy (2001)", "Drama (2015)"]
+        assert filter_candidates(candidates, set(), features=features) == ["Drama (2015)", "Comedy (2001)"]
+
+
+class TestHierarchicalProfile:
+    """Test chunked map-reduce summarization of the full history."""
+    
+    def _history(self, start, stop):
+        return [{"id": i, "movie": {"title": f"Movie {i}", "ids": {"trakt": i}}} for i in reversed(range(start, stop))]
+    
+    def test_chunks_are_stable_when_history_slides(self):
+        """New events and dropped old ones only change the edge chunks."""
+        from core.summarize import chunk_history
+        from core.profile_taste import event_key
+        
+        before = chunk_history(self._history(0, 2000), event_key, size=100)
+        after = chunk_history(self._history(40, 2040), event_key, size=100)
+        as_keys = lambda chunks: {tuple(event_key(e) for e in c) for c in chunks}
+        assert sum(len(c) for c in before) == 2000
+        assert len(as_keys(before) & as_keys(after)) >= len(before) - 2
+    
+    def test_summaries_cached_and_reduced(self, tmp_path):
+        """Unchanged chunks are not re-summarized and partials reduce to the fan-in."""
+        from core import summarize
+        from core.profile_taste import event_key
+        from core.prompt_encoder import encode_history
+        from core.workspace import Workspace
+        
+        ws = Workspace.for_user("p", tmp_path)
+        ws.ensure_dirs()
+        gateway = MagicMock()
+        gateway.complete.side_effect = lambda prompt, **kw: f"- summary {len(prompt)}"
+        history = self._history(0, 600)
+        
+        with patch("core.summarize.get_gateway", return_value=gateway), \
+             patch("core.summarize.PROFILE_CHUNK_SIZE", 20), \
+             patch("core.summarize.PROFILE_REDUCE_FANIN", 4):
+            first = summarize.summarize_history(history, ws, encode_history, event_key)
+            calls = gateway.complete.call_count
+            second = summarize.summarize_history(history, ws, encode_history, event_key)
+        
+        assert 1 <= len(first) <= 4
+        assert calls > len(first)
+        assert second == first
+        assert gateway.complete.call_count == calls
 
 
 if __name__ == "__main__":
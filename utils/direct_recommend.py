@@ -1,7 +1,14 @@
 #!/usr/bin/env -S venv/bin/python
 """Direct recommendation generation bypassing file write issues"""
 import json
-from openai import OpenAI
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.llm_gateway import LLMGateway
+from core.media import load_media
+from core.recommend import build_watched_ids
 
 # Load data
 with open("data/watch_history.json") as f:
@@ -11,35 +18,13 @@ with open("data/candidates.json") as f:
 with open("Trakt Taste Profile.md") as f:
     profile = f.read()
 
-# Get watched IDs
-watched_ids = set()
-for item in history:
-    if "movie" in item:
-        watched_ids.add(item["movie"]["ids"]["trakt"])
-    elif "show" in item:
-        watched_ids.add(item["show"]["ids"]["trakt"])
+# Get watched IDs (typed, so movie and show ids don't collide)
+watched_ids = build_watched_ids(history)
 
 print(f"Watched items: {len(watched_ids)}")
 
 # Filter candidates
-valid = []
-for item in candidates:
-    c_id = None
-    title = "Unknown"
-    year = ""
-    
-    if "movie" in item:
-        c_id = item["movie"]["ids"]["trakt"]
-        title = item["movie"]["title"]
-        year = item["movie"].get("year", "")
-    elif "show" in item:
-        c_id = item["show"]["ids"]["trakt"]
-        title = item["show"]["title"]
-        year = item["show"].get("year", "")
-    
-    if c_id and c_id not in watched_ids:
-        desc = f"{title} ({year})" if year else title
-        valid.append(desc)
+valid = [media.label for media in load_media(candidates) if media.key not in watched_ids]
 
 print(f"Valid candidates: {len(valid)}")
 
@@ -62,21 +47,10 @@ OUTPUT FORMAT (numbered list):
 
 Select 10 diverse, high-quality matches now:"""
 
-import os
-
-API_BASE_URL = "http://127.0.0.1:1234/v1"
-API_KEY = os.getenv("LOCAL_LLM_API_KEY", "not-needed")
-
-client = OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
+gateway = LLMGateway(model="Qwen/Qwen2.5-14B-Instruct-GGUF")
 
 print("Generating recommendations...")
-response = client.chat.completions.create(
-    model="Qwen/Qwen2.5-14B-Instruct-GGUF",
-    messages=[{"role": "user", "content": prompt}],
-    temperature=0.7
-)
-
-result = response.choices[0].message.content
+result = gateway.complete(prompt, temperature=0.7)
 
 # Print to stdout so I can capture it
 print("\n" + "="*70)
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 """Generate recommendations directly"""
 import json
-import os
-from openai import OpenAI
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.llm_gateway import LLMGateway
+from core.media import load_media
+from core.recommend import build_watched_ids
 
 # Configuration
-API_BASE_URL = "http://127.0.0.1:1234/v1"
 MODEL_NAME = "Qwen/Qwen2.5-14B-Instruct-GGUF"
-API_KEY = os.getenv("LOCAL_LLM_API_KEY", "not-needed")
 
 # Load data
 with open("data/watch_history.json") as f:
@@ -16,33 +20,11 @@ with open("data/watch_history.json") as f:
 with open("data/candidates.json") as f:
     candidates = json.load(f)
 
-# Get watched IDs
-watched_ids = set()
-for item in history:
-    if "movie" in item:
-        watched_ids.add(item["movie"]["ids"]["trakt"])
-    elif "show" in item:
-        watched_ids.add(item["show"]["ids"]["trakt"])
+# Get watched IDs (typed, so movie and show ids don't collide)
+watched_ids = build_watched_ids(history)
 
 # Filter candidates
-valid_candidates = []
-for item in candidates:
-    c_id = None
-    title = "Unknown"
-    year = ""
-    
-    if "movie" in item:
-        c_id = item["movie"]["ids"]["trakt"]
-        title = item["movie"]["title"]
-        year = item["movie"].get("year", "")
-    elif "show" in item:
-        c_id = item["show"]["ids"]["trakt"]
-        title = item["show"]["title"]
-        year = item["show"].get("year", "")
-    
-    if c_id and c_id not in watched_ids:
-        desc = f"{title} ({year})" if year else title
-        valid_candidates.append(desc)
+valid_candidates = [media.label for media in load_media(candidates) if media.key not in watched_ids]
 
 print(f"Valid candidates: {len(valid_candidates)}")
 
@@ -70,16 +52,10 @@ OUTPUT FORMAT (numbered list):
 
 Select 10 diverse, high-quality matches now:"""
 
-client = OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
+gateway = LLMGateway(model=MODEL_NAME)
 
 print("Generating recommendations...")
-response = client.chat.completions.create(
-    model=MODEL_NAME,
-    messages=[{"role": "user", "content": prompt}],
-    temperature=0.7
-)
-
-result = response.choices[0].message.content
+result = gateway.complete(prompt, temperature=0.7)
 
 # Write output
 with open("../Trakt Recommendations.md", "w") as f:
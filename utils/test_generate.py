@@ -4,22 +4,23 @@ Quick test to verify end-to-end recommendation generation
 """
 import json
 import sys
-import os
-from openai import OpenAI
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.llm_gateway import LLMGateway
 
 # Configuration
-API_BASE_URL = "http://127.0.0.1:1234/v1"
 MODEL_NAME = "Qwen/Qwen2.5-14B-Instruct-GGUF"
 NUM_RECOMMENDATIONS = 10
-API_KEY = os.getenv("LOCAL_LLM_API_KEY", "not-needed")
 
 print("Testing recommendation generation...")
-print(f"API: {API_BASE_URL}")
 print(f"Model: {MODEL_NAME}")
 print(f"Recommendations to generate: {NUM_RECOMMENDATIONS}")
 
 try:
-    client = OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
+    gateway = LLMGateway(model=MODEL_NAME)
+    print(f"API: {gateway.base_url}")
     
     prompt = f"""You are a recommendation engine. Recommend {NUM_RECOMMENDATIONS} diverse, high-quality sci-fi movies or TV shows.
 
@@ -32,13 +33,7 @@ Generate {NUM_RECOMMENDATIONS} recommendations now:"""
     
     print(f"\nSending prompt to {MODEL_NAME}...")
     
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7
-    )
-    
-    result = response.choices[0].message.content
+    result = gateway.complete(prompt, temperature=0.7)
     
     print("\n" + "="*70)
     print("LLM RESPONSE:")
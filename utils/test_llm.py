@@ -9,8 +9,8 @@ print("DIAGNOSTIC: Starting recommendation generation", file=sys.stderr)
 print("=" * 70, file=sys.stderr)
 
 try:
-    from openai import OpenAI
-    from config import API_BASE_URL, MODEL_NAME, NUM_RECOMMENDATIONS, API_KEY
+    from config import API_BASE_URL, MODEL_NAME, NUM_RECOMMENDATIONS
+    from core.llm_gateway import get_gateway
     
     print(f"API_BASE_URL: {API_BASE_URL}", file=sys.stderr)
     print(f"MODEL_NAME: {MODEL_NAME}", file=sys.stderr)
@@ -18,15 +18,9 @@ try:
     
     # Test LLM connection
     print("\nTesting LLM connection...", file=sys.stderr)
-    client = OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
+    reply = get_gateway().complete("Say 'Hello' in exactly 1 word", temperature=0.7)
     
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": "Say 'Hello' in exactly 1 word"}],
-        temperature=0.7
-    )
-    
-    print(f"LLM Response: {response.choices[0].message.content}", file=sys.stderr)
+    print(f"LLM Response: {reply}", file=sys.stderr)
     print("✅ LLM connection successful!", file=sys.stderr)
     
 except Exception as e: